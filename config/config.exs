@@ -31,5 +31,45 @@ use Mix.Config
 
 config :gym_tcp_api,
   port: 4040,
+  # The min and max number of Python workers, a worker above the min number
+  # stops its interpreter after being idle for worker_idle milliseconds.
   worker: 2,
-  distributed: false
+  max_worker: 8,
+  worker_idle: 60_000,
+  # Requests waiting for a worker, the time in milliseconds they wait at most
+  # and the retry time in milliseconds sent to the rejected clients.
+  queue: 64,
+  checkout_timeout: 5000,
+  retry_after: 1000,
+  distributed: false,
+  # Node selection of new connections in distributed mode, either
+  # :power_of_two, :least_loaded or :random, and the interval in milliseconds
+  # the nodes publish their load.
+  node_selection: :power_of_two,
+  load_interval: 1000,
+  # Idle environments kept per environment id for reuse, the time in seconds
+  # they are kept and the environment ids each worker constructs on startup.
+  env_pool: [size: 2, ttl: 300, prewarm: []],
+  # Seconds after which an unused instance is closed, the maximum number of
+  # instances and the resident memory in MiB of each Python worker above
+  # which the least recently used instances are closed; 0 is unlimited.
+  instances: [ttl: 3600, max: 0, max_rss: 0],
+  # Snapshots kept per instance. The sessions can't be resumed, since a
+  # reconnecting client may be served by another worker or node.
+  snapshots: 16,
+  # Directory of the trajectories recorded on the server and the number of
+  # transitions per shard; the directory defaults to gym/trajectories in the
+  # temporary directory of the node.
+  record_dir: nil,
+  record_shard_size: 10_000,
+  # JSON backend of the Python workers, "stdlib", "orjson" or "auto", which
+  # uses orjson if it is installed; orjson writes no whitespace and NaN or
+  # infinite values as null.
+  json: "stdlib",
+  # Record the duration of the request phases in each Python worker, see the
+  # stats request.
+  stats: false,
+  # Level of the records logged by the Python workers and the sampling rates
+  # of the logged requests per operation, e.g. "step=0.01".
+  log_level: "WARNING",
+  log_sample: ""
@@ -7,17 +7,16 @@
 #ifndef GYM_CLIENT_HPP
 #define GYM_CLIENT_HPP
 
+#include <deque>
 #include <string>
-#include <sstream>
+#include <stdexcept>
+#include <zlib.h>
 
 #include <boost/bind.hpp>
 #include <boost/asio.hpp>
 #include <boost/asio/deadline_timer.hpp>
 #include <boost/lambda/lambda.hpp>
 #include <boost/lambda/bind.hpp>
-#include <boost/iostreams/filtering_stream.hpp>
-#include <boost/iostreams/filter/zlib.hpp>
-#include <boost/iostreams/copy.hpp>
 
 namespace gym {
 
@@ -51,7 +50,9 @@ class Client
   Client() :
       s(io_context),
       deadline(io_context),
-      compressionLevel(0)
+      compressionLevel(0),
+      requestId(0),
+      inflating(false)
   {
     deadline.expires_at(boost::posix_time::pos_infin);
 
@@ -66,6 +67,9 @@ class Client
     // functions to return.
     boost::system::error_code ignored_ec;
     s.close(ignored_ec);
+
+    if (inflating)
+      inflateEnd(&stream);
   }
 
   void connect(const std::string& host, const std::string& port)
@@ -95,12 +99,19 @@ class Client
   }
 
   /**
-   * Receive a message using the currently open socket.
+   * Receive a message using the currently open socket. If compression is
+   * enabled, the message is a length-prefixed frame.
    *
    * @param data The received data.
    */
   void receive(std::string& data)
   {
+    if (compressionLevel > 0)
+    {
+      receiveFrame(data);
+      return;
+    }
+
     // Set a deadline for the asynchronous operation.
     deadline.expires_from_now(boost::posix_time::seconds(10));
 
@@ -108,7 +119,6 @@ class Client
     // operation.
     boost::system::error_code ec = boost::asio::error::would_block;
 
-    boost::asio::streambuf response;
     size_t reply_length;
 
     boost::asio::async_read_until(s, response, "\r\n\r\n",
@@ -126,16 +136,33 @@ class Client
     data = std::string(
         boost::asio::buffers_begin(response.data()),
         boost::asio::buffers_begin(response.data()) + reply_length);
+    response.consume(reply_length);
+  }
 
-    if (compressionLevel > 0)
+  /**
+   * Receive a length-prefixed message using the currently open socket. The
+   * message starts with the size of the following data as little endian
+   * uint32 value.
+   *
+   * @param data The received data.
+   */
+  void receiveFrame(std::string& data)
+  {
+    unsigned char header[4];
+    read(header, sizeof(header));
+
+    const size_t size = (size_t) header[0] | ((size_t) header[1] << 8) |
+        ((size_t) header[2] << 16) | ((size_t) header[3] << 24);
+
+    data.resize(size);
+    if (size > 0)
     {
-      boost::iostreams::filtering_streambuf<boost::iostreams::input> in;
-      in.push( boost::iostreams::zlib_decompressor());
-      in.push(boost::iostreams::array_source(data.data(), data.size()));
+      read(&data[0], size);
+    }
 
-      std::stringstream ss;
-      boost::iostreams::copy(in, ss);
-      data = ss.str();
+    if (compressionLevel > 0)
+    {
+      decompress(data);
     }
   }
 
@@ -167,18 +194,148 @@ class Client
     }
   }
 
+  /**
+   * Send a message tagged with a new request id without waiting for the
+   * response, so that several requests can be in flight. The server handles
+   * the requests in order and echoes the id in the responses, which are
+   * received with receive() or receiveFrame() and checked with
+   * receivedId().
+   *
+   * @param data The data to be send, encoded as json object.
+   * @return The id of the request.
+   */
+  size_t sendAsync(const std::string& data)
+  {
+    const size_t id = ++requestId;
+    send("{\"id\":" + std::to_string(id) + "," + data.substr(1));
+    pending.push_back(id);
+    return id;
+  }
+
+  /**
+   * Check the id echoed in a received response against the oldest request
+   * sent with sendAsync() that has no response yet, since the responses
+   * arrive in the order of the requests.
+   *
+   * @param id The id of the response, 0 if the response holds no id.
+   */
+  void receivedId(const size_t id)
+  {
+    if (pending.empty())
+    {
+      throw std::runtime_error("Received the response " + std::to_string(id) +
+          " without a request in flight.");
+    }
+
+    const size_t expected = pending.front();
+    pending.pop_front();
+    if (id != expected)
+    {
+      throw std::runtime_error("Received the response " + std::to_string(id) +
+          " instead of the response " + std::to_string(expected) + ".");
+    }
+  }
+
+  //! Return the number of requests sent with sendAsync() without a response.
+  size_t inFlight() const { return pending.size(); }
+
   /*
    * The compression level in range [0, 9] where 0 means no compression used for
-   * receiving data.
+   * receiving data. The server starts a new compression stream whenever the
+   * level is set, so the decompression stream is restarted as well.
    *
    * @param compression The compression level.
    */
   void compression(const size_t compression)
   {
     compressionLevel = compression;
+
+    if (inflating)
+    {
+      inflateEnd(&stream);
+      inflating = false;
+    }
+
+    if (compressionLevel > 0)
+    {
+      stream.zalloc = Z_NULL;
+      stream.zfree = Z_NULL;
+      stream.opaque = Z_NULL;
+      stream.next_in = Z_NULL;
+      stream.avail_in = 0;
+      if (inflateInit(&stream) != Z_OK)
+        throw std::runtime_error("Can't initialize the zlib stream.");
+
+      inflating = true;
+    }
   }
 
  private:
+  //! Read exactly the given number of bytes using the currently open socket.
+  void read(void* buffer, const size_t size)
+  {
+    // Use the data that was already received while looking for a delimiter.
+    const size_t buffered = std::min(size, response.size());
+    if (buffered > 0)
+    {
+      boost::asio::buffer_copy(boost::asio::buffer(buffer, buffered),
+          response.data());
+      response.consume(buffered);
+    }
+
+    if (buffered == size)
+    {
+      return;
+    }
+
+    // Set a deadline for the asynchronous operation.
+    deadline.expires_from_now(boost::posix_time::seconds(10));
+
+    // Set up the variable that receives the result of the asynchronous
+    // operation.
+    boost::system::error_code ec = boost::asio::error::would_block;
+    size_t length;
+
+    boost::asio::async_read(s,
+        boost::asio::buffer((char*) buffer + buffered, size - buffered),
+        boost::asio::transfer_exactly(size - buffered),
+        boost::bind(async_read_handler, boost::asio::placeholders::error, &ec,
+        boost::asio::placeholders::bytes_transferred, &length));
+
+    // Block until the asynchronous operation has completed.
+    do io_context.run_one(); while (ec == boost::asio::error::would_block);
+
+    if (ec)
+    {
+      throw boost::system::system_error(ec);
+    }
+  }
+
+  //! Decompress the given message of the zlib stream in place. The messages
+  //! are flushed by the server, so each one decompresses completely.
+  void decompress(std::string& data)
+  {
+    std::string output;
+    char buffer[65536];
+
+    stream.next_in = (Bytef*) data.data();
+    stream.avail_in = data.size();
+    do
+    {
+      stream.next_out = (Bytef*) buffer;
+      stream.avail_out = sizeof(buffer);
+
+      const int status = inflate(&stream, Z_SYNC_FLUSH);
+      if (status != Z_OK && status != Z_BUF_ERROR && status != Z_STREAM_END)
+        throw std::runtime_error("Can't decompress the received data.");
+
+      output.append(buffer, sizeof(buffer) - stream.avail_out);
+    }
+    while (stream.avail_in > 0 || stream.avail_out == 0);
+
+    data.swap(output);
+  }
+
   void check_deadline()
   {
     // Check whether the deadline has passed. We compare the deadline against
@@ -204,8 +361,24 @@ class Client
   //! Object to control connection timeouts.
   deadline_timer deadline;
 
+  //! Locally-stored data that was received but not yet consumed, pipelined
+  //! responses might arrive with a single read.
+  boost::asio::streambuf response;
+
   //! Locally-stored compression parameter.
   size_t compressionLevel;
+
+  //! Locally-stored id of the last request sent with sendAsync().
+  size_t requestId;
+
+  //! Locally-stored ids of the requests in flight, oldest first.
+  std::deque<size_t> pending;
+
+  //! Locally-stored zlib stream used to decompress the received data.
+  z_stream stream;
+
+  //! Locally-stored value whether the zlib stream is initialized.
+  bool inflating;
 }; // class Client
 
 } // namespace gym
@@ -13,6 +13,7 @@
 #include "client.hpp"
 #include "parser.hpp"
 #include "space.hpp"
+#include "shared_memory.hpp"
 #include "record_episode_statistics.hpp"
 
 namespace gym {
@@ -41,7 +42,14 @@ class Environment
   //! Locally stored done value.
   bool done;
 
-  //! Locally-stored observation object.
+  //! Locally stored reward values of a batch of environments.
+  arma::rowvec rewards;
+
+  //! Locally stored done values of a batch of environments.
+  arma::urowvec dones;
+
+  //! Locally-stored observation object, for a batch of environments each
+  //! column holds the flattened observation of one environment.
   arma::mat observation;
 
   //! Locally-stored instance identifier.
@@ -81,6 +89,32 @@ class Environment
    */
   void make(const std::string& environment);
 
+  /*
+   * Instantiate a batch of environments using the specified environment name.
+   * The environments are stepped together and reset automatically once they
+   * are done.
+   *
+   * @param environment Name of the environments used to train/evaluate
+   *        the model.
+   * @param num Number of environments in the batch.
+   */
+  void make(const std::string& environment, const size_t num);
+
+  /*
+   * Instantiate the environment, or a batch of environments if num > 0, with
+   * the given preprocessing steps applied to the observations on the server,
+   * e.g. [{"name": "grayscale"}, {"name": "resize", "shape": [84, 84]}].
+   *
+   * @param environment Name of the environments used to train/evaluate
+   *        the model.
+   * @param num Number of environments in the batch, 0 for a single
+   *        environment.
+   * @param preprocess The preprocessing steps encoded as json array.
+   */
+  void make(const std::string& environment,
+            const size_t num,
+            const std::string& preprocess);
+
   /*
    * Renders the environment.
    */
@@ -98,11 +132,84 @@ class Environment
 
   /*
    * Run one timestep of the environment's dynamics using the specified action.
+   * For a batch of environments each column holds the action of one
+   * environment, the results are stored in observation, rewards and dones.
    *
    * @param action The action performed at the timestep.
    */
   void step(const arma::mat& action);
 
+  /*
+   * Send the specified action without waiting for the result, so that several
+   * steps can be in flight and the network latency overlaps with the
+   * environment computation. The results are received in order with
+   * stepReceive(), other requests must not be sent while steps are in
+   * flight.
+   *
+   * With the shm transport the server writes each observation into the next
+   * slot of the ring, so the number of steps in flight must not exceed the
+   * number of slots; otherwise the server overwrites a slot before its
+   * observation was received. An additional step throws std::logic_error.
+   *
+   * @param action The action performed at the timestep.
+   * @return The id of the request.
+   */
+  size_t stepAsync(const arma::mat& action);
+
+  /*
+   * Receive the result of the oldest step sent with stepAsync() and store it
+   * in observation, reward and done. Throws std::logic_error if no step is in
+   * flight and std::runtime_error if the id of the response isn't the id of
+   * the oldest step.
+   *
+   * @return The id of the request the result belongs to.
+   */
+  size_t stepReceive();
+
+  /*
+   * Repeat the specified action for the given number of timesteps or until
+   * the episode is done. The reward is accumulated over the timesteps and the
+   * observation is the one of the last timestep.
+   *
+   * @param action The action performed at each timestep.
+   * @param repeat The number of timesteps.
+   */
+  void step(const arma::mat& action, const size_t repeat);
+
+  /*
+   * Save the state of the environment, e.g. to branch from the current state
+   * several times. The server keeps a limited number of snapshots per
+   * instance and drops the least recently used one first.
+   *
+   * @return The id of the snapshot.
+   */
+  size_t snapshot();
+
+  /*
+   * Restore the state of the given snapshot, the observation is the one at the
+   * time of the snapshot.
+   *
+   * @param snapshot The id of the snapshot.
+   */
+  const arma::mat& restore(const size_t snapshot);
+
+  /*
+   * Get the token of the session. If the connection ends, the server keeps
+   * the instance for a while, so that the session can be resumed with the
+   * token on a new connection.
+   */
+  std::string token();
+
+  /*
+   * Resume the session of the given token, the instance of the session
+   * replaces the instance of this environment. The transport, encoding and
+   * compression settings have to be set again.
+   *
+   * @param token The session token.
+   * @return false if the session is unknown or expired.
+   */
+  bool resume(const std::string& token);
+
   /*
    * Sets the seed for this env's random number generator.
    *
@@ -117,11 +224,52 @@ class Environment
    */
   void compression(const size_t compression);
 
+  /*
+   * Sets the encoding used for the observations, either "json" or "binary".
+   * The binary encoding sends the raw observation data and avoids the text
+   * round-trip.
+   *
+   * @param encoding The encoding name.
+   */
+  void encoding(const std::string& encoding);
+
+  /*
+   * Enable the delta encoded observations, the server sends only the values
+   * that changed since the last observation, which are applied to the local
+   * observation. A full observation is sent after a reset and after the given
+   * number of deltas.
+   *
+   * @param keyframe The keyframe interval, 0 disables the delta encoding.
+   */
+  void delta(const size_t keyframe);
+
+  /*
+   * Sets the transport used for the observations, either "tcp" (default) or
+   * "shm". With the shm transport, which requires the server to run on the
+   * same host, the server writes the observations into a ring of shared
+   * memory slots and the observation matrix refers to the slot without a
+   * copy. A slot is overwritten after the given number of following steps, so
+   * copy the observation if it has to be kept for longer.
+   *
+   * @param transport The transport name.
+   * @param slots The number of observation slots.
+   */
+  void transport(const std::string& transport, const size_t slots = 4);
+
   /*
    * Get the environment url.
    */
   std::string url();
 
+  /*
+   * Get the url of the recorded video. The video is exported in the
+   * background, poll until the status is "ready"; other values are
+   * "pending", "busy", "failed" and "missing" if there is no recording.
+   *
+   * @param status The export status.
+   */
+  std::string url(std::string& status);
+
  private:
   //! Get the observation space information.
   void observationSpace();
@@ -129,14 +277,30 @@ class Environment
   //! The the action space information.
   void actionSpace();
 
+  //! Receive and parse the observation of a reset or step.
+  void receiveObservation();
+
+  //! Copy the observation out of the shared memory and unmap it.
+  void unmapObservation();
+
   //! Locally-stored client object.
   Client client;
 
   //! Locally-stored parser object.
   Parser parser;
 
+  //! Locally-stored shared memory of the shm transport.
+  SharedMemory sharedMemory;
+
   //! Locally-stored current render value.
   bool renderValue;
+
+  //! Locally-stored value whether the observations are binary encoded.
+  bool binaryEncoding;
+
+  //! Locally-stored number of environments in the batch, 0 if the instance
+  //! is a single environment.
+  size_t numEnvs;
 };
 
 } // namespace gym
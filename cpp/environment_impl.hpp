@@ -13,13 +13,18 @@
 
 namespace gym {
 
-inline Environment::Environment() : renderValue(false)
+inline Environment::Environment() :
+    renderValue(false),
+    binaryEncoding(false),
+    numEnvs(0)
 {
   // Nothing to do here.
 }
 
 inline Environment::Environment(const std::string& host, const std::string& port) :
-    renderValue(false)
+    renderValue(false),
+    binaryEncoding(false),
+    numEnvs(0)
 {
   client.connect(host, port);
 }
@@ -28,7 +33,9 @@ inline Environment::Environment(
     const std::string& host,
     const std::string& port,
     const std::string& environment) :
-    renderValue(false)
+    renderValue(false),
+    binaryEncoding(false),
+    numEnvs(0)
 {
   client.connect(host, port);
   make(environment);
@@ -36,7 +43,27 @@ inline Environment::Environment(
 
 inline void Environment::make(const std::string& environment)
 {
-  client.send(messages::EnvironmentName(environment));
+  make(environment, 0);
+}
+
+inline void Environment::make(const std::string& environment,
+                              const size_t num)
+{
+  make(environment, num, "");
+}
+
+inline void Environment::make(const std::string& environment,
+                              const size_t num,
+                              const std::string& preprocess)
+{
+  client.send(messages::EnvironmentName(environment, num, preprocess));
+
+  // The server removes the shared memory of the previous instance and resets
+  // the encoding and the compression of the connection.
+  unmapObservation();
+  client.compression(0);
+  binaryEncoding = false;
+  numEnvs = num;
 
   std::string json;
   client.receive(json);
@@ -71,26 +98,171 @@ inline void Environment::close()
 inline const arma::mat& Environment::reset()
 {
   client.send(messages::EnvironmentReset());
+  receiveObservation();
+
+  return observation;
+}
+
+inline void Environment::step(const arma::mat& action)
+{
+  if (numEnvs > 0)
+    client.send(messages::StepBatch(action, action_space, renderValue));
+  else
+    client.send(messages::Step(action, action_space, renderValue));
+
+  receiveObservation();
+}
+
+inline size_t Environment::stepAsync(const arma::mat& action)
+{
+  // The slot of an observation is overwritten by the step after the next
+  // slots - 1 steps.
+  if (sharedMemory.mapped() && client.inFlight() >= sharedMemory.Slots())
+  {
+    throw std::logic_error("The number of steps in flight exceeds the " +
+        std::to_string(sharedMemory.Slots()) + " shared memory slots.");
+  }
+
+  if (numEnvs > 0)
+    return client.sendAsync(messages::StepBatch(action, action_space,
+        renderValue));
+
+  return client.sendAsync(messages::Step(action, action_space, renderValue));
+}
+
+inline size_t Environment::stepReceive()
+{
+  // Don't block on a response that never arrives.
+  if (client.inFlight() == 0)
+    throw std::logic_error("There is no step in flight.");
+
+  receiveObservation();
+
+  // The id of a binary encoded response is part of the meta data.
+  if (binaryEncoding)
+    parser.parse(info);
+
+  size_t id;
+  parser.id(id);
+  client.receivedId(id);
+  return id;
+}
+
+inline void Environment::step(const arma::mat& action, const size_t repeat)
+{
+  client.send(messages::Step(action, action_space, renderValue, repeat));
+  receiveObservation();
+}
+
+inline void Environment::receiveObservation()
+{
+  if (sharedMemory.mapped())
+  {
+    std::string json;
+    client.receive(json);
+    parser.parse(json);
+
+    // Use the memory of the slot as the observation, without a copy.
+    size_t slot;
+    parser.slot(slot);
+    observation = arma::mat(sharedMemory.slot(slot), sharedMemory.Rows(),
+        sharedMemory.Cols(), false, false);
+
+    if (numEnvs > 0)
+      parser.info(rewards, dones);
+    else
+      parser.info(reward, done, info);
+    return;
+  }
+
+  if (binaryEncoding)
+  {
+    std::string data;
+    client.receiveFrame(data);
+    parser.frame(data, observation, reward, done, info, numEnvs > 0);
+
+    // The rewards and done values of a batch are part of the meta data.
+    if (numEnvs > 0)
+    {
+      parser.parse(info);
+      parser.info(rewards, dones);
+    }
+    return;
+  }
+
+  std::string json;
+  client.receive(json);
+
+  parser.parse(json);
+  if (numEnvs > 0)
+  {
+    if (!parser.delta(observation))
+      parser.observations(observation);
+    parser.info(rewards, dones);
+  }
+  else
+  {
+    if (!parser.delta(observation))
+      parser.observation(&observation_space, observation);
+    parser.info(reward, done, info);
+  }
+}
+
+inline size_t Environment::snapshot()
+{
+  client.send(messages::EnvironmentSnapshot());
 
   std::string json;
   client.receive(json);
 
+  size_t snapshot;
   parser.parse(json);
-  parser.observation(&observation_space, observation);
+  parser.snapshot(snapshot);
+  return snapshot;
+}
+
+inline const arma::mat& Environment::restore(const size_t snapshot)
+{
+  client.send(messages::EnvironmentRestore(snapshot));
+  receiveObservation();
 
   return observation;
 }
 
-inline void Environment::step(const arma::mat& action)
+inline std::string Environment::token()
 {
-  client.send(messages::Step(action, action_space, renderValue));
+  client.send(messages::SessionToken());
 
   std::string json;
   client.receive(json);
 
+  std::string token;
   parser.parse(json);
-  parser.observation(&observation_space, observation);
-  parser.info(reward, done, info);
+  parser.token(token);
+  return token;
+}
+
+inline bool Environment::resume(const std::string& token)
+{
+  client.send(messages::SessionResume(token));
+
+  std::string json;
+  client.receive(json);
+
+  parser.parse(json);
+  if (!parser.resume(instance, numEnvs))
+    return false;
+
+  // The server removes the shared memory of the previous connection.
+  unmapObservation();
+
+  observationSpace();
+  actionSpace();
+
+  observation_space.client(client);
+  action_space.client(client);
+  record_episode_stats.client(client);
+  return true;
 }
 
 inline void Environment::seed(const size_t s)
@@ -104,6 +276,48 @@ inline void Environment::compression(const size_t compression)
   client.send(messages::ServerCompression(compression));
 }
 
+inline void Environment::encoding(const std::string& encoding)
+{
+  binaryEncoding = (encoding == "binary");
+  client.send(messages::ServerEncoding(encoding));
+}
+
+inline void Environment::delta(const size_t keyframe)
+{
+  client.send(messages::ServerDelta(keyframe));
+}
+
+inline void Environment::transport(const std::string& transport,
+                                   const size_t slots)
+{
+  client.send(messages::ServerTransport(transport, slots));
+  unmapObservation();
+  if (transport != "shm")
+    return;
+
+  std::string json;
+  client.receive(json);
+  parser.parse(json);
+
+  std::string name;
+  size_t rows, cols, numSlots;
+  parser.sharedMemory(name, numSlots, rows, cols);
+  sharedMemory.map(name, numSlots, rows, cols);
+}
+
+inline void Environment::unmapObservation()
+{
+  // Don't leave the observation referring to the unmapped memory; reset()
+  // detaches the matrix from the shared memory before the copy is assigned.
+  if (sharedMemory.mapped())
+  {
+    arma::mat copy(observation);
+    observation.reset();
+    observation = std::move(copy);
+    sharedMemory.unmap();
+  }
+}
+
 inline void Environment::observationSpace()
 {
   client.send(messages::EnvironmentObservationSpace());
@@ -127,6 +341,12 @@ inline void Environment::actionSpace()
 }
 
 inline std::string Environment::url()
+{
+  std::string status;
+  return url(status);
+}
+
+inline std::string Environment::url(std::string& status)
 {
   client.send(messages::URL());
 
@@ -136,6 +356,7 @@ inline std::string Environment::url()
   std::string url;
   parser.parse(json);
   parser.url(url);
+  parser.status(status);
 
   return url;
 }
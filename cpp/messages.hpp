@@ -21,6 +21,22 @@ static inline std::string EnvironmentName(const std::string& name)
   return "{\"env\":{\"name\": \"" + name + "\"}}";
 }
 
+//! Create message to create the enviroment, or a batch of the given number
+//! of enviroments if num > 0, with the given preprocessing steps encoded as
+//! json array.
+static inline std::string EnvironmentName(const std::string& name,
+                                          const size_t num,
+                                          const std::string& preprocess)
+{
+  std::string message = "{\"env\":{\"name\": \"" + name + "\"";
+  if (num > 0)
+    message += ", \"num\": " + std::to_string(num);
+  if (!preprocess.empty())
+    message += ", \"preprocess\": " + preprocess;
+
+  return message + "}}";
+}
+
 //! Create message to reset the enviroment.
 static inline std::string EnvironmentReset()
 {
@@ -40,12 +56,57 @@ static inline std::string ServerCompression(const size_t compression)
       std::to_string(compression) + "\"}}";
 }
 
+//! Create message to set the encoding used for the observations.
+static inline std::string ServerEncoding(const std::string& encoding)
+{
+  return "{\"server\":{\"encoding\": \"" + encoding + "\"}}";
+}
+
+//! Create message to set the keyframe interval of the delta encoded
+//! observations, 0 disables the delta encoding.
+static inline std::string ServerDelta(const size_t keyframe)
+{
+  return "{\"server\":{\"delta\": " + std::to_string(keyframe) + "}}";
+}
+
+//! Create message to set the transport used for the observations.
+static inline std::string ServerTransport(const std::string& transport,
+                                          const size_t slots)
+{
+  return "{\"server\":{\"transport\": \"" + transport + "\", \"slots\": " +
+      std::to_string(slots) + "}}";
+}
+
 //! Create message to set the enviroment seed.
 static inline std::string EnvironmentSeed(const size_t seed)
 {
   return "{\"env\":{\"seed\": \"" + std::to_string(seed) + "\"}}";
 }
 
+//! Create message to snapshot the state of the enviroment.
+static inline std::string EnvironmentSnapshot()
+{
+  return "{\"env\":{\"action\": \"snapshot\"}}";
+}
+
+//! Create message to restore the given snapshot of the enviroment.
+static inline std::string EnvironmentRestore(const size_t snapshot)
+{
+  return "{\"env\":{\"restore\": " + std::to_string(snapshot) + "}}";
+}
+
+//! Create message to get the token of the session.
+static inline std::string SessionToken()
+{
+  return "{\"session\":{\"action\": \"token\"}}";
+}
+
+//! Create message to resume the session of the given token.
+static inline std::string SessionResume(const std::string& token)
+{
+  return "{\"session\":{\"resume\": \"" + token + "\"}}";
+}
+
 //! Create message to close the enviroment.
 static inline std::string EnvironmentClose()
 {
@@ -130,6 +191,66 @@ static inline std::string Step(
   return "";
 }
 
+//! Create message to repeat the given action, the server steps through the
+//! environment until the episode is done or the action was repeated the
+//! given number of times.
+static inline std::string Step(const arma::mat& action,
+                               Space& space,
+                               const bool render,
+                               const size_t repeat)
+{
+  std::string msg = Step(action, space, render);
+  msg.insert(msg.size() - 2, ", \"repeat\":" + std::to_string(repeat));
+  return msg;
+}
+
+//! Create message to step a batch of environments, one action per column.
+static inline std::string StepBatch(
+    const arma::mat& actions, Space& space, const bool render)
+{
+  std::string actionStr = "[";
+  for (size_t i = 0; i < actions.n_cols; ++i)
+  {
+    if (i > 0)
+    {
+      actionStr += ",";
+    }
+
+    const arma::vec action = actions.col(i);
+    if (space.type == Space::DISCRETE)
+    {
+      size_t index = (size_t) action(0);
+      if (action.n_elem > 1)
+      {
+        index = arma::as_scalar(arma::find(action.max() == action, 1));
+      }
+
+      actionStr += std::to_string((int) index);
+    }
+    else
+    {
+      actionStr += "[";
+      for (size_t j = 0; j < action.n_elem; ++j)
+      {
+        if (j > 0)
+        {
+          actionStr += ",";
+        }
+
+        if (space.type == Space::MULTIDISCRETE)
+          actionStr += std::to_string((int) action(j));
+        else
+          actionStr += std::to_string((double) action(j));
+      }
+      actionStr += "]";
+    }
+  }
+  actionStr += "]";
+
+  return "{\"step\":{\"action\":" + actionStr +
+      ", \"render\":" + std::to_string(render) + "}}";
+}
+
 //! Create message to get the url.
 static inline std::string URL()
 {
@@ -8,6 +8,9 @@
 #define GYM_PARSER_HPP
 
 #include <string>
+#include <vector>
+#include <cstring>
+#include <stdint.h>
 #include <armadillo>
 
 #include "pjson/pjson.h"
@@ -57,6 +60,43 @@ class Parser
    */
   void observation(const Space* space, arma::mat& observation);
 
+  /**
+   * Parse a binary encoded observation frame.
+   *
+   * @param data The received frame without the length prefix.
+   * @param observation The parsed observation.
+   * @param reward The reward information.
+   * @param done The information whether task succeed or not.
+   * @param info The meta data encoded as json string.
+   * @param batch If true, the frame holds the observations of a batch of
+   *        environments and each column holds one flattened observation.
+   *
+   * A delta frame is applied to the given observation.
+   */
+  void frame(const std::string& data,
+             arma::mat& observation,
+             double& reward,
+             bool& done,
+             std::string& info,
+             const bool batch = false);
+
+  /**
+   * Apply the delta encoded observation to the given observation, the delta
+   * holds the changed values and their indices into the observation matrix.
+   *
+   * @param observation The observation the delta is applied to.
+   * @return false if the response holds no delta but a full observation.
+   */
+  bool delta(arma::mat& observation);
+
+  /**
+   * Parse the observations of a batch of environments, each column holds one
+   * flattened observation.
+   *
+   * @param observations The parsed observations.
+   */
+  void observations(arma::mat& observations);
+
   /**
    * Parse the space data.
    *
@@ -80,6 +120,15 @@ class Parser
    */
   void info(double& reward, bool& done, std::string& info);
 
+  /**
+   * Parse the info data of a batch of environments.
+   *
+   * @param rewards The reward of each environment.
+   * @param dones The information whether task succeed or not for each
+   *        environment.
+   */
+  void info(arma::rowvec& rewards, arma::urowvec& dones);
+
   /**
    * Parse the environment data.
    *
@@ -87,12 +136,72 @@ class Parser
    */
   void environment(std::string& instance);
 
+  /**
+   * Parse the request id, echoed by the server for requests sent with
+   * Client::sendAsync().
+   *
+   * @param id The request id, 0 if the response holds no id.
+   */
+  void id(size_t& id);
+
+  /**
+   * Parse the shared memory information of the shm transport.
+   *
+   * @param name The name of the shared memory block.
+   * @param slots The number of observation slots.
+   * @param rows The number of rows of an observation.
+   * @param cols The number of columns of an observation.
+   */
+  void sharedMemory(std::string& name,
+                    size_t& slots,
+                    size_t& rows,
+                    size_t& cols);
+
+  /**
+   * Parse the shared memory slot that holds the observation.
+   *
+   * @param slot The slot index.
+   */
+  void slot(size_t& slot);
+
+  /**
+   * Parse the id of a snapshot.
+   *
+   * @param snapshot The snapshot id.
+   */
+  void snapshot(size_t& snapshot);
+
+  /**
+   * Parse the token of the session.
+   *
+   * @param token The session token.
+   */
+  void token(std::string& token);
+
+  /**
+   * Parse the instance of a resumed session.
+   *
+   * @param instance The instance identifier.
+   * @param num The number of environments in the batch, 0 if the instance is
+   *     a single environment.
+   * @return false if the session could not be resumed.
+   */
+  bool resume(std::string& instance, size_t& num);
+
   /**
    * Parse the url data.
    *
    * @param url The url.
    */
   void url(std::string& url);
+
+  /**
+   * Parse the status of the video export, "ready", "pending", "busy",
+   * "failed" or "missing".
+   *
+   * @param status The export status.
+   */
+  void status(std::string& status);
  private:
   //! Store results of the given json string in the row'th of the given
   //! matrix v.
@@ -108,6 +217,19 @@ class Parser
   //! matrix v.
   void vec(const pjson::value_variant_vec_t& vector, std::vector<int>& v);
 
+  //! Append the values of the given (nested) json array to v.
+  void flatten(const pjson::value_variant& value, std::vector<double>& v);
+
+  //! Copy the given raw data of type eT into the given matrix.
+  template<typename eT>
+  void copy(const char* data, arma::mat& v);
+
+  //! Copy the given raw data with the given dtype code into the given matrix.
+  void copy(const uint8_t type, const char* data, arma::mat& v);
+
+  //! Return the size in bytes of the given dtype code.
+  size_t typeSize(const uint8_t type);
+
   //! Locally-stored document to parse the json string.
   pjson::document doc;
 
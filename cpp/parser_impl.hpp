@@ -65,6 +65,27 @@ inline void Parser::info(double& reward, bool& done, std::string& info)
     reward = rewardValue->as_double();
 }
 
+inline void Parser::info(arma::rowvec& rewards, arma::urowvec& dones)
+{
+  const pjson::value_variant* doneValue = doc.find_value_variant("done");
+  if (doneValue != NULL && doneValue->is_array())
+  {
+    const pjson::value_variant_vec_t& array = doneValue->get_array();
+    dones = arma::urowvec(array.size());
+    for (size_t i = 0; i < array.size(); ++i)
+      dones(i) = array[i].as_bool();
+  }
+
+  const pjson::value_variant* rewardValue = doc.find_value_variant("reward");
+  if (rewardValue != NULL && rewardValue->is_array())
+  {
+    const pjson::value_variant_vec_t& array = rewardValue->get_array();
+    rewards = arma::rowvec(array.size());
+    for (size_t i = 0; i < array.size(); ++i)
+      rewards(i) = array[i].as_double();
+  }
+}
+
 inline void Parser::environment(std::string& instance)
 {
   pjson::key_value_vec_t& obj = doc.get_object();
@@ -106,20 +127,17 @@ inline void Parser::observation(const Space* space, arma::mat& observation)
     observation = arma::mat(space->boxShape[0] * space->boxShape[1],
         space->boxShape[2]);
 
+    // Each channel of a pixel is stored in a different slice.
     size_t elem = 0;
     const pjson::value_variant_vec_t& array1 = value->get_array();
     for (size_t i = 0; i < array1.size(); i++)
     {
       const pjson::value_variant_vec_t& array2 = array1[i].get_array();
-      for (size_t j = 0; j < array2.size(); j++)
+      for (size_t j = 0; j < array2.size(); j++, elem++)
       {
-        size_t z = 0;
         const pjson::value_variant_vec_t& array3 = array2[j].get_array();
-        for (size_t k = 0; k < array3.size(); k++, elem++, z++)
-        {
-          elem = elem % observation.n_rows;
-          temp.slice(z)(elem) = array3[k].as_double();
-        }
+        for (size_t k = 0; k < array3.size(); k++)
+          temp.slice(k)(elem) = array3[k].as_double();
       }
     }
 
@@ -131,6 +149,192 @@ inline void Parser::observation(const Space* space, arma::mat& observation)
   }
 }
 
+inline void Parser::observations(arma::mat& observations)
+{
+  const pjson::value_variant_vec_t& array = doc.find_value_variant(
+      "observation")->get_array();
+
+  std::vector<double> values;
+  for (size_t i = 0; i < array.size(); ++i)
+    flatten(array[i], values);
+
+  const size_t rows = (array.size() > 0) ? values.size() / array.size() : 0;
+  observations = arma::mat(values.data(), rows, array.size());
+}
+
+inline void Parser::flatten(const pjson::value_variant& value,
+                            std::vector<double>& v)
+{
+  if (value.is_array())
+  {
+    const pjson::value_variant_vec_t& array = value.get_array();
+    for (size_t i = 0; i < array.size(); ++i)
+      flatten(array[i], v);
+  }
+  else
+  {
+    v.push_back(value.as_double());
+  }
+}
+
+inline void Parser::frame(const std::string& data,
+                          arma::mat& observation,
+                          double& reward,
+                          bool& done,
+                          std::string& info,
+                          const bool batch)
+{
+  // The frame is encoded in little endian byte order, see priv/encoding.py.
+  const char* ptr = data.data();
+
+  uint8_t type, flags;
+  uint16_t dimensions;
+  uint32_t metaSize;
+  std::memcpy(&type, ptr, 1);
+  std::memcpy(&flags, ptr + 1, 1);
+  std::memcpy(&dimensions, ptr + 2, 2);
+  std::memcpy(&reward, ptr + 4, 8);
+  std::memcpy(&metaSize, ptr + 12, 4);
+  ptr += 16;
+
+  std::vector<uint32_t> shape(dimensions);
+  if (dimensions > 0)
+    std::memcpy(shape.data(), ptr, dimensions * sizeof(uint32_t));
+  ptr += dimensions * sizeof(uint32_t);
+
+  done = (flags & 1) != 0;
+  info = std::string(ptr, metaSize);
+  ptr += metaSize;
+
+  // A delta frame holds the changed values followed by their indices, which
+  // are applied to the current observation.
+  if ((flags & 2) != 0)
+  {
+    arma::mat values(dimensions > 0 ? shape[0] : 0, 1);
+    copy(type, ptr, values);
+    ptr += values.n_elem * typeSize(type);
+
+    for (size_t i = 0; i < values.n_elem; ++i)
+    {
+      uint32_t index;
+      std::memcpy(&index, ptr + i * sizeof(uint32_t), sizeof(uint32_t));
+      observation(index) = values(i);
+    }
+    return;
+  }
+
+  // The data is stored in C order, so the last dimension is contiguous. For
+  // observations with more than one dimension the result is transposed to get
+  // the same layout the json parser returns.
+  size_t rows = 1, cols = 1;
+  if (batch && dimensions > 0)
+  {
+    // The observation of each environment is contiguous.
+    cols = shape[0];
+    for (size_t i = 1; i < dimensions; ++i)
+      rows *= shape[i];
+  }
+  else if (dimensions == 1)
+  {
+    rows = shape[0];
+  }
+  else if (dimensions > 1)
+  {
+    rows = shape[dimensions - 1];
+    for (size_t i = 0; i < (size_t) (dimensions - 1); ++i)
+      cols *= shape[i];
+  }
+
+  observation.set_size(rows, cols);
+  copy(type, ptr, observation);
+
+  if (batch || dimensions < 2)
+    return;
+
+  if (dimensions == 2)
+  {
+    arma::inplace_trans(observation);
+    return;
+  }
+
+  // Store the observation in Fortran order like the json parser, e.g. each
+  // column of an image holds one channel in column-major order.
+  const arma::vec values(observation.memptr(), observation.n_elem, false,
+      true);
+  arma::mat result(cols, rows);
+
+  std::vector<size_t> stride(dimensions, 1), index(dimensions, 0);
+  for (size_t d = 1; d < dimensions; ++d)
+    stride[d] = stride[d - 1] * shape[d - 1];
+
+  size_t position = 0;
+  for (size_t n = 0; n < values.n_elem; ++n)
+  {
+    result(position) = values(n);
+    for (size_t d = dimensions; d-- > 0; )
+    {
+      position += stride[d];
+      if (++index[d] < shape[d])
+        break;
+
+      position -= stride[d] * shape[d];
+      index[d] = 0;
+    }
+  }
+
+  observation = std::move(result);
+}
+
+inline bool Parser::delta(arma::mat& observation)
+{
+  const pjson::value_variant* delta = doc.find_value_variant("delta");
+  if (delta == NULL)
+    return false;
+
+  const pjson::value_variant_vec_t& index = delta->find_value_variant(
+      "index")->get_array();
+  const pjson::value_variant_vec_t& value = delta->find_value_variant(
+      "value")->get_array();
+  for (size_t i = 0; i < index.size(); ++i)
+    observation(index[i].as_int64()) = value[i].as_double();
+
+  return true;
+}
+
+inline size_t Parser::typeSize(const uint8_t type)
+{
+  static const size_t sizes[] = { 8, 4, 1, 1, 2, 2, 4, 4, 8, 8 };
+  return (type < 10) ? sizes[type] : 0;
+}
+
+inline void Parser::copy(const uint8_t type, const char* data, arma::mat& v)
+{
+  switch (type)
+  {
+    case 0: std::memcpy(v.memptr(), data, v.n_elem * sizeof(double)); break;
+    case 1: copy<float>(data, v); break;
+    case 2: copy<uint8_t>(data, v); break;
+    case 3: copy<int8_t>(data, v); break;
+    case 4: copy<int16_t>(data, v); break;
+    case 5: copy<uint16_t>(data, v); break;
+    case 6: copy<int32_t>(data, v); break;
+    case 7: copy<uint32_t>(data, v); break;
+    case 8: copy<int64_t>(data, v); break;
+    case 9: copy<uint64_t>(data, v); break;
+  }
+}
+
+template<typename eT>
+inline void Parser::copy(const char* data, arma::mat& v)
+{
+  for (size_t i = 0; i < v.n_elem; ++i)
+  {
+    eT value;
+    std::memcpy(&value, data + i * sizeof(eT), sizeof(eT));
+    v(i) = (double) value;
+  }
+}
+
 inline void Parser::space(Space* space)
 {
   const pjson::key_value_vec_t& obj = doc.find_value_variant(
@@ -195,6 +399,60 @@ inline void Parser::vec(
     v.push_back(vector[i].as_int64());
 }
 
+inline void Parser::id(size_t& id)
+{
+  const pjson::value_variant* idValue = doc.find_value_variant("id");
+  id = (idValue != NULL) ? idValue->as_int64() : 0;
+}
+
+inline void Parser::sharedMemory(std::string& name,
+                                 size_t& slots,
+                                 size_t& rows,
+                                 size_t& cols)
+{
+  const pjson::value_variant* nameValue = doc.find_value_variant("shm");
+  name = (nameValue != NULL) ? nameValue->get_string_ptr() : "";
+
+  const pjson::value_variant* value = doc.find_value_variant("slots");
+  slots = (value != NULL) ? value->as_int64() : 0;
+
+  value = doc.find_value_variant("rows");
+  rows = (value != NULL) ? value->as_int64() : 0;
+
+  value = doc.find_value_variant("cols");
+  cols = (value != NULL) ? value->as_int64() : 0;
+}
+
+inline void Parser::slot(size_t& slot)
+{
+  const pjson::value_variant* slotValue = doc.find_value_variant("slot");
+  slot = (slotValue != NULL) ? slotValue->as_int64() : 0;
+}
+
+inline void Parser::snapshot(size_t& snapshot)
+{
+  const pjson::value_variant* value = doc.find_value_variant("snapshot");
+  snapshot = (value != NULL) ? value->as_int64() : 0;
+}
+
+inline void Parser::token(std::string& token)
+{
+  const pjson::value_variant* value = doc.find_value_variant("token");
+  token = (value != NULL && value->is_string()) ? value->get_string_ptr() : "";
+}
+
+inline bool Parser::resume(std::string& instance, size_t& num)
+{
+  const pjson::value_variant* value = doc.find_value_variant("instance");
+  if (value == NULL || !value->is_string())
+    return false;
+  instance = value->get_string_ptr();
+
+  value = doc.find_value_variant("num");
+  num = (value != NULL) ? value->as_int64() : 0;
+  return true;
+}
+
 inline void Parser::url(std::string& url)
 {
   pjson::key_value_vec_t& obj = doc.get_object();
@@ -205,6 +463,12 @@ inline void Parser::url(std::string& url)
   }
 }
 
+inline void Parser::status(std::string& status)
+{
+  const pjson::value_variant* statusValue = doc.find_value_variant("status");
+  status = (statusValue != NULL) ? statusValue->get_string_ptr() : "";
+}
+
 } // namespace gym
 
 #endif
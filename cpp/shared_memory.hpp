@@ -0,0 +1,87 @@
+/**
+ * @file shared_memory.hpp
+ *
+ * Definition of the shared memory routines used by the shm transport.
+ */
+#ifndef GYM_SHARED_MEMORY_HPP
+#define GYM_SHARED_MEMORY_HPP
+
+#include <string>
+#include <stdexcept>
+
+namespace gym {
+
+/*
+ * Definition of the SharedMemory class, which maps the ring of observation
+ * slots the server writes to. Each slot holds a rows x cols matrix in
+ * column-major order.
+ */
+class SharedMemory
+{
+ public:
+  /**
+   * Create the SharedMemory object.
+   */
+  SharedMemory();
+
+  /*
+   * Unmap the shared memory.
+   */
+  ~SharedMemory();
+
+  /**
+   * Map the specified shared memory block.
+   *
+   * @param name The name of the shared memory block.
+   * @param slots The number of observation slots.
+   * @param rows The number of rows of an observation.
+   * @param cols The number of columns of an observation.
+   */
+  void map(const std::string& name,
+           const size_t slots,
+           const size_t rows,
+           const size_t cols);
+
+  /**
+   * Unmap the shared memory block.
+   */
+  void unmap();
+
+  //! Return whether a shared memory block is mapped.
+  bool mapped() const { return memory != NULL; }
+
+  //! Return the memory of the specified slot.
+  double* slot(const size_t i) const { return memory + (i % slots) * rows * cols; }
+
+  //! Return the number of slots.
+  size_t Slots() const { return slots; }
+
+  //! Return the number of rows of an observation.
+  size_t Rows() const { return rows; }
+
+  //! Return the number of columns of an observation.
+  size_t Cols() const { return cols; }
+
+ private:
+  //! Locally-stored mapped memory.
+  double* memory;
+
+  //! Locally-stored size of the mapped memory in bytes.
+  size_t size;
+
+  //! Locally-stored number of slots.
+  size_t slots;
+
+  //! Locally-stored number of rows of an observation.
+  size_t rows;
+
+  //! Locally-stored number of columns of an observation.
+  size_t cols;
+};
+
+} // namespace gym
+
+// Include implementation.
+#include "shared_memory_impl.hpp"
+
+#endif
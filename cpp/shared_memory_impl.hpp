@@ -0,0 +1,71 @@
+/**
+ * @file shared_memory_impl.hpp
+ *
+ * Implementation of the shared memory routines used by the shm transport.
+ */
+#ifndef GYM_SHARED_MEMORY_IMPL_HPP
+#define GYM_SHARED_MEMORY_IMPL_HPP
+
+#include <fcntl.h>
+#include <unistd.h>
+#include <sys/mman.h>
+
+// In case it hasn't been included yet.
+#include "shared_memory.hpp"
+
+namespace gym {
+
+inline SharedMemory::SharedMemory() :
+    memory(NULL),
+    size(0),
+    slots(0),
+    rows(0),
+    cols(0)
+{
+  // Nothing to do here.
+}
+
+inline SharedMemory::~SharedMemory()
+{
+  unmap();
+}
+
+inline void SharedMemory::map(const std::string& name,
+                              const size_t slots,
+                              const size_t rows,
+                              const size_t cols)
+{
+  unmap();
+
+  // The block is created by the server and removed once the instance is
+  // closed or the transport is changed.
+  const int fd = shm_open(("/" + name).c_str(), O_RDWR, 0);
+  if (fd < 0)
+    throw std::runtime_error("Can't open the shared memory block " + name);
+
+  const size_t length = slots * rows * cols * sizeof(double);
+  void* data = mmap(NULL, length, PROT_READ | PROT_WRITE, MAP_SHARED, fd, 0);
+  ::close(fd);
+
+  if (data == MAP_FAILED)
+    throw std::runtime_error("Can't map the shared memory block " + name);
+
+  this->memory = static_cast<double*>(data);
+  this->size = length;
+  this->slots = slots;
+  this->rows = rows;
+  this->cols = cols;
+}
+
+inline void SharedMemory::unmap()
+{
+  if (memory != NULL)
+    munmap(memory, size);
+
+  memory = NULL;
+  size = 0;
+}
+
+} // namespace gym
+
+#endif
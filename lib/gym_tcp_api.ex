@@ -11,15 +11,25 @@ defmodule GymTcpApi do
   def start(_type, _args) do
     import Supervisor.Spec
 
+    # The table is owned by the application process, it outlives restarts of
+    # the NodeManager.
+    GymTcpApi.NodeManager.create_table()
+
+    # The pool holds max_worker workers, which start their Python interpreter
+    # when they are used first and stop it again after being idle (see
+    # GymTcpApi.Worker). The lifo strategy hands out the recently used workers
+    # with a running interpreter first.
     poolboy_config = [
       {:name, {:local, pool_name()}},
       {:worker_module, GymTcpApi.Worker},
-      {:size, Application.get_env(:gym_tcp_api, :worker)},
+      {:size, max(Application.get_env(:gym_tcp_api, :max_worker, 0),
+          Application.get_env(:gym_tcp_api, :worker))},
       {:max_overflow, 0},
-      {:strategy, :fifo}
+      {:strategy, :lifo}
     ]
 
     children = [
+      worker(GymTcpApi.NodeManager, []),
       :poolboy.child_spec(pool_name(), poolboy_config, []),
       supervisor(Task.Supervisor, [[name: GymTcpApi.TaskSupervisor]]),
       worker(Task, [GymTcpApi.Server, :accept,
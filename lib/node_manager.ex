@@ -2,10 +2,45 @@ _ = """
   @file node_manager.ex
   @author Marcus Edel
 
-  Node handler.
+  Node handler. Every node publishes its load (free and busy workers, the
+  number of requests waiting for a worker and the recent request latency) to
+  the other nodes, which keep it in an ETS table, so that new connections can
+  be placed on a lightly loaded node without a remote call.
 """
 
 defmodule GymTcpApi.NodeManager do
+  use GenServer
+
+  @table :gym_node_load
+
+  # Upper bounds in milliseconds of the checkout wait time histogram.
+  @wait_buckets [1, 10, 100, 1000, 5000, :infinity]
+
+  def start_link() do
+    GenServer.start_link(__MODULE__, [], name: __MODULE__)
+  end
+
+  # Create the table of the loads and counters. It is created by the
+  # application and not by the manager, so that the counters and the queue
+  # bound survive a restart of the manager.
+  def create_table do
+    :ets.new(@table, [:named_table, :public, :set,
+        read_concurrency: true, write_concurrency: true])
+    :ets.insert(@table, [{:waiting, 0}, {:latency, 0, 0}, {:interpreters, 0},
+        {:checkout, 0, 0, 0}])
+    :ets.insert(@table, for(le <- @wait_buckets, do: {{:wait, le}, 0}))
+  end
+
+  def init(_) do
+    # Remove the load of the nodes that leave the cluster.
+    :net_kernel.monitor_nodes(true)
+
+    # The manager is started before the worker pool, which is queried for the
+    # load, and keeps running while the pool is restarted.
+    Process.send_after(self(), :publish, interval())
+    {:ok, %{latency: 0.0, interpreters: %{}}}
+  end
+
   def all_nodes do
     Node.list ++ [Node.self]
   end
@@ -13,4 +48,224 @@ defmodule GymTcpApi.NodeManager do
   def random_node(_) do
     Enum.random(all_nodes())
   end
+
+  # Select the node for a new connection using the configured strategy,
+  # either :power_of_two (default), :least_loaded or :random.
+  def select_node(data) do
+    case config(:node_selection, :power_of_two) do
+      :random -> random_node(data)
+      :least_loaded -> Enum.min_by(all_nodes(), &score/1)
+      _ -> power_of_two(all_nodes())
+    end
+  end
+
+  # Check out a worker of the given pool. At most queue requests wait for a
+  # worker on this node, and a request waits at most checkout_timeout
+  # milliseconds; otherwise {:error, :busy} is returned, so that the client
+  # can retry later instead of waiting for a response.
+  def checkout(pool) do
+    if :ets.update_counter(@table, :waiting, 1) > config(:queue, 64) do
+      :ets.update_counter(@table, :waiting, -1)
+      :ets.update_counter(@table, :checkout, {4, 1})
+      {:error, :busy}
+    else
+      start = System.monotonic_time(:microsecond)
+      try do
+        {:ok, :poolboy.checkout(pool, true, config(:checkout_timeout, 5000))}
+      catch
+        :exit, {:timeout, _} ->
+          :ets.update_counter(@table, :checkout, {4, 1})
+          {:error, :busy}
+      after
+        :ets.update_counter(@table, :waiting, -1)
+        record_wait(System.monotonic_time(:microsecond) - start)
+      end
+    end
+  end
+
+  # The time in milliseconds a rejected client should wait before it retries.
+  def retry_after do
+    config(:retry_after, 1000)
+  end
+
+  # Count a started Python interpreter if less than limit interpreters run.
+  # The calling worker is monitored, the interpreter of a worker that exits
+  # without releasing it, e.g. after a Python exception, is uncounted.
+  def acquire_interpreter(limit) do
+    if :ets.update_counter(@table, :interpreters, 1) <= limit do
+      GenServer.cast(__MODULE__, {:monitor, self()})
+      true
+    else
+      :ets.update_counter(@table, :interpreters, -1)
+      false
+    end
+  end
+
+  # Count a stopped Python interpreter if more than min interpreters run.
+  def release_interpreter(min) do
+    if :ets.update_counter(@table, :interpreters, -1) >= min do
+      GenServer.cast(__MODULE__, {:demonitor, self()})
+      true
+    else
+      :ets.update_counter(@table, :interpreters, 1)
+      false
+    end
+  end
+
+  # The checkout metrics of this node: the number of checkouts, their total
+  # wait time in microseconds, the number of rejected checkouts, the wait time
+  # histogram as {upper bound in milliseconds, count} and the number of
+  # running Python interpreters.
+  def metrics do
+    [{:checkout, count, wait, rejected}] = :ets.lookup(@table, :checkout)
+    %{checkouts: count,
+      wait: wait,
+      rejected: rejected,
+      wait_histogram: for(le <- @wait_buckets,
+          do: {le, :ets.lookup_element(@table, {:wait, le}, 2)}),
+      waiting: :ets.lookup_element(@table, :waiting, 2),
+      interpreters: :ets.lookup_element(@table, :interpreters, 2)}
+  end
+
+  # Record the latency of a request handled on this node in microseconds.
+  def record_latency(time) do
+    :ets.update_counter(@table, :latency, [{2, time}, {3, 1}])
+  end
+
+  def handle_info(:publish, state) do
+    state = case local_load(state) do
+      {:ok, load, state} ->
+        :ets.insert(@table, {{:node, Node.self}, load, now()})
+        GenServer.abcast(Node.list, __MODULE__, {:load, Node.self, load})
+        state
+      :error ->
+        # The pool isn't running, e.g. while it is restarted. The load isn't
+        # published, so the other nodes rank this node behind the nodes with
+        # free workers once the last update is outdated.
+        state
+    end
+
+    Process.send_after(self(), :publish, interval())
+    {:noreply, state}
+  end
+
+  def handle_info({:nodedown, node}, state) do
+    :ets.delete(@table, {:node, node})
+    {:noreply, state}
+  end
+
+  # A worker exited with a running interpreter.
+  def handle_info({:DOWN, _ref, :process, pid, _reason}, state) do
+    case Map.pop(state.interpreters, pid) do
+      {nil, _} ->
+        {:noreply, state}
+      {_, interpreters} ->
+        :ets.update_counter(@table, :interpreters, -1)
+        {:noreply, %{state | interpreters: interpreters}}
+    end
+  end
+
+  def handle_info(_message, state) do
+    {:noreply, state}
+  end
+
+  def handle_cast({:load, node, load}, state) do
+    :ets.insert(@table, {{:node, node}, load, now()})
+    {:noreply, state}
+  end
+
+  def handle_cast({:monitor, pid}, state) do
+    interpreters = Map.put(state.interpreters, pid, Process.monitor(pid))
+    {:noreply, %{state | interpreters: interpreters}}
+  end
+
+  def handle_cast({:demonitor, pid}, state) do
+    case Map.pop(state.interpreters, pid) do
+      {nil, _} ->
+        {:noreply, state}
+      {ref, interpreters} ->
+        Process.demonitor(ref, [:flush])
+        {:noreply, %{state | interpreters: interpreters}}
+    end
+  end
+
+  # Comparing two random nodes avoids sending every new connection to the
+  # same node between two load updates.
+  defp power_of_two([node]), do: node
+  defp power_of_two(nodes) do
+    [a, b] = Enum.take_random(nodes, 2)
+    if score(a) <= score(b), do: a, else: b
+  end
+
+  # The expected time a request waits for a worker on the node, followed by
+  # the negated number of free workers. Nodes without a recent load update
+  # are ranked behind the nodes with free workers.
+  defp score(node) do
+    case :ets.lookup(@table, {:node, node}) do
+      [{_, load, time}] ->
+        if now() - time <= 3 * interval() do
+          queued = max(load.waiting - load.free + 1, 0)
+          {queued * load.latency, -load.free}
+        else
+          {0, 0}
+        end
+      [] ->
+        {0, 0}
+    end
+  end
+
+  defp local_load(state) do
+    case pool_status() do
+      {:ok, free, busy} ->
+        load = local_load(state, free, busy)
+        {:ok, load, %{state | latency: load.latency}}
+      :error ->
+        :error
+    end
+  end
+
+  defp local_load(state, free, busy) do
+    waiting = :ets.lookup_element(@table, :waiting, 2)
+
+    # Average the request latency since the last update and smooth it over
+    # the previous updates.
+    [{:latency, sum, count}] = :ets.lookup(@table, :latency)
+    :ets.update_counter(@table, :latency, [{2, -sum}, {3, -count}])
+    latency = if count > 0 do
+      0.5 * state.latency + 0.5 * sum / count
+    else
+      state.latency
+    end
+
+    %{free: free, busy: busy, waiting: waiting, latency: latency}
+  end
+
+  # The free and busy workers of the pool, :error if the pool isn't running
+  # or doesn't answer.
+  defp pool_status do
+    try do
+      {_, free, _, busy} = :poolboy.status(GymTcpApi.pool_name())
+      {:ok, free, busy}
+    catch
+      :exit, _ -> :error
+    end
+  end
+
+  defp record_wait(time) do
+    :ets.update_counter(@table, :checkout, [{2, 1}, {3, time}])
+    le = Enum.find(@wait_buckets, fn(le) -> le == :infinity or time <= le * 1000 end)
+    :ets.update_counter(@table, {:wait, le}, 1)
+  end
+
+  defp interval do
+    config(:load_interval, 1000)
+  end
+
+  defp config(key, default) do
+    Application.get_env(:gym_tcp_api, key, default)
+  end
+
+  defp now do
+    System.monotonic_time(:millisecond)
+  end
 end
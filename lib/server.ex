@@ -34,19 +34,22 @@ defmodule GymTcpApi.Server do
   defp serve(socket) do
     case :gen_tcp.recv(socket, 0, 5000) do
       {:ok, data} = _ ->
-        node = NodeManager.random_node(data)
+        node = NodeManager.select_node(data)
         current = self()
 
-        if Application.get_env(:gym_tcp_api, :distributed) == true do
+        if Application.get_env(:gym_tcp_api, :distributed) == true and
+            node != Node.self do
           Node.spawn(node, __MODULE__, :pool_process, [data, current])
-        else
-          pool_process(data, current)
-        end
 
-        receive do
-          {:response, response, worker} ->
-            write_line(socket, {:ok, response});
-            handle(socket, worker)
+          receive do
+            {:response, response, worker} ->
+              write_line(socket, {:ok, response});
+              handle(socket, worker)
+            {:busy, retry_after} ->
+              busy(socket, retry_after)
+          end
+        else
+          pool_session(data, socket)
         end
       {:error, :timeout} = _ ->
         exit(:shutdown);
@@ -85,15 +88,41 @@ defmodule GymTcpApi.Server do
     :gen_tcp.recv(socket, 0)
   end
 
+  # The responses are binaries, an empty response is not sent.
+  def write_line(_socket, {:ok, ""}) do
+    :ok
+  end
+
   def write_line(socket, {:ok, text}) do
-    if String.trim(to_string(text)) === "" do
-    else
-      :gen_tcp.send(socket, text)
+    :gen_tcp.send(socket, text)
+  end
+
+  defp busy(socket, retry_after) do
+    write_line(socket, {:ok, "{\"error\": \"busy\", \"retry_after\": " <>
+        Integer.to_string(retry_after) <> "}\r\n\r\n"})
+    :gen_tcp.close(socket)
+    exit(:shutdown);
+  end
+
+  # Hand the connection over to a worker on this node, which serves the
+  # remaining requests itself.
+  defp pool_session(data, socket) do
+    case NodeManager.checkout(GymTcpApi.pool_name()) do
+      {:ok, worker} ->
+        :ok = :gen_tcp.controlling_process(socket, worker)
+        GymTcpApi.Worker.session(worker, data, socket)
+        exit(:shutdown);
+      {:error, :busy} ->
+        busy(socket, NodeManager.retry_after())
     end
   end
 
   def pool_process(data, caller) do
-    worker = :poolboy.checkout(:gym_pool)
-    spawn(fn() -> GymTcpApi.Worker.process(worker, data, caller) end)
+    case NodeManager.checkout(GymTcpApi.pool_name()) do
+      {:ok, worker} ->
+        spawn(fn() -> GymTcpApi.Worker.process(worker, data, caller) end)
+      {:error, :busy} ->
+        send(caller, {:busy, NodeManager.retry_after()})
+    end
   end
 end
@@ -11,6 +11,7 @@ defmodule GymTcpApi.Worker do
   require Logger
 
   alias Application, as: App
+  alias GymTcpApi.NodeManager
 
   def start_link(_args) do
     priv_path = App.app_dir(:gym_tcp_api, "priv") |> to_charlist
@@ -18,26 +19,145 @@ defmodule GymTcpApi.Worker do
   end
 
   def init(python_path) do
-    :python.start_link(python_path: python_path)
+    state = %{python_path: python_path, python: nil}
+
+    # The first min workers start the Python interpreter right away, the
+    # others once they are checked out.
+    if NodeManager.acquire_interpreter(App.get_env(:gym_tcp_api, :worker)) do
+      {:ok, start_python(state)}
+    else
+      {:ok, state}
+    end
+  end
+
+  # Serve the connection of a client on this node: the worker reads the
+  # requests from the socket and writes the responses to it, so they don't
+  # pass through the server process.
+  def handle_call({:session, data, socket}, _from, state) do
+    state = ensure_python(state)
+    serve(socket, data, state)
+    {:reply, :ok, state, idle_timeout()}
   end
 
-  def handle_call({data, caller}, _, python) do
-    response = :python.call(python, :worker, :process_response, [data])
+  def handle_call({data, caller}, from, state) do
+    state = ensure_python(state)
+    response = call_python(state, data)
 
     current = self()
     send(caller, {:response, response, current})
 
     receive do
       {:data, message, _c } ->
-          handle_call({message, caller}, :ok, python);
-      {:close, _message} -> :python.call(python, :worker, :process_response, [""])
+          handle_call({message, caller}, from, state);
+      {:close, _message} ->
+          :python.call(state.python, :worker, :process_response, [""])
+          {:reply, [""], state, idle_timeout()}
     end
+  end
+
+  # Stop the interpreter of a worker that was idle for worker_idle
+  # milliseconds, as long as more than the min number of interpreters run.
+  def handle_info(:timeout, %{python: python} = state) when python != nil do
+    if NodeManager.release_interpreter(App.get_env(:gym_tcp_api, :worker)) do
+      :python.stop(python)
+      {:noreply, %{state | python: nil}}
+    else
+      {:noreply, state}
+    end
+  end
 
-    {:reply, [""], python}
+  def handle_info(_message, state) do
+    {:noreply, state}
   end
 
   def process(pid, data, caller) do
-    :gen_server.call(pid, {data, caller});
+    :gen_server.call(pid, {data, caller}, :infinity);
     :poolboy.checkin(GymTcpApi.pool_name(), pid)
   end
+
+  def session(pid, data, socket) do
+    :gen_server.call(pid, {:session, data, socket}, :infinity);
+    :poolboy.checkin(GymTcpApi.pool_name(), pid)
+  end
+
+  defp serve(socket, data, state) do
+    GymTcpApi.Server.write_line(socket, {:ok, call_python(state, data)})
+
+    case :gen_tcp.recv(socket, 0, 5000) do
+      {:ok, data} ->
+        serve(socket, data, state)
+      {:error, _} ->
+        :python.call(state.python, :worker, :process_response, [""])
+        :gen_tcp.close(socket)
+    end
+  end
+
+  defp call_python(state, data) do
+    # The stats response of the Python worker includes the checkout metrics
+    # of this node.
+    if :binary.match(data, "\"stats\"") != :nomatch do
+      send_metrics(state)
+    end
+
+    {time, response} = :timer.tc(:python, :call,
+        [state.python, :worker, :process_response, [data]])
+    NodeManager.record_latency(time)
+    response
+  end
+
+  defp send_metrics(state) do
+    metrics = NodeManager.metrics()
+    :python.call(state.python, :worker, :configure_checkout, [
+        metrics.checkouts,
+        metrics.wait,
+        metrics.rejected,
+        for({_, count} <- metrics.wait_histogram, do: count),
+        metrics.waiting,
+        metrics.interpreters])
+  end
+
+  defp ensure_python(%{python: nil} = state) do
+    NodeManager.acquire_interpreter(:infinity)
+    start_python(state)
+  end
+
+  defp ensure_python(state) do
+    state
+  end
+
+  defp start_python(state) do
+    {:ok, python} = :python.start_link(python_path: state.python_path)
+
+    # Pre-warm the configured environments, so that the first create on this
+    # worker doesn't have to construct them.
+    env_pool = App.get_env(:gym_tcp_api, :env_pool, [])
+    :python.call(python, :worker, :configure_pool, [
+        Keyword.get(env_pool, :size, 0),
+        Keyword.get(env_pool, :ttl, 300),
+        Keyword.get(env_pool, :prewarm, [])])
+    instances = App.get_env(:gym_tcp_api, :instances, [])
+    :python.call(python, :worker, :configure_registry, [
+        Keyword.get(instances, :ttl, 3600),
+        Keyword.get(instances, :max, 0),
+        Keyword.get(instances, :max_rss, 0)])
+    :python.call(python, :worker, :configure_sessions, [
+        App.get_env(:gym_tcp_api, :snapshots, 16)])
+    :python.call(python, :worker, :configure_recorder, [
+        App.get_env(:gym_tcp_api, :record_dir) ||
+            Path.join(System.tmp_dir!(), "gym/trajectories"),
+        App.get_env(:gym_tcp_api, :record_shard_size, 10_000)])
+    :python.call(python, :worker, :configure_json, [
+        App.get_env(:gym_tcp_api, :json, "stdlib")])
+    :python.call(python, :worker, :configure_stats, [
+        App.get_env(:gym_tcp_api, :stats, false)])
+    :python.call(python, :worker, :configure_logging, [
+        App.get_env(:gym_tcp_api, :log_level, "WARNING"),
+        App.get_env(:gym_tcp_api, :log_sample, "")])
+
+    %{state | python: python}
+  end
+
+  defp idle_timeout do
+    App.get_env(:gym_tcp_api, :worker_idle, 60_000)
+  end
 end
@@ -0,0 +1,152 @@
+"""
+  @file encoding.py
+
+  Binary encoding of the observations, used instead of the JSON encoding if
+  the client requested it with {"server": {"encoding": "binary"}}.
+
+  A binary frame starts with the length of the following body as uint32. The
+  body is compressed with the stream compressor of the connection if a
+  compression level is set and consists of (all values little endian):
+
+    uint8   dtype code of the observation (see DTYPES)
+    uint8   flags, bit 0 is the done flag and bit 1 marks a delta frame
+    uint16  number of dimensions
+    float64 reward
+    uint32  length of the meta data
+    uint32  shape, one value per dimension
+    bytes   meta data encoded as JSON, e.g. {"info": {}}
+    bytes   observation data in C order
+
+  The observation of a delta frame holds the changed values as 1-D array,
+  followed by their indices into the C order observation as uint32 values (see
+  DeltaEncoder).
+"""
+
+import struct
+import numpy as np
+
+try:
+  import zlib
+except ImportError:
+  pass
+
+# The index of a type is the dtype code sent to the client, so new types have
+# to be appended.
+DTYPES = (np.float64, np.float32, np.uint8, np.int8, np.int16, np.uint16,
+    np.int32, np.uint32, np.int64, np.uint64)
+
+DTYPE_CODES = dict((np.dtype(t), code) for code, t in enumerate(DTYPES))
+
+LENGTH = struct.Struct("<I")
+HEADER = struct.Struct("<BBHdI")
+
+
+"""
+  Streaming zlib compressor of a connection. The compression state is kept
+  across the messages, so that consecutive observations can refer to each
+  other, and each message is completed with Z_SYNC_FLUSH so that the client can
+  decompress it as soon as it arrives. The compressed messages are
+  length-prefixed like the binary frames, since the "\r\n\r\n" delimiter can
+  appear inside the compressed data.
+"""
+class StreamCompressor(object):
+  def __init__(self, level):
+    if not 0 <= level <= 9:
+      raise ValueError("Invalid compression level {}".format(level))
+
+    self.level = level
+    self.compressor = zlib.compressobj(level)
+
+  def compress(self, data):
+    data = self.compressor.compress(data) + self.compressor.flush(
+        zlib.Z_SYNC_FLUSH)
+    return LENGTH.pack(len(data)) + data
+
+
+"""
+  Return a view of the observation in the element order of the C++ client,
+  which stores a single observation in Fortran order (e.g. an image as one
+  column-major matrix per channel) and a batch with one flattened observation
+  per column.
+"""
+def client_order(observation, batch = False):
+  observation = np.asarray(observation)
+  return observation if batch else observation.T
+
+
+"""
+  Delta encoding of the observations of an instance. Instead of the full
+  observation only the changed values and their indices are sent, relative to
+  the last observation sent. The indices refer to the flattened observation in
+  the element order of the C++ client (see client_order). A full observation
+  (keyframe) is sent after interval deltas, after a reset, or if the delta
+  wouldn't be smaller than the observation.
+"""
+class DeltaEncoder(object):
+  def __init__(self, interval = 30, batch = False):
+    self.interval = interval
+    self.batch = batch
+    self.last = None
+    self.count = 0
+
+  # Store the observation sent as keyframe.
+  def keyframe(self, observation):
+    self.last = np.array(client_order(observation, self.batch), order="C")
+    self.count = 0
+
+  # Send the next observation as keyframe, e.g. if the client lost its copy.
+  def clear(self):
+    self.last = None
+
+  # Return the changed indices and values of the given observation, or None
+  # if the observation has to be sent as keyframe.
+  def encode(self, observation):
+    ordered = client_order(observation, self.batch)
+    if (self.last is None or self.count >= self.interval or
+        ordered.shape != self.last.shape or
+        ordered.dtype != self.last.dtype):
+      self.keyframe(observation)
+      return None
+
+    index = np.flatnonzero(ordered != self.last)
+    if index.size * (ordered.itemsize + 4) >= ordered.nbytes:
+      self.keyframe(observation)
+      return None
+
+    values = ordered.reshape(-1)[index]
+    self.last.reshape(-1)[index] = values
+    self.count += 1
+    return index.astype(np.uint32), values
+
+
+def encode_observation(observation, reward, done, meta, compressor = None,
+    index = None):
+  observation = np.asarray(observation)
+  if observation.dtype == np.bool_:
+    observation = observation.view(np.uint8)
+  elif observation.dtype not in DTYPE_CODES:
+    observation = observation.astype(np.float64)
+
+  observation = np.ascontiguousarray(observation)
+  meta = meta.encode()
+
+  # The observation of a delta frame holds the changed values, the indices
+  # follow.
+  flags = int(bool(done))
+  index_data = b""
+  if index is not None:
+    flags |= 2
+    index_data = np.ascontiguousarray(index, dtype="<u4").data
+
+  body = b"".join((
+      HEADER.pack(DTYPE_CODES[observation.dtype], flags, observation.ndim,
+          float(reward), len(meta)),
+      struct.pack("<%dI" % observation.ndim, *observation.shape),
+      meta,
+      observation.data,
+      index_data))
+
+  if compressor is not None:
+    return compressor.compress(body)
+
+  return LENGTH.pack(len(body)) + body
@@ -0,0 +1,745 @@
+"""
+  @file environments.py
+
+  Container and manager for the environments, shared by python/server.py and
+  the Elixir worker.
+"""
+
+import json
+import logging
+import os
+import time
+import uuid
+import threading
+import itertools
+import collections
+import numpy as np
+
+import gym
+from gym import spaces
+from gym.wrappers import RecordEpisodeStatistics
+
+import shm
+import snapshot
+from recorder import TrajectoryRecorder
+import serialization
+from encoding import DeltaEncoder
+from preprocessing import create_preprocessing
+
+logger = logging.getLogger("gym_tcp_api.environments")
+
+"""
+  Warm pool of constructed environments per environment id. Closed instances
+  are returned to the pool instead of being destroyed, so that a following
+  create doesn't have to load the ROMs or models again. The pool holds at most
+  size idle environments per id, each for at most ttl seconds. The memory of
+  an environment, estimated as the growth of the RSS while it was constructed,
+  is kept with it, so that a reused environment is charged the same memory.
+"""
+class EnvPool(object):
+  def __init__(self, size=0, ttl=300):
+    self.size = size
+    self.ttl = ttl
+    self.idle = {}
+    self.lock = threading.Lock()
+
+  # Return an environment of the given id and its memory in bytes.
+  def acquire(self, env_id):
+    with self.lock:
+      expired = self._expire()
+      envs = self.idle.get(env_id)
+      entry = envs.pop() if envs else None
+
+    for e in expired:
+      e.close()
+
+    if entry is None:
+      return self._make(env_id)
+
+    _, env, memory = entry
+    env.reset()
+    return env, memory
+
+  def release(self, env_id, env, memory=0):
+    with self.lock:
+      envs = self.idle.setdefault(env_id, [])
+      if len(envs) < self.size:
+        envs.append((time.time(), env, memory))
+        env = None
+      expired = self._expire()
+
+    if env is not None:
+      env.close()
+    for e in expired:
+      e.close()
+
+  def prewarm(self, env_id):
+    with self.lock:
+      missing = self.size - len(self.idle.get(env_id, []))
+
+    for _ in range(missing):
+      self.release(env_id, *self._make(env_id))
+
+  def _make(self, env_id):
+    rss = process_rss()
+    env = gym.make(env_id)
+    return env, process_rss() - rss if rss is not None else 0
+
+  # Remove the environments that were idle for longer than ttl seconds, the
+  # caller closes them outside of the lock.
+  def _expire(self):
+    deadline = time.time() - self.ttl
+    expired = []
+    for env_id, envs in self.idle.items():
+      while envs and envs[0][0] < deadline:
+        expired.append(envs.pop(0)[1])
+    return expired
+
+pool = EnvPool()
+
+"""
+  LRU cache of the encoded space descriptions, keyed by environment id,
+  preprocessing, space name and JSON backend.
+"""
+class SpaceCache(object):
+  def __init__(self, size=128):
+    self.size = size
+    self.entries = collections.OrderedDict()
+    self.lock = threading.Lock()
+
+  def get(self, key, create):
+    with self.lock:
+      data = self.entries.get(key)
+      if data is not None:
+        self.entries.move_to_end(key)
+        return data
+
+    data = create()
+    with self.lock:
+      self.entries[key] = data
+      while len(self.entries) > self.size:
+        self.entries.popitem(last=False)
+    return data
+
+space_cache = SpaceCache()
+
+"""
+  The resident set size of the process in bytes, None if it is unknown.
+"""
+def process_rss():
+  try:
+    with open("/proc/self/statm") as statm:
+      return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+  except (OSError, ValueError, IndexError, AttributeError):
+    return None
+
+"""
+  Registry of the instances of all Envs of the process, with the time each
+  instance was last used and its memory, estimated as the growth of the RSS
+  while it was created. Instances idle for longer than ttl seconds are
+  closed. Before an instance is created the least recently used instances
+  are closed while there are max_instances instances or the RSS exceeds
+  max_rss bytes; 0 disables a limit. An instance that is in use by a request
+  is never closed.
+"""
+class InstanceRegistry(object):
+  def __init__(self, ttl=0, max_instances=0, max_rss=0):
+    self.envs = {}
+    self.last_used = {}
+    self.memory = {}
+    self.lock = threading.Lock()
+    self.wakeup = threading.Event()
+    self.thread = None
+    self.configure(ttl, max_instances, max_rss)
+
+  def configure(self, ttl, max_instances, max_rss):
+    self.ttl = ttl
+    self.max_instances = max_instances
+    self.max_rss = max_rss
+    if ttl > 0 and (self.thread is None or not self.thread.is_alive()):
+      self.thread = threading.Thread(target=self._run, daemon=True)
+      self.thread.start()
+    self.wakeup.set()
+
+  def add(self, instance_id, envs, memory):
+    with self.lock:
+      self.envs[instance_id] = envs
+      self.memory[instance_id] = max(memory, 0)
+      self.last_used[instance_id] = time.monotonic()
+
+  # Called on every use of an instance, a single dict store.
+  def touch(self, instance_id):
+    self.last_used[instance_id] = time.monotonic()
+
+  def remove(self, instance_id):
+    with self.lock:
+      self.envs.pop(instance_id, None)
+      self.memory.pop(instance_id, None)
+      self.last_used.pop(instance_id, None)
+
+  # Close the least recently used instances to make room for a new one. The
+  # instances are passed once; closing an instance doesn't necessarily return
+  # its memory to the system, the RSS may stay above max_rss. Instances
+  # without an estimated memory are only closed for max_instances.
+  def reserve(self):
+    excess_instances = 0
+    if self.max_instances > 0:
+      excess_instances = len(self.envs) - self.max_instances + 1
+
+    excess_memory = 0
+    rss = process_rss() if self.max_rss > 0 else None
+    if rss is not None:
+      excess_memory = rss - self.max_rss
+
+    if excess_instances > 0 or excess_memory > 0:
+      for instance_id in self._least_recently_used():
+        if excess_instances <= 0 and excess_memory <= 0:
+          break
+        memory = self.memory.get(instance_id, 0)
+        if excess_instances <= 0 and memory == 0:
+          continue
+        if self._evict(instance_id, "limit"):
+          excess_instances -= 1
+          excess_memory -= memory
+          if excess_memory > 0:
+            excess_memory = min(excess_memory, process_rss() - self.max_rss)
+
+    if self.max_instances > 0 and len(self.envs) >= self.max_instances:
+      raise InvalidUsage("The server has reached its limit of {} "
+          "instances".format(self.max_instances), 503, error="limit")
+
+  # Close the instances that were idle for longer than ttl seconds.
+  def expire(self):
+    deadline = time.monotonic() - self.ttl
+    for instance_id in self._least_recently_used():
+      if self.last_used.get(instance_id, deadline) >= deadline:
+        break
+      self._evict(instance_id, "idle")
+
+  # The number of instances, their estimated memory and the RSS of the
+  # process in bytes.
+  def info(self):
+    with self.lock:
+      return {"instances" : len(self.envs),
+              "memory" : sum(self.memory.values()),
+              "rss" : process_rss()}
+
+  # The info as gauges in the Prometheus text exposition format.
+  def prometheus(self):
+    info = self.info()
+    lines = []
+    for key, name in (("instances", "gym_instances"),
+                      ("memory", "gym_instance_memory_bytes"),
+                      ("rss", "gym_process_rss_bytes")):
+      if info[key] is not None:
+        lines.append("# TYPE " + name + " gauge")
+        lines.append("{} {}".format(name, info[key]))
+    return "\n".join(lines) + "\n"
+
+  def _least_recently_used(self):
+    with self.lock:
+      return sorted(self.last_used, key=self.last_used.get)
+
+  # Close the instance unless a request of its connection is running.
+  def _evict(self, instance_id, reason):
+    envs = self.envs.get(instance_id)
+    if envs is None or not envs.lock.acquire(blocking=False):
+      return False
+    try:
+      envs.evict(instance_id)
+    finally:
+      envs.lock.release()
+
+    logger.info("instance evicted", extra={"instance" : instance_id,
+        "reason" : reason})
+    return True
+
+  def _run(self):
+    while self.ttl > 0:
+      self.wakeup.wait(max(self.ttl / 4.0, 1.0))
+      self.wakeup.clear()
+      if self.ttl > 0:
+        self.expire()
+
+registry = InstanceRegistry()
+
+"""
+  Flatten the given values into a list, infinite values are replaced with
+  +-1e100 to keep the JSON compliant.
+"""
+def _export_values(values):
+  values = np.array(values).flatten()
+  if values.dtype.kind == "f":
+    values = values.astype(np.float64)
+    values[values == -np.inf] = -1e100
+    values[values == +np.inf] = +1e100
+  return values.tolist()
+
+"""
+  Container and manager for the environments instantiated
+  on this server. The Envs class is based on the gym-http-api project
+  @misc{gymhttpapi2016,
+    title = {OpenAI gym-http-api},
+    year = {2016},
+    publisher = {GitHub},
+    journal = {GitHub repository},
+    howpublished = {https://github.com/openai/gym-http-api}
+  }
+"""
+class Envs(object):
+  # The number of snapshots kept per instance.
+  snapshot_limit = 16
+
+  def __init__(self, env_pool=None):
+    self.envs = {}
+    self.id_len = 13
+    self.pool = env_pool if env_pool is not None else pool
+    # Environment id, unwrapped environment and memory of the pooled
+    # instances.
+    self.pooled = {}
+    # Key of the cached space descriptions, the environment id and the
+    # preprocessing of the instance.
+    self.space_keys = {}
+    # Shared memory rings of the instances using the shm transport.
+    self.rings = {}
+    # Delta encoders of the instances using delta encoded observations.
+    self.deltas = {}
+    # The last observation and the LRU of the snapshots of the instances.
+    self.observations = {}
+    self.snapshots = {}
+    self.snapshot_ids = itertools.count(1)
+    # Trajectory recorders of the recorded instances.
+    self.recorders = {}
+    # Instances closed by the registry, their requests get an error.
+    self.evicted = set()
+    # Held while a request uses the instances, the registry doesn't close an
+    # instance in use.
+    self.lock = threading.RLock()
+
+  def _lookup_env(self, instance_id):
+    try:
+      env = self.envs[instance_id]
+    except KeyError:
+      if instance_id in self.evicted:
+        raise InstanceEvicted(instance_id)
+      return None
+    registry.touch(instance_id)
+    return env
+
+  def _remove_env(self, instance_id):
+    try:
+      del self.envs[instance_id]
+    except KeyError:
+      raise InvalidUsage('Instance_id {} unknown'.format(instance_id))
+
+  def _is_vector(self, env):
+    return isinstance(env, gym.vector.VectorEnv)
+
+  # Create an instance of the given environment. The optional preprocessing
+  # steps are applied to the observations (see preprocessing.py).
+  def create(self, env_id, num_envs=None, preprocess=None):
+    registry.reserve()
+    rss = process_rss()
+
+    wrap = None
+    memory = 0
+    try:
+      if preprocess:
+        wrap = create_preprocessing(preprocess)
+
+      if num_envs is None:
+        env, memory = self.pool.acquire(env_id)
+      else:
+        # The copies are stepped in a batch and reset automatically once they
+        # are done.
+        env = gym.vector.make(env_id, num_envs=int(num_envs),
+            asynchronous=False, wrappers=wrap)
+    except gym.error.Error:
+      raise InvalidUsage(
+          "Attempted to look up malformed environment ID '{}'".format(env_id))
+    except ValueError as e:
+      raise InvalidUsage(str(e))
+
+    instance_id = str(uuid.uuid4().hex)[:self.id_len]
+    if num_envs is None:
+      self.pooled[instance_id] = (env_id, env, memory)
+      if wrap is not None:
+        try:
+          env = wrap(env)
+        except ValueError as e:
+          self.pool.release(*self.pooled.pop(instance_id))
+          raise InvalidUsage(str(e))
+
+    self.envs[instance_id] = env
+    self.space_keys[instance_id] = (env_id,
+        json.dumps(preprocess, sort_keys=True) if preprocess else None)
+    # A reused environment is charged the memory of its construction.
+    growth = process_rss() - rss if rss is not None else 0
+    registry.add(instance_id, self, max(growth, memory))
+    return instance_id
+
+  def reset(self, instance_id, jsonable=True):
+    env = self._lookup_env(instance_id)
+    obs = self.observations[instance_id] = env.reset()
+    recorder = self.recorders.get(instance_id)
+    if recorder is not None:
+      recorder.end_episode()
+    if not jsonable:
+      return obs
+    return env.observation_space.to_jsonable(obs)
+
+  def step(self, instance_id, action, render, jsonable=True):
+    env = self._lookup_env(instance_id)
+    if self._is_vector(env):
+      return self._step_vector(env, action, render, jsonable)
+
+    action_from_json = env.action_space.from_jsonable(action)
+    if (not isinstance(action_from_json, (list))):
+      action_from_json = int(action_from_json)
+
+    if render: env.render()
+    [observation, reward, done, info] = env.step(action_from_json)
+    recorder = self.recorders.get(instance_id)
+    if recorder is not None and instance_id in self.observations:
+      recorder.append(self.observations[instance_id], action_from_json,
+          reward, done)
+    self.observations[instance_id] = observation
+    if not jsonable:
+      return [observation, reward, done, info]
+
+    obs_jsonable = env.observation_space.to_jsonable(observation)
+    return [obs_jsonable, reward, done, info]
+
+  # Step through the environment using each of the given actions until the
+  # episode is done. Returns the last observation, the accumulated reward and,
+  # if requested, every intermediate transition.
+  def step_sequence(self, instance_id, actions, render, transitions=False,
+      jsonable=True):
+    env = self._lookup_env(instance_id)
+    if self._is_vector(env):
+      raise InvalidUsage("Action sequences are not supported for batched "
+          "instances")
+    if len(actions) == 0:
+      raise InvalidUsage("The action sequence is empty")
+
+    steps = []
+    total_reward = 0.0
+    for action in actions:
+      [observation, reward, done, info] = self.step(
+          instance_id, action, render, jsonable=False)
+
+      total_reward += reward
+      if transitions:
+        steps.append({"observation" : observation,
+                      "reward" : reward,
+                      "done" : done,
+                      "info" : info})
+      if done:
+        break
+
+    if jsonable:
+      observation = self.to_jsonable(instance_id, observation, steps)
+
+    return [observation, total_reward, done, info, steps]
+
+  # Convert the observation, and the observations of the given transitions,
+  # of the instance into JSON serializable values. Box observations are kept
+  # as arrays if the JSON backend serializes them natively.
+  def to_jsonable(self, instance_id, observation, steps=()):
+    to_jsonable = self._to_jsonable_function(instance_id)
+    for step in steps:
+      step["observation"] = to_jsonable(step["observation"])
+    return to_jsonable(observation)
+
+  # Convert only the observations of the transitions, for the responses which
+  # encode the observation itself in another way.
+  def transitions_to_jsonable(self, instance_id, steps):
+    to_jsonable = self._to_jsonable_function(instance_id)
+    for step in steps:
+      step["observation"] = to_jsonable(step["observation"])
+
+  def _to_jsonable_function(self, instance_id):
+    space = self._lookup_env(instance_id).observation_space
+    if serialization.native_numpy() and isinstance(space, spaces.Box):
+      return serialization.array
+    return space.to_jsonable
+
+  # The environment id of the instance, None if the instance is unknown.
+  def get_env_id(self, instance_id):
+    key = self.space_keys.get(instance_id)
+    return None if key is None else key[0]
+
+  # The number of environments of a batched instance, None otherwise.
+  def get_num_envs(self, instance_id):
+    env = self._lookup_env(instance_id)
+    return env.num_envs if self._is_vector(env) else None
+
+  def _step_vector(self, env, action, render, jsonable):
+    space = env.single_action_space
+    actions = np.asarray(action, dtype=space.dtype).reshape(
+        (env.num_envs,) + space.shape)
+
+    if render: env.render()
+    [observation, reward, done, info] = env.step(actions)
+    if not jsonable:
+      return [observation, reward, done, info]
+
+    obs_jsonable = env.observation_space.to_jsonable(observation)
+    return [obs_jsonable, reward, done, info]
+
+  def seed(self, instance_id, s):
+    env = self._lookup_env(instance_id)
+    env.seed(int(s))
+
+  # Snapshot the state of the instance and return the id of the snapshot.
+  # At most snapshot_limit snapshots are kept per instance, the least recently
+  # used one is dropped first.
+  def snapshot(self, instance_id):
+    env = self._lookup_env(instance_id)
+    if env is None:
+      raise InvalidUsage('Instance_id {} unknown'.format(instance_id))
+    if self._is_vector(env):
+      raise InvalidUsage("Snapshots are not supported for batched instances")
+
+    snapshots = self.snapshots.setdefault(
+        instance_id, collections.OrderedDict())
+    try:
+      state = snapshot.capture(env, self.observations.get(instance_id))
+    except ValueError as e:
+      raise InvalidUsage(str(e))
+    snapshot_id = next(self.snapshot_ids)
+    snapshots[snapshot_id] = state
+    while len(snapshots) > self.snapshot_limit:
+      snapshots.popitem(last=False)
+    return snapshot_id
+
+  # Restore the state of the given snapshot and return its observation.
+  def restore(self, instance_id, snapshot_id):
+    snapshots = self.snapshots.get(instance_id)
+    state = snapshots.get(snapshot_id) if snapshots is not None else None
+    if state is None:
+      raise InvalidUsage('Snapshot {} unknown'.format(snapshot_id), 404,
+          {"snapshot" : snapshot_id}, "unknown_snapshot")
+    snapshots.move_to_end(snapshot_id)
+
+    try:
+      observation = snapshot.restore(self._lookup_env(instance_id), state)
+    except ValueError as e:
+      raise InvalidUsage(str(e))
+    self.observations[instance_id] = observation
+    return observation
+
+  def get_action_space_info(self, instance_id):
+    env = self._lookup_env(instance_id)
+    return self._get_space_properties(
+        getattr(env, "single_action_space", env.action_space))
+
+  def get_action_space_response(self, instance_id):
+    return self._get_space_response(instance_id, "action_space")
+
+  def get_action_space_sample(self, instance_id):
+    env = self._lookup_env(instance_id)
+    return env.action_space.sample()
+
+  def get_observation_space_info(self, instance_id):
+    env = self._lookup_env(instance_id)
+    return self._get_space_properties(
+        getattr(env, "single_observation_space", env.observation_space))
+
+  def get_observation_space_response(self, instance_id):
+    return self._get_space_response(instance_id, "observation_space")
+
+  # Return the JSON encoded {"info": ...} response describing the given space
+  # of the instance as bytes. The description only depends on the environment
+  # id and the preprocessing, so it is encoded once per JSON backend and
+  # served from the cache afterwards.
+  def _get_space_response(self, instance_id, name):
+    env = self._lookup_env(instance_id)
+    space = getattr(env, "single_" + name, getattr(env, name))
+
+    def encode():
+      return serialization.dumps(
+          {"info" : self._get_space_properties(space)}).encode()
+
+    key = self.space_keys.get(instance_id)
+    if key is None:
+      return encode()
+    return space_cache.get(key + (name, serialization.name()), encode)
+
+  def _get_space_properties(self, space):
+    info = {}
+    info['name'] = space.__class__.__name__
+    if info['name'] == 'Discrete':
+      info['n'] = int(space.n)
+    elif info['name'] == 'Box':
+      info['shape'] = [int(x) for x in space.shape]
+      # It's not JSON compliant to have Infinity, -Infinity, NaN.
+      # Many newer JSON parsers allow it, but many don't. Notably python json
+      # module can read and write such floats. So we only here fix
+      # "export version", also make it flat.
+      info['low'] = _export_values(space.low)
+      info['high'] = _export_values(space.high)
+    elif info['name'] == 'HighLow':
+      info['num_rows'] = space.num_rows
+      info['matrix'] = _export_values(space.matrix)
+    elif info['name'] == 'MultiDiscrete':
+      info['n'] = space.num_discrete_space
+      info['low'] = _export_values(space.low)
+      info['high'] = _export_values(space.high)
+    return info
+
+  # Create the shared memory ring the observations of the instance are written
+  # to, replacing the existing one.
+  def attach_shared_memory(self, instance_id, slots):
+    env = self._lookup_env(instance_id)
+    if env is None:
+      raise InvalidUsage('Instance_id {} unknown'.format(instance_id))
+
+    if shm.shared_memory is None:
+      raise InvalidUsage("The shm transport requires Python >= 3.8")
+
+    self.detach_shared_memory(instance_id)
+    ring = shm.SharedMemoryRing(env.observation_space.shape,
+        self._is_vector(env), slots)
+    self.rings[instance_id] = ring
+    return ring
+
+  def detach_shared_memory(self, instance_id):
+    ring = self.rings.pop(instance_id, None)
+    if ring is not None:
+      ring.close()
+
+  def get_shared_memory(self, instance_id):
+    return self.rings.get(instance_id)
+
+  # Send the observations of the instance as deltas to the last observation
+  # sent, with a keyframe after the given number of deltas. An interval of 0
+  # disables the delta encoding.
+  def set_delta(self, instance_id, interval):
+    self.deltas.pop(instance_id, None)
+    if interval <= 0:
+      return
+
+    env = self._lookup_env(instance_id)
+    if env is None:
+      raise InvalidUsage('Instance_id {} unknown'.format(instance_id))
+    if not isinstance(env.observation_space, gym.spaces.Box):
+      raise InvalidUsage("Delta encoded observations require a Box "
+          "observation space")
+    self.deltas[instance_id] = DeltaEncoder(interval, self._is_vector(env))
+
+  def get_delta(self, instance_id):
+    return self.deltas.get(instance_id)
+
+  def record_episode_stats(self, instance_id):
+    env = self._lookup_env(instance_id)
+    self.envs[instance_id] = RecordEpisodeStatistics(env)
+
+  # Record the transitions of the instance, the shards are written to the
+  # directory of the recording (see recorder.py).
+  def record_trajectory(self, instance_id, shard_size=None):
+    env = self._lookup_env(instance_id)
+    if env is None:
+      raise InvalidUsage('Instance_id {} unknown'.format(instance_id))
+    if self._is_vector(env):
+      raise InvalidUsage("Trajectory recording is not supported for batched "
+          "instances")
+
+    if instance_id not in self.recorders:
+      if shard_size is not None and (not isinstance(shard_size, int)
+          or isinstance(shard_size, bool) or shard_size < 1):
+        raise InvalidUsage("Invalid shard size {}".format(shard_size))
+      # The directory of the recording may not be writable.
+      try:
+        self.recorders[instance_id] = TrajectoryRecorder(instance_id,
+            shard_size)
+      except OSError as e:
+        raise InvalidUsage("Recording failed: {}".format(e), 500)
+    return self.recorders[instance_id].info()
+
+  # The shards and episodes of the recording, None if the instance isn't
+  # recorded.
+  def get_trajectory_info(self, instance_id):
+    recorder = self.recorders.get(instance_id)
+    return None if recorder is None else recorder.info()
+
+  # Stop the recording, the remaining transitions are written before the
+  # shards and episodes are returned. A failed shard write is an error, which
+  # holds the recording with the failed shards.
+  def stop_trajectory(self, instance_id):
+    recorder = self.recorders.pop(instance_id, None)
+    if recorder is None:
+      return None
+    recorder.end_episode()
+    info = recorder.info(wait=True)
+    if info["failed"]:
+      raise InvalidUsage("Recording failed: {}".format(
+          info["failed"][0]["error"]), 500, {"trajectory" : info})
+    return info
+
+  def env_close(self, instance_id):
+    with self.lock:
+      self._env_close(instance_id)
+
+  def _env_close(self, instance_id):
+    env = self.envs.get(instance_id)
+
+    if env != None:
+      registry.remove(instance_id)
+      if instance_id in self.pooled:
+        # Return the environment without the wrappers added by the client.
+        self.pool.release(*self.pooled.pop(instance_id))
+      else:
+        env.close()
+      self.space_keys.pop(instance_id, None)
+      self.detach_shared_memory(instance_id)
+      self.deltas.pop(instance_id, None)
+      self.observations.pop(instance_id, None)
+      self.snapshots.pop(instance_id, None)
+      recorder = self.recorders.pop(instance_id, None)
+      if recorder is not None:
+        recorder.flush()
+      self._remove_env(instance_id)
+
+  # Close an instance for the registry, which holds the lock. The following
+  # requests of the instance get an error instead of an unknown instance.
+  def evict(self, instance_id):
+    self._env_close(instance_id)
+    self.evicted.add(instance_id)
+
+  def env_close_all(self):
+    for key in list(self.envs.keys()):
+        self.env_close(key)
+
+"""
+  Error handling. The error code, the message and the payload are sent to the
+  client as error response (see Session.handle).
+"""
+class InvalidUsage(Exception):
+  status_code = 400
+  error = "invalid"
+  def __init__(self, message, status_code=None, payload=None, error=None):
+    Exception.__init__(self, message)
+    self.message = message
+    if status_code is not None:
+      self.status_code = status_code
+    if error is not None:
+      self.error = error
+    self.payload = payload
+
+  def to_dict(self):
+    rv = {"error" : self.error}
+    rv.update(self.payload or ())
+    rv['message'] = self.message
+    return rv
+
+"""
+  Raised by the requests of an instance that the registry closed, see
+  InstanceRegistry.
+"""
+class InstanceEvicted(InvalidUsage):
+  error = "evicted"
+  def __init__(self, instance_id):
+    InvalidUsage.__init__(self, "Instance {} was evicted".format(instance_id),
+        410, {"instance" : instance_id})
+    self.instance_id = instance_id
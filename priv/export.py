@@ -0,0 +1,115 @@
+"""
+  @file export.py
+
+  Background export of the recorded episode videos to WebM. The url request
+  doesn't wait for the conversion: it starts a job and returns the status of
+  the export, which the client polls until the video is ready. An export is
+  done once per source file and modification time, the result is reused as
+  long as the source doesn't change.
+"""
+
+import glob
+import logging
+import os
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger("gym_tcp_api.export")
+
+
+"""
+  Converts the latest mp4 recording of an instance into output.webm in the
+  directory of the instance. At most workers conversions run at the same
+  time and at most queue conversions wait, further exports are rejected as
+  busy until a job finished.
+"""
+class VideoExporter(object):
+  OUTPUT = "output.webm"
+
+  def __init__(self, directory="/var/log/gym", url="https://gym.kurg.org/",
+      workers=1, queue=16):
+    self.lock = threading.Lock()
+    # Status of the exports by (source, mtime), "pending" or "failed".
+    self.jobs = {}
+    self.pending = 0
+    self.executor = None
+    self.configure(directory, url, workers, queue)
+
+  # Set the directory of the recordings, the url the directory is served at
+  # and the limits of the conversions.
+  def configure(self, directory, url, workers, queue):
+    self.directory = directory
+    self.url = url
+    self.queue = queue
+    if self.executor is not None:
+      self.executor.shutdown(wait=False)
+    self.executor = ThreadPoolExecutor(max_workers=workers)
+
+  # Return the export status of the instance, "ready", "pending", "busy",
+  # "failed" or "missing" if there is no recording, and the url of the video.
+  def request(self, instance_id):
+    if instance_id is None:
+      return {"status" : "missing"}
+
+    path = os.path.join(self.directory, instance_id)
+    response = {"url" : self.url + instance_id + "/" + self.OUTPUT}
+
+    sources = glob.glob(os.path.join(path, "*.mp4"))
+    if not sources:
+      response["status"] = "missing"
+      return response
+
+    source = max(sources, key=os.path.getmtime)
+    mtime = os.path.getmtime(source)
+    output = os.path.join(path, self.OUTPUT)
+
+    # The output of an earlier export, possibly by another process, is reused
+    # until the recording changes.
+    if os.path.exists(output) and os.path.getmtime(output) >= mtime:
+      response["status"] = "ready"
+      return response
+
+    key = (source, mtime)
+    with self.lock:
+      status = self.jobs.get(key)
+      if status is None:
+        if self.pending >= self.queue:
+          status = "busy"
+        else:
+          status = self.jobs[key] = "pending"
+          self.pending += 1
+          self.executor.submit(self._export, key, output)
+
+    response["status"] = status
+    return response
+
+  def _export(self, key, output):
+    source = key[0]
+    # The video is written to a temporary file first, so that a partial
+    # video is never served.
+    partial = output + ".part"
+    command = ["ffmpeg", "-y", "-loglevel", "error", "-i", source,
+        "-c:v", "libvpx", "-crf", "10", "-b:v", "1M", "-c:a", "libvorbis",
+        "-f", "webm", partial]
+
+    try:
+      subprocess.run(command, check=True, stdin=subprocess.DEVNULL,
+          stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+      os.replace(partial, output)
+      status = None
+    except (OSError, subprocess.CalledProcessError) as e:
+      error = getattr(e, "stderr", None)
+      logger.warning("video export failed", extra={"source" : source,
+          "error" : error.decode("utf-8", "replace") if error else str(e)})
+      status = "failed"
+
+    with self.lock:
+      self.pending -= 1
+      if status is None:
+        self.jobs.pop(key, None)
+      else:
+        self.jobs[key] = status
+
+
+exporter = VideoExporter()
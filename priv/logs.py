@@ -0,0 +1,167 @@
+"""
+  @file logs.py
+
+  Logging setup shared by the servers. The records are put on a queue and
+  formatted and written by a background thread, so logging doesn't block the
+  request handling. The records are written as one JSON object per line with
+  the extra fields of the record, e.g.
+
+    logger.debug("request", extra={"operation": "step", "instance": id})
+
+  The debug records of the requests can be sampled per operation, so that
+  e.g. only one of 100 steps is logged.
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+
+# Attributes of every log record, the other attributes are extra fields.
+RECORD_ATTRIBUTES = set(vars(logging.LogRecord(
+    "", logging.INFO, "", 0, "", None, None))) | {"message", "asctime"}
+
+
+"""
+  Format a record as JSON object with the time, level, logger, message and
+  the extra fields of the record.
+"""
+class JsonFormatter(logging.Formatter):
+  def format(self, record):
+    entry = {"time" : round(record.created, 6),
+             "level" : record.levelname,
+             "logger" : record.name,
+             "message" : record.getMessage()}
+    for key, value in vars(record).items():
+      if key not in RECORD_ATTRIBUTES:
+        entry[key] = value
+    if record.exc_info:
+      entry["exception"] = self.formatException(record.exc_info)
+    return json.dumps(entry, default=str)
+
+
+"""
+  Keep only every n-th record of an operation, where n is the inverse of the
+  sampling rate of the operation. Records without an operation, or of an
+  operation without a rate, are kept.
+"""
+class Sampler(logging.Filter):
+  def __init__(self, rates):
+    super(Sampler, self).__init__()
+    self.intervals = {operation : max(1, int(round(1.0 / rate)))
+        for operation, rate in rates.items() if rate > 0}
+    self.dropped = {operation for operation, rate in rates.items()
+        if rate <= 0}
+    self.counts = {}
+
+  def filter(self, record):
+    operation = getattr(record, "operation", None)
+    if operation in self.dropped:
+      return False
+    interval = self.intervals.get(operation)
+    if interval is None:
+      return True
+
+    count = self.counts.get(operation, 0)
+    self.counts[operation] = count + 1
+    return count % interval == 0
+
+
+"""
+  Queue handler which leaves the formatting to the listener thread; the
+  records don't leave the process, so they don't have to be prepared for
+  pickling.
+"""
+class QueueHandler(logging.handlers.QueueHandler):
+  def prepare(self, record):
+    return record
+
+
+"""
+  Parse sampling rates like "step=0.01,reset=0.1".
+"""
+def parse_sample(sample):
+  rates = {}
+  for item in sample.split(",") if sample else ():
+    operation, _, rate = item.partition("=")
+    try:
+      rates[operation.strip()] = float(rate)
+    except ValueError:
+      raise ValueError("Invalid sampling rate '{}'".format(item))
+  return rates
+
+
+"""
+  The operation of a request used for the sampling, e.g. "step", "create" or
+  "reset".
+"""
+def request_operation(message):
+  if "step" in message:
+    return "step"
+  env = message.get("env")
+  if isinstance(env, dict):
+    if "name" in env:
+      return "create"
+    if "action" in env:
+      return env["action"]
+  for key in message:
+    if key not in ("id", "trace"):
+      return key
+  return None
+
+
+_listener = None
+
+
+def _after_fork():
+  # The listener thread isn't copied into a forked process, which has to set
+  # up the logging again.
+  global _listener
+  _listener = None
+
+
+"""
+  Log the records of the servers with the given level through a queue, in
+  the "json" or "text" format, to stderr. The sampling rates are given per
+  operation. Calling it again replaces the previous configuration.
+"""
+def setup_logging(level="INFO", sample=None, format="json", stream=None):
+  global _listener
+  if _listener is not None:
+    _listener.stop()
+
+  handler = logging.StreamHandler(sys.stderr if stream is None else stream)
+  if format == "json":
+    handler.setFormatter(JsonFormatter())
+  else:
+    handler.setFormatter(logging.Formatter(
+        "%(asctime)s %(levelname)s %(name)s: %(message)s"))
+
+  records = queue.SimpleQueue()
+  queue_handler = QueueHandler(records)
+  if sample:
+    queue_handler.addFilter(Sampler(parse_sample(sample)
+        if isinstance(sample, str) else sample))
+
+  root = logging.getLogger()
+  for existing in list(root.handlers):
+    root.removeHandler(existing)
+  root.addHandler(queue_handler)
+  root.setLevel(level.upper() if isinstance(level, str) else level)
+
+  _listener = logging.handlers.QueueListener(records, handler)
+  _listener.start()
+  return _listener
+
+
+if hasattr(os, "register_at_fork"):
+  os.register_at_fork(after_in_child=_after_fork)
+
+
+@atexit.register
+def _flush():
+  if _listener is not None:
+    _listener.stop()
@@ -0,0 +1,200 @@
+"""
+  @file preprocessing.py
+
+  Observation preprocessing applied on the server, so that the client receives
+  the observations in the form used for training. The chain is given when the
+  environment is created, e.g.
+
+    {"env": {"name": "PongNoFrameskip-v4", "preprocess": [
+        {"name": "grayscale"},
+        {"name": "resize", "shape": [84, 84]},
+        {"name": "cast", "dtype": "uint8"},
+        {"name": "stack", "num": 4}]}}
+
+  The wrappers update the observation space, so the observationspace response
+  describes the preprocessed observations.
+"""
+
+import collections
+import numpy as np
+
+import gym
+from gym import spaces
+
+
+"""
+  Convert RGB observations of shape (h, w, 3) into grayscale observations of
+  shape (h, w) using the ITU-R BT.601 luma weights.
+"""
+class GrayScale(gym.ObservationWrapper):
+  WEIGHTS = np.array([0.299, 0.587, 0.114])
+
+  def __init__(self, env):
+    super(GrayScale, self).__init__(env)
+    space = env.observation_space
+    if len(space.shape) != 3 or space.shape[-1] != 3:
+      raise ValueError("grayscale requires observations of shape (h, w, 3)")
+
+    self.dtype = space.dtype
+    self.observation_space = spaces.Box(
+        low=np.min(space.low), high=np.max(space.high),
+        shape=space.shape[:-1], dtype=space.dtype)
+
+  def observation(self, observation):
+    gray = np.dot(observation, self.WEIGHTS)
+    if np.issubdtype(self.dtype, np.integer):
+      gray = np.rint(gray)
+    return gray.astype(self.dtype)
+
+
+"""
+  Resize the observations to the given height and width using nearest
+  neighbour sampling, the remaining dimensions are kept.
+"""
+class Resize(gym.ObservationWrapper):
+  def __init__(self, env, shape):
+    super(Resize, self).__init__(env)
+    space = env.observation_space
+    if len(space.shape) < 2:
+      raise ValueError("resize requires observations with two or more "
+          "dimensions")
+
+    height, width = int(shape[0]), int(shape[1])
+    # The source row and column of each pixel of the resized observation.
+    self.rows = (np.arange(height) * space.shape[0] // height)[:, np.newaxis]
+    self.cols = np.arange(width) * space.shape[1] // width
+
+    self.observation_space = spaces.Box(
+        low=self.observation(space.low), high=self.observation(space.high),
+        dtype=space.dtype)
+
+  def observation(self, observation):
+    return observation[self.rows, self.cols]
+
+
+"""
+  Cast the observations to the given dtype, integer types are clipped to the
+  range of the type.
+"""
+class Cast(gym.ObservationWrapper):
+  def __init__(self, env, dtype):
+    super(Cast, self).__init__(env)
+    space = env.observation_space
+    self.dtype = np.dtype(dtype)
+    self.bounds = None
+    if np.issubdtype(self.dtype, np.integer):
+      info = np.iinfo(self.dtype)
+      self.bounds = (info.min, info.max)
+
+    self.observation_space = spaces.Box(
+        low=self.observation(space.low), high=self.observation(space.high),
+        dtype=self.dtype)
+
+  def observation(self, observation):
+    if self.bounds is not None:
+      observation = np.clip(observation, *self.bounds)
+    return observation.astype(self.dtype)
+
+
+"""
+  Stack the last num observations along a new last axis, or along the last
+  axis if the observations have a channel axis. After a reset the stack is
+  filled with the first observation.
+"""
+class FrameStack(gym.ObservationWrapper):
+  def __init__(self, env, num):
+    super(FrameStack, self).__init__(env)
+    space = env.observation_space
+    self.num = int(num)
+    self.frames = collections.deque(maxlen=self.num)
+    self.channels = len(space.shape) == 3
+
+    self.observation_space = spaces.Box(
+        low=self._stack([space.low] * self.num),
+        high=self._stack([space.high] * self.num),
+        dtype=space.dtype)
+
+  def reset(self, **kwargs):
+    observation = self.env.reset(**kwargs)
+    for _ in range(self.num - 1):
+      self.frames.append(np.array(observation))
+    return self.observation(observation)
+
+  def observation(self, observation):
+    # Copy the observation, some environments reuse the array.
+    self.frames.append(np.array(observation))
+    return self._stack(self.frames)
+
+  def _stack(self, frames):
+    if self.channels:
+      return np.concatenate(frames, axis=-1)
+    return np.stack(frames, axis=-1)
+
+
+# The height and width of a resize.
+def _shape(value):
+  shape = [int(size) for size in value]
+  if len(shape) != 2 or min(shape) < 1:
+    raise ValueError()
+  return shape
+
+
+# The numeric dtype of a cast.
+def _dtype(value):
+  dtype = np.dtype(value)
+  if dtype.kind not in "biuf":
+    raise ValueError()
+  return dtype
+
+
+# The number of stacked observations.
+def _count(value):
+  count = int(value)
+  if count < 1:
+    raise ValueError()
+  return count
+
+
+PREPROCESSORS = {
+  "grayscale" : (GrayScale, ()),
+  "resize" : (Resize, (("shape", _shape),)),
+  "cast" : (Cast, (("dtype", _dtype),)),
+  "stack" : (FrameStack, (("num", _count),)),
+}
+
+
+"""
+  Return a function that wraps an environment with the given chain of
+  preprocessing steps. Each step is a dict with the name of the step and its
+  parameters. Raises ValueError if a step or a parameter is invalid; the
+  wrappers raise ValueError if a step doesn't fit the observations.
+"""
+def create_preprocessing(steps):
+  if not isinstance(steps, list):
+    raise ValueError("The preprocessing steps have to be a list")
+
+  chain = []
+  for step in steps:
+    name = step.get("name") if isinstance(step, dict) else step
+    if not isinstance(name, str) or name not in PREPROCESSORS:
+      raise ValueError("Unknown preprocessing step '{}'".format(name))
+
+    wrapper, params = PREPROCESSORS[name]
+    args = []
+    for param, parse in params:
+      if not isinstance(step, dict) or param not in step:
+        raise ValueError("Preprocessing step '{}' requires the parameters "
+            "{}".format(name, ", ".join(param for param, _ in params)))
+      try:
+        args.append(parse(step[param]))
+      except (TypeError, ValueError):
+        raise ValueError("Invalid parameter '{}' of preprocessing step "
+            "'{}'".format(param, name))
+    chain.append((wrapper, args))
+
+  def wrap(env):
+    for wrapper, args in chain:
+      env = wrapper(env, *args)
+    return env
+
+  return wrap
@@ -0,0 +1,595 @@
+"""
+  @file protocol.py
+
+  The request handling shared by the Python server and the Elixir worker. A
+  Session holds the state of a single connection: the instance, the
+  compression and the encoding of the responses. A request is parsed once and
+  dispatched on its top-level keys; step, by far the most frequent request,
+  is checked first.
+
+  A client can ask for a session token. If the connection of a session with a
+  token ends, its instance is kept for a while, so that the client can
+  reconnect and resume the episode:
+
+    {"session": {"action": "token"}}
+    {"session": {"resume": "<token>"}}
+"""
+
+import logging
+import secrets
+import threading
+import time
+import numpy as np
+
+from encoding import StreamCompressor, encode_observation
+from environments import Envs, InvalidUsage, registry
+from stats import Trace, stats
+import serialization
+from logs import request_operation
+from export import exporter
+
+logger = logging.getLogger("gym_tcp_api.protocol")
+
+
+"""
+  Encode the response, the optional request id is echoed so that the client
+  can match the responses of pipelined requests.
+"""
+def encode_response(message, request_id = None):
+  if request_id is not None:
+    message["id"] = request_id
+  return serialization.dumps(message)
+
+"""
+  Append the optional request id to an already encoded response given as
+  bytes.
+"""
+def append_request_id(data, request_id = None):
+  if request_id is None:
+    return data
+  return b"".join((data[:-1], serialization.separator(),
+      serialization.dumps({"id" : request_id})[1:].encode()))
+
+"""
+  Encode the response as bytes, compressed if the client enabled compression.
+"""
+def process_data(data, compressor = None):
+  if isinstance(data, str):
+    data = data.encode()
+  if compressor is not None:
+    return compressor.compress(data)
+
+  return data + b"\r\n\r\n"
+
+"""
+  Encode the response, the encoding and compression time is recorded in the
+  optional trace.
+"""
+def traced_data(data, compressor, trace):
+  if trace is None:
+    return process_data(data, compressor)
+
+  trace.mark("encode")
+  data = process_data(data, compressor)
+  if compressor is not None:
+    trace.mark("compress")
+  return data
+
+
+"""
+  The instances of the ended sessions with a token, which are kept for
+  timeout seconds after the connection ended.
+"""
+class Sessions(object):
+  def __init__(self, timeout=60):
+    self.timeout = timeout
+    self.detached = {}
+    self.lock = threading.Lock()
+
+  # Keep the instance of the given environments for resumption.
+  def detach(self, token, envs, instance_id, environment):
+    with self.lock:
+      expired = self._expire()
+      self.detached[token] = (time.monotonic() + self.timeout, envs,
+          instance_id, environment)
+
+    timer = threading.Timer(self.timeout, self.expire)
+    timer.daemon = True
+    timer.start()
+    for envs in expired:
+      envs.env_close_all()
+
+  # Return the environments, the instance id and the environment id of the
+  # given token, None if the token is unknown or expired.
+  def resume(self, token):
+    with self.lock:
+      expired = self._expire()
+      detached = self.detached.pop(token, None)
+
+    for envs in expired:
+      envs.env_close_all()
+    return None if detached is None else detached[1:]
+
+  def expire(self):
+    with self.lock:
+      expired = self._expire()
+    for envs in expired:
+      envs.env_close_all()
+
+  # Remove the expired sessions, the caller closes their instances outside of
+  # the lock.
+  def _expire(self):
+    now = time.monotonic()
+    expired = [token for token, detached in self.detached.items()
+        if detached[0] <= now]
+    return [self.detached.pop(token)[1] for token in expired]
+
+sessions = Sessions()
+
+
+"""
+  The state of a single connection. The handlers return the encoded response,
+  or None if the request has no response.
+"""
+class Session(object):
+  __slots__ = ("envs", "environment", "instance_id", "compressor", "encoding",
+      "token")
+
+  def __init__(self, envs=None):
+    self.envs = Envs() if envs is None else envs
+    self.environment = None
+    self.instance_id = None
+    self.compressor = None
+    self.encoding = "json"
+    self.token = None
+
+  # End the connection. The instance of a session with a token is kept for
+  # resumption, otherwise the instances are closed. The session starts over
+  # with new environments.
+  def end(self):
+    if (self.token is not None and self.instance_id in self.envs.envs and
+        sessions.timeout > 0):
+      sessions.detach(self.token, self.envs, self.instance_id,
+          self.environment)
+    else:
+      self.envs.env_close_all()
+
+    self.__init__(Envs(self.envs.pool))
+
+  # Handle a request and pass the response to send, if the request has one.
+  # If the timers are enabled the phases of the request are recorded.
+  def process(self, request, send=None):
+    trace = stats.trace()
+    try:
+      with self.envs.lock:
+        data = self.handle(request, trace)
+      if send is not None and data:
+        send(data)
+        if trace is not None:
+          trace.mark("send")
+      return data
+    finally:
+      if trace is not None:
+        stats.record(trace)
+
+  # Handle a request given as str or bytes and return the encoded response,
+  # b"" if the request has no response.
+  def handle(self, request, trace=None):
+    start = time.perf_counter()
+
+    data = request.strip()
+    if len(data) == 0:
+      compressor = self.compressor
+      self.end()
+      return process_data("error", compressor)
+
+    message = serialization.loads(data)
+    request_id = message.get("id")
+    if logger.isEnabledFor(logging.DEBUG):
+      logger.debug("request", extra={"operation" : request_operation(message),
+          "instance" : self.instance_id,
+          "request" : data.decode("utf-8", "replace")
+              if isinstance(data, bytes) else data})
+
+    # The timing of the request is returned in the response.
+    inline = message.get("trace") == 1
+    if inline and trace is None:
+      trace = Trace(start)
+    if trace is not None:
+      trace.mark("parse")
+
+    try:
+      step = message.get("step")
+      if step is not None:
+        return self.step(step, request_id, trace, inline)
+
+      for key, handler in REQUESTS:
+        value = message.get(key)
+        if value is not None:
+          response = handler(self, value, request_id, trace, inline)
+          if response is not None:
+            return response
+    except InvalidUsage as e:
+      # The request failed, e.g. the snapshot is unknown or the registry
+      # closed the instance; the connection stays open.
+      return self.error(e, request_id)
+    return b""
+
+  # The encoded error response of a failed request.
+  def error(self, error, request_id=None):
+    if logger.isEnabledFor(logging.DEBUG):
+      logger.debug("request failed", extra={"instance" : self.instance_id,
+          "error" : error.error, "message" : error.message})
+    data = encode_response(error.to_dict(), request_id)
+    return process_data(data, self.compressor)
+
+  # Create an instance, close the environment of the connection or select
+  # one of the env actions.
+  def env(self, request, request_id, trace, inline):
+    if not isinstance(request, dict):
+      return None
+
+    if isinstance(request.get("name"), str):
+      return self.create(request, request_id, trace, inline)
+
+    if request.get("actionspace") == "sample":
+      sample = self.envs.get_action_space_sample(self.instance_id)
+      data = encode_response({"sample" : sample}, request_id)
+      return process_data(data, self.compressor)
+
+    handler = ENV_ACTIONS.get(request.get("action"))
+    if handler is not None:
+      return handler(self, request_id, trace, inline)
+
+    snapshot_id = request.get("restore")
+    if snapshot_id is not None:
+      return self.restore(snapshot_id, request_id, trace, inline)
+
+    seed = request.get("seed")
+    if isinstance(seed, str):
+      self.envs.seed(self.instance_id, seed)
+    return None
+
+  def create(self, request, request_id, trace, inline):
+    self.environment = request["name"]
+    self.compressor = None
+    self.encoding = "json"
+    if self.instance_id is not None:
+      self.envs.env_close(self.instance_id)
+      # The previous instance is gone even if the create fails.
+      self.instance_id = None
+
+    self.instance_id = self.envs.create(self.environment, request.get("num"),
+        request.get("preprocess"))
+
+    response = {"instance" : self.instance_id}
+    if trace is not None:
+      trace.operation, trace.env_id = "create", self.environment
+      trace.mark("env")
+      if inline:
+        response["timing"] = trace.timing()
+
+    data = encode_response(response, request_id)
+    return traced_data(data, self.compressor, trace)
+
+  def close(self, request_id, trace, inline):
+    self.envs.env_close(self.instance_id)
+    return b""
+
+  def reset(self, request_id, trace, inline):
+    if trace is not None:
+      trace.operation = "reset"
+      trace.env_id = self.envs.get_env_id(self.instance_id)
+
+    observation = self.envs.reset(self.instance_id, jsonable=False)
+    return self.keyframe(observation, request_id, trace, inline)
+
+  def snapshot(self, request_id, trace, inline):
+    snapshot_id = self.envs.snapshot(self.instance_id)
+    data = encode_response({"snapshot" : snapshot_id}, request_id)
+    return process_data(data, self.compressor)
+
+  def restore(self, snapshot_id, request_id, trace, inline):
+    if trace is not None:
+      trace.operation = "restore"
+      trace.env_id = self.envs.get_env_id(self.instance_id)
+
+    observation = self.envs.restore(self.instance_id, int(snapshot_id))
+    return self.keyframe(observation, request_id, trace, inline)
+
+  # The response of the observation of a reset or restore, which is always
+  # sent as keyframe.
+  def keyframe(self, observation, request_id, trace, inline):
+    envs, instance_id = self.envs, self.instance_id
+    if trace is not None:
+      trace.mark("env")
+
+    ring = envs.get_shared_memory(instance_id)
+    if ring is not None:
+      data = encode_response({"slot" : ring.write(observation)}, request_id)
+      return process_data(data, self.compressor)
+
+    delta = envs.get_delta(instance_id)
+    if delta is not None:
+      delta.keyframe(observation)
+
+    if self.encoding == "binary":
+      meta = {"timing" : trace.timing()} if inline else {}
+      data = encode_observation(
+          observation, 0.0, False, encode_response(meta, request_id),
+          self.compressor)
+      if trace is not None:
+        trace.mark("encode")
+      return data
+
+    if delta is None:
+      observation = envs.to_jsonable(instance_id, observation)
+      if trace is not None:
+        trace.mark("jsonable")
+    else:
+      observation = serialization.array(observation)
+
+    response = {"observation" : observation}
+    if inline:
+      response["timing"] = trace.timing()
+
+    data = encode_response(response, request_id)
+    return traced_data(data, self.compressor, trace)
+
+  def action_space(self, request_id, trace, inline):
+    data = append_request_id(
+        self.envs.get_action_space_response(self.instance_id), request_id)
+    return process_data(data, self.compressor)
+
+  def observation_space(self, request_id, trace, inline):
+    data = append_request_id(
+        self.envs.get_observation_space_response(self.instance_id), request_id)
+    return process_data(data, self.compressor)
+
+  def step(self, request, request_id, trace, inline):
+    envs, instance_id = self.envs, self.instance_id
+    action = request.get("action")
+    actions = request.get("actions")
+    repeat = request.get("repeat")
+    render = request.get("render") == 1
+    transitions = request.get("transitions") == 1
+
+    if actions is None and repeat is not None:
+      actions = [action] * int(repeat)
+
+    if trace is not None:
+      trace.operation = "step"
+      trace.env_id = envs.get_env_id(instance_id)
+
+    ring = envs.get_shared_memory(instance_id)
+    delta = envs.get_delta(instance_id) if ring is None else None
+    steps = []
+    if actions is not None:
+      [obs, reward, done, info, steps] = envs.step_sequence(
+              instance_id, actions, render, transitions, jsonable=False)
+    else:
+      [obs, reward, done, info] = envs.step(
+              instance_id, action, render, jsonable=False)
+    if trace is not None:
+      trace.mark("env")
+
+    # The changed indices and values, None if the observation is a keyframe.
+    change = delta.encode(obs) if delta is not None else None
+
+    binary = self.encoding == "binary"
+    if not binary and ring is None and delta is None:
+      obs = envs.to_jsonable(instance_id, obs, steps)
+      if trace is not None:
+        trace.mark("jsonable")
+    else:
+      if steps:
+        envs.transitions_to_jsonable(instance_id, steps)
+      if delta is not None and trace is not None:
+        trace.mark("delta")
+
+    if binary and ring is None:
+      meta = {"info" : info}
+      if np.ndim(reward) > 0:
+        # Batched instance, the rewards and done flags are sent as meta data.
+        meta["reward"], meta["done"] = reward, done
+        reward, done = 0.0, False
+      if transitions:
+        meta["transitions"] = steps
+      if inline:
+        meta["timing"] = trace.timing()
+
+      meta = encode_response(meta, request_id)
+      if change is not None:
+        data = encode_observation(
+            change[1], reward, done, meta, self.compressor, index=change[0])
+      else:
+        data = encode_observation(obs, reward, done, meta, self.compressor)
+
+      if trace is not None:
+        trace.mark("encode")
+      return data
+
+    if ring is not None:
+      # The observation is written to the shared memory, only the slot index
+      # is sent.
+      response = {"slot" : ring.write(obs)}
+    elif change is not None:
+      response = {"delta" : {"index" : change[0],
+                             "value" : serialization.array(change[1])}}
+    elif delta is not None:
+      response = {"observation" : serialization.array(obs)}
+    else:
+      response = {"observation" : obs}
+
+    response["reward"] = reward
+    response["done"] = done
+    response["info"] = info
+    if transitions:
+      response["transitions"] = steps
+    if inline:
+      response["timing"] = trace.timing()
+
+    data = encode_response(response, request_id)
+    return traced_data(data, self.compressor, trace)
+
+  # Apply the server settings of the connection; only the shm transport and
+  # the stats have a response.
+  def server(self, request, request_id, trace, inline):
+    if not isinstance(request, dict):
+      return None
+
+    for key, handler in SERVER_SETTINGS:
+      value = request.get(key)
+      if value is not None:
+        response = handler(self, value, request, request_id)
+        if response is not None:
+          return response
+    return None
+
+  def set_compression(self, compression, request, request_id):
+    if isinstance(compression, str):
+      try:
+        level = int(compression)
+        self.compressor = StreamCompressor(level) if level > 0 else None
+      except ValueError:
+        self.compressor = None
+
+  def set_encoding(self, encoding, request, request_id):
+    if isinstance(encoding, str):
+      self.encoding = "binary" if encoding == "binary" else "json"
+
+  def get_stats(self, format, request, request_id):
+    if not isinstance(format, str):
+      return None
+    if format == "prometheus":
+      data = encode_response({"prometheus" : stats.prometheus() +
+          registry.prometheus()}, request_id)
+    else:
+      response = {"stats" : stats.snapshot(), "instances" : registry.info()}
+      if stats.checkout is not None:
+        response["checkout"] = stats.checkout
+      data = encode_response(response, request_id)
+    return process_data(data, self.compressor)
+
+  def set_delta(self, interval, request, request_id):
+    self.envs.set_delta(self.instance_id, int(interval))
+
+  def set_transport(self, transport, request, request_id):
+    if not isinstance(transport, str):
+      return None
+    if transport != "shm":
+      self.envs.detach_shared_memory(self.instance_id)
+      return None
+
+    slots = request.get("slots")
+    ring = self.envs.attach_shared_memory(
+        self.instance_id, 4 if slots is None else int(slots))
+
+    data = encode_response({"shm" : ring.name,
+                            "slots" : ring.slots,
+                            "rows" : ring.rows,
+                            "cols" : ring.cols}, request_id)
+    return process_data(data, self.compressor)
+
+  # Return the token of the session, or resume the session of a token on
+  # this connection.
+  def session(self, request, request_id, trace, inline):
+    if not isinstance(request, dict):
+      return None
+
+    if sessions.timeout <= 0 and (request.get("action") == "token" or
+        "resume" in request):
+      # A reconnecting client could reach another process, e.g. another
+      # worker of the Elixir front end, which doesn't know the token.
+      raise InvalidUsage("Sessions can't be resumed on this server", 501,
+          error="unsupported")
+
+    if request.get("action") == "token":
+      if self.token is None:
+        self.token = secrets.token_hex(16)
+      data = encode_response({"token" : self.token}, request_id)
+      return process_data(data, self.compressor)
+
+    token = request.get("resume")
+    if isinstance(token, str):
+      return self.resume(token, request_id)
+    return None
+
+  # The instance of the token replaces the instance of the connection. The
+  # client lost its last observation, so the next one is sent as keyframe,
+  # and the shared memory of the previous connection is removed.
+  def resume(self, token, request_id):
+    detached = sessions.resume(token)
+    if detached is None:
+      data = encode_response({"instance" : None}, request_id)
+      return process_data(data, self.compressor)
+
+    self.envs.env_close_all()
+    self.envs, self.instance_id, self.environment = detached
+    self.token = token
+    self.envs.detach_shared_memory(self.instance_id)
+    delta = self.envs.get_delta(self.instance_id)
+    if delta is not None:
+      delta.clear()
+
+    response = {"instance" : self.instance_id}
+    num = self.envs.get_num_envs(self.instance_id)
+    if num is not None:
+      response["num"] = num
+
+    data = encode_response(response, request_id)
+    return process_data(data, self.compressor)
+
+  # The video is exported in the background, the client polls the status
+  # until it is "ready".
+  def url(self, request, request_id, trace, inline):
+    data = encode_response(exporter.request(self.instance_id), request_id)
+    return process_data(data, self.compressor)
+
+  # Start or stop the trajectory recording of the instance, or get the status
+  # of the recording. The response holds the written shards and the episode
+  # boundaries.
+  def record_trajectory(self, request, request_id, trace, inline):
+    if not isinstance(request, dict):
+      return None
+
+    action = request.get("action")
+    if action == "start":
+      info = self.envs.record_trajectory(self.instance_id,
+          request.get("shard_size"))
+    elif action == "stop":
+      info = self.envs.stop_trajectory(self.instance_id)
+    elif action == "status":
+      info = self.envs.get_trajectory_info(self.instance_id)
+    else:
+      return None
+
+    data = encode_response({"trajectory" : info}, request_id)
+    return process_data(data, self.compressor)
+
+  def record_episode_stats(self, request, request_id, trace, inline):
+    if isinstance(request, dict) and request.get("action") == "start":
+      self.envs.record_episode_stats(self.instance_id)
+    return None
+
+
+# The handlers of the top-level request keys besides step, in the order in
+# which they are checked.
+REQUESTS = (("env", Session.env),
+            ("server", Session.server),
+            ("session", Session.session),
+            ("url", Session.url),
+            ("record_trajectory", Session.record_trajectory),
+            ("record_episode_stats", Session.record_episode_stats))
+
+ENV_ACTIONS = {"close" : Session.close,
+               "reset" : Session.reset,
+               "snapshot" : Session.snapshot,
+               "actionspace" : Session.action_space,
+               "observationspace" : Session.observation_space}
+
+SERVER_SETTINGS = (("compression", Session.set_compression),
+                   ("encoding", Session.set_encoding),
+                   ("stats", Session.get_stats),
+                   ("delta", Session.set_delta),
+                   ("transport", Session.set_transport))
@@ -0,0 +1,174 @@
+"""
+  @file recorder.py
+
+  Recording of the transitions of an instance on the server, to produce
+  offline datasets without logging the transitions on the client. The
+  observations, actions, rewards and done flags are appended to preallocated
+  buffers; each full buffer is written as a shard by a background thread, so
+  the steps don't wait for the disk. A shard is a directory with one .npy file
+  per field, which can be loaded with np.load(path, mmap_mode="r"). Each
+  recording of an instance gets its own directory:
+
+    <directory>/<instance>/<recording>/00000/observations.npy
+    <directory>/<instance>/<recording>/00000/actions.npy
+    <directory>/<instance>/<recording>/00000/rewards.npy
+    <directory>/<instance>/<recording>/00000/dones.npy
+
+  The observation of a transition is the observation the action was taken in.
+"""
+
+import logging
+import os
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+logger = logging.getLogger("gym_tcp_api.recorder")
+
+FIELDS = ("observations", "actions", "rewards", "dones")
+
+# The default directory of the recordings, which is writable without root.
+DIRECTORY = os.path.join(tempfile.gettempdir(), "gym", "trajectories")
+
+
+"""
+  Writes the shards of all recorders in the order they are submitted.
+"""
+class ShardWriter(object):
+  def __init__(self, directory=DIRECTORY, shard_size=10000):
+    self.executor = ThreadPoolExecutor(max_workers=1)
+    self.configure(directory, shard_size)
+
+  # Set the directory of the recordings and the default number of
+  # transitions per shard.
+  def configure(self, directory, shard_size):
+    self.directory = directory
+    self.shard_size = shard_size
+
+  def submit(self, path, buffers):
+    return self.executor.submit(_write_shard, path, buffers)
+
+
+# The shard is written to a temporary directory first, so that a partial
+# shard is never read.
+def _write_shard(path, buffers):
+  partial = path + ".part"
+  if os.path.exists(partial):
+    shutil.rmtree(partial)
+  os.makedirs(partial)
+  for field, values in zip(FIELDS, buffers):
+    np.save(os.path.join(partial, field + ".npy"), values)
+  os.replace(partial, path)
+  return path
+
+
+"""
+  The recording of a single instance. The buffers are allocated with the
+  dtype and shape of the first observation and action.
+"""
+class TrajectoryRecorder(object):
+  def __init__(self, instance_id, shard_size=None, writer=None):
+    self.writer = writer if writer is not None else shard_writer
+    self.shard_size = shard_size or self.writer.shard_size
+    path = os.path.join(self.writer.directory, instance_id)
+    recording = len(os.listdir(path)) if os.path.isdir(path) else 0
+    self.directory = os.path.join(path, str(recording))
+    os.makedirs(self.directory, exist_ok=True)
+    self.buffers = None
+    self.size = 0
+    self.steps = 0
+    # The written and the failed shards, and the future, path, first step and
+    # number of steps of the shards being written.
+    self.shards = []
+    self.failed = []
+    self.pending = []
+    self.shard_index = 0
+    # The episodes as [first step, end step], the current episode starts at
+    # episode_start.
+    self.episodes = []
+    self.episode_start = 0
+
+  # Append a transition, the observation is the one the action was taken in.
+  def append(self, observation, action, reward, done):
+    if self.buffers is None:
+      self.buffers = self._allocate(observation, action)
+
+    observations, actions, rewards, dones = self.buffers
+    observations[self.size] = observation
+    actions[self.size] = action
+    rewards[self.size] = reward
+    dones[self.size] = done
+    self.size += 1
+    self.steps += 1
+
+    if done:
+      self.end_episode()
+    if self.size == self.shard_size:
+      self.flush()
+
+  # End the current episode, e.g. on a reset before the episode was done.
+  def end_episode(self):
+    if self.steps > self.episode_start:
+      self.episodes.append([self.episode_start, self.steps])
+    self.episode_start = self.steps
+
+  # Write the buffered transitions as shard, which may be smaller than the
+  # shard size.
+  def flush(self):
+    if self.size == 0:
+      return
+
+    path = os.path.join(self.directory, "{:05d}".format(self.shard_index))
+    buffers = [values[:self.size] for values in self.buffers]
+    self.pending.append((self.writer.submit(path, buffers), path,
+        self.steps - self.size, self.size))
+    self.shard_index += 1
+
+    # The buffers belong to the writer now, new ones are allocated on the
+    # next append.
+    self.buffers = None
+    self.size = 0
+
+  # The written and the failed shards, the episode boundaries and the number
+  # of recorded steps. If wait is set the buffered transitions are flushed
+  # and the pending shards are waited for.
+  def info(self, wait=False):
+    if wait:
+      self.flush()
+      for future, _, _, _ in self.pending:
+        future.exception()
+
+    pending = []
+    for entry in self.pending:
+      future, path, start, size = entry
+      if not future.done():
+        pending.append(entry)
+      elif future.exception() is None:
+        self.shards.append({"path" : path, "start" : start, "steps" : size})
+      else:
+        error = str(future.exception())
+        logger.warning("shard write failed", extra={"path" : path,
+            "error" : error})
+        self.failed.append({"path" : path, "start" : start, "steps" : size,
+            "error" : error})
+    self.pending = pending
+
+    return {"directory" : self.directory,
+            "shards" : list(self.shards),
+            "failed" : list(self.failed),
+            "pending" : len(pending),
+            "episodes" : list(self.episodes),
+            "steps" : self.steps}
+
+  def _allocate(self, observation, action):
+    observation = np.asarray(observation)
+    action = np.asarray(action)
+    return [np.empty((self.shard_size,) + observation.shape, observation.dtype),
+            np.empty((self.shard_size,) + action.shape, action.dtype),
+            np.empty(self.shard_size, np.float64),
+            np.empty(self.shard_size, np.bool_)]
+
+
+shard_writer = ShardWriter()
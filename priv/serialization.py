@@ -0,0 +1,149 @@
+"""
+  @file serialization.py
+
+  JSON encoding of the responses and decoding of the requests. The json
+  module is used by default. The "orjson" backend, if orjson is installed,
+  serializes ndarrays and numpy scalars natively, without converting them
+  into Python lists first; "auto" selects it if it is installed.
+
+  The observations decode to the same values with both backends, float32
+  observations are converted to float64 first, so they are written with the
+  same digits. The output of orjson differs otherwise:
+  - there is no whitespace between the tokens,
+  - exponents are written like 1e16 and 1.5e-7 instead of 1e+16 and 1.5e-07,
+  - NaN and infinite values are written as null instead of NaN and Infinity,
+  - float32 scalars and arrays outside of the observations, e.g. in the info
+    of a step, are written with the digits of the float32 value, 0.1 instead
+    of 0.10000000149011612.
+"""
+
+import json
+import numpy as np
+
+try:
+  import orjson
+except ImportError:
+  orjson = None
+
+
+"""
+  Json does not support float32/int64 serialization, the arrays and numpy
+  scalars are converted to lists and Python numbers.
+"""
+class NDArrayEncoder(json.JSONEncoder):
+  def default(self, obj):
+    if isinstance(obj, np.ndarray):
+      return obj.tolist()
+    if isinstance(obj, np.generic):
+      return obj.item()
+    return json.JSONEncoder.default(self, obj)
+
+
+"""
+  The json module backend.
+"""
+class StdlibBackend(object):
+  name = "stdlib"
+  native_numpy = False
+  separator = b", "
+
+  def __init__(self):
+    self.encoder = NDArrayEncoder()
+
+  def dumps(self, obj):
+    return self.encoder.encode(obj)
+
+  def loads(self, data):
+    return json.loads(data)
+
+  def array(self, array):
+    return array
+
+
+"""
+  The orjson backend, which serializes C contiguous ndarrays natively. Arrays
+  orjson doesn't support, e.g. with a non contiguous layout, are converted to
+  lists.
+"""
+class OrjsonBackend(object):
+  name = "orjson"
+  native_numpy = True
+  separator = b","
+
+  def __init__(self):
+    self.option = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+  def dumps(self, obj):
+    return orjson.dumps(obj, default=_default, option=self.option).decode()
+
+  def loads(self, data):
+    return orjson.loads(data)
+
+  # The array as serialized natively, float32 and float16 values are
+  # converted to float64, so they are written with the same digits as by the
+  # stdlib backend.
+  def array(self, array):
+    array = np.asarray(array)
+    if array.dtype.kind == "f" and array.dtype.itemsize < 8:
+      array = array.astype(np.float64)
+    return np.ascontiguousarray(array)
+
+
+def _default(obj):
+  if isinstance(obj, np.ndarray):
+    return obj.tolist()
+  if isinstance(obj, np.generic):
+    return obj.item()
+  raise TypeError("Object of type {} is not JSON serializable".format(
+      type(obj).__name__))
+
+
+BACKENDS = {"stdlib" : StdlibBackend}
+if orjson is not None:
+  BACKENDS["orjson"] = OrjsonBackend
+
+_backend = None
+
+
+"""
+  Select the backend, "auto" uses orjson if it is installed.
+"""
+def use(name="stdlib"):
+  global _backend
+  if name == "auto":
+    name = "orjson" if orjson is not None else "stdlib"
+  if name not in BACKENDS:
+    raise ValueError("JSON backend '{}' is not available".format(name))
+  _backend = BACKENDS[name]()
+  return _backend.name
+
+
+def dumps(obj):
+  return _backend.dumps(obj)
+
+
+def loads(data):
+  return _backend.loads(data)
+
+
+# Prepare an observation array for dumps.
+def array(array):
+  return _backend.array(array)
+
+
+# Whether dumps serializes ndarrays without converting them into lists.
+def native_numpy():
+  return _backend.native_numpy
+
+
+# The name of the selected backend.
+def name():
+  return _backend.name
+
+
+# The separator dumps writes between the items of an object, as bytes.
+def separator():
+  return _backend.separator
+
+
+use()
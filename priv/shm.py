@@ -0,0 +1,65 @@
+"""
+  @file shm.py
+
+  Shared memory transport for clients on the same host. The observations are
+  written into a ring of slots in a shared memory block and only the slot index
+  is sent over the socket. Each slot holds the observation as float64 matrix in
+  column-major order with the layout the C++ client uses, so the client can
+  wrap the memory without copying.
+"""
+
+import numpy as np
+
+from encoding import client_order
+
+try:
+  from multiprocessing import shared_memory
+except ImportError:
+  # Python < 3.8.
+  shared_memory = None
+
+
+class SharedMemoryRing(object):
+  def __init__(self, shape, batch=False, slots=4):
+    shape = tuple(int(x) for x in shape)
+    if batch:
+      # One column per environment holding the flattened observation.
+      rows, cols = int(np.prod(shape[1:])), shape[0]
+    elif len(shape) <= 1:
+      rows, cols = int(np.prod(shape)), 1
+    else:
+      # The last dimension (e.g. the channels) is stored in the columns.
+      rows, cols = int(np.prod(shape[:-1])), shape[-1]
+
+    self.batch = batch
+    self.rows = rows
+    self.cols = cols
+    self.slots = max(int(slots), 1)
+    self.next = 0
+
+    self.memory = shared_memory.SharedMemory(
+        create=True, size=max(self.slots * rows * cols * 8, 1))
+    # A column-major rows x cols matrix has the memory layout of a row-major
+    # cols x rows array.
+    self.buffer = np.ndarray((self.slots, cols, rows), dtype=np.float64,
+        buffer=self.memory.buf)
+
+  @property
+  def name(self):
+    return self.memory.name
+
+  # Write the observation into the next slot and return the slot index. The
+  # slot is overwritten after the following slots - 1 writes.
+  def write(self, observation):
+    data = client_order(observation, self.batch)
+
+    slot = self.next
+    self.next = (slot + 1) % self.slots
+    self.buffer[slot] = data.reshape(self.cols, self.rows)
+    return slot
+
+  def close(self):
+    # The array has to release the buffer before the memory can be closed.
+    self.buffer = None
+    self.memory.close()
+    self.memory.unlink()
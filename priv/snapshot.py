@@ -0,0 +1,106 @@
+"""
+  @file snapshot.py
+
+  Snapshots of the state of an environment, which are restored to branch from
+  a mid-episode state without replaying the episode, e.g. for tree search
+  rollouts. The emulator state of the Atari environments is cloned with
+  cloneState/restoreState; the state of the other environments and of the
+  wrappers, like the elapsed steps of the time limit or the stacked frames, is
+  pickled. Environments whose state can't be pickled, e.g. the Box2D and
+  MuJoCo simulations, don't support snapshots.
+"""
+
+import pickle
+
+
+"""
+  The saved state of the wrappers and the environment, and the observation at
+  the time of the snapshot.
+"""
+class Snapshot(object):
+  __slots__ = ("types", "layers", "emulator", "observation")
+
+  def __init__(self, types, layers, emulator, observation):
+    self.types = types
+    self.layers = layers
+    self.emulator = emulator
+    self.observation = observation
+
+
+# The wrappers from the outermost one to the environment itself.
+def _layers(env):
+  layers = [env]
+  while "env" in vars(layers[-1]):
+    layers.append(layers[-1].env)
+  return layers
+
+
+# Attributes of the renderers, which aren't part of the state of an
+# environment and are left as they are.
+RENDER_ATTRIBUTES = frozenset(("viewer", "_viewers", "screen", "clock",
+    "window", "renderer", "surf", "video_recorder"))
+
+
+# The pickled attributes of a layer except for the wrapped environment and the
+# given attributes. Attributes which can't be pickled are only left as they
+# are if they belong to a renderer, restoring the rest of the state would
+# desync the environment otherwise, e.g. a physics simulation.
+def _pickle_layer(layer, exclude=()):
+  state = {key : value for key, value in vars(layer).items()
+           if key != "env" and key not in exclude}
+  try:
+    return pickle.dumps(state, pickle.HIGHEST_PROTOCOL)
+  except Exception:
+    pass
+
+  for key in list(state):
+    try:
+      pickle.dumps(state[key], pickle.HIGHEST_PROTOCOL)
+    except Exception:
+      if key not in RENDER_ATTRIBUTES:
+        raise ValueError("The state of {} can't be saved, the attribute '{}' "
+            "can't be pickled".format(type(layer).__name__, key))
+      del state[key]
+  return pickle.dumps(state, pickle.HIGHEST_PROTOCOL)
+
+
+# The Arcade Learning Environment of an Atari environment, None otherwise.
+def _emulator(env):
+  ale = getattr(env.unwrapped, "ale", None)
+  if ale is not None and hasattr(ale, "cloneState"):
+    return ale
+  return None
+
+
+"""
+  Save the state of the given environment and the current observation.
+  Raises ValueError if the state can't be saved.
+"""
+def capture(env, observation):
+  layers = _layers(env)
+  emulator = _emulator(env)
+  states = [_pickle_layer(layer) for layer in layers[:-1]]
+  # The emulator of an Atari environment is saved with cloneState.
+  states.append(_pickle_layer(
+      layers[-1], ("ale",) if emulator is not None else ()))
+  return Snapshot([type(layer) for layer in layers], states,
+      emulator.cloneState() if emulator is not None else None,
+      pickle.dumps(observation, pickle.HIGHEST_PROTOCOL))
+
+
+"""
+  Restore the state of the given environment, which has to be the environment
+  the snapshot was captured from, and return the observation of the snapshot.
+"""
+def restore(env, snapshot):
+  layers = _layers(env)
+  if [type(layer) for layer in layers] != snapshot.types:
+    raise ValueError("The wrappers of the environment changed since the "
+        "snapshot")
+
+  for layer, state in zip(layers, snapshot.layers):
+    vars(layer).update(pickle.loads(state))
+
+  if snapshot.emulator is not None:
+    _emulator(env).restoreState(snapshot.emulator)
+  return pickle.loads(snapshot.observation)
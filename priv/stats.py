@@ -0,0 +1,179 @@
+"""
+  @file stats.py
+
+  Timers of the phases of a request (parsing, stepping the environment,
+  converting and encoding the observation, compression and sending), which
+  are aggregated into histograms per environment id and operation. The
+  timers are disabled by default; a disabled server creates no trace and only
+  checks a flag per request.
+
+  A client can also ask for the timing of a single request, which is returned
+  as part of the response:
+
+    {"step": {"action": 1}, "trace": 1}
+"""
+
+import bisect
+import threading
+import time
+
+# Upper bounds in seconds of the histogram buckets.
+BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+    0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, float("inf"))
+
+# Upper bounds in seconds of the checkout wait buckets of the Elixir node, see
+# GymTcpApi.NodeManager.
+CHECKOUT_BUCKETS = (0.001, 0.01, 0.1, 1.0, 5.0, float("inf"))
+
+
+"""
+  The duration of the phases of a single request. Each mark records the time
+  since the previous mark as the duration of the given phase.
+"""
+class Trace(object):
+  __slots__ = ("phases", "last", "operation", "env_id")
+
+  def __init__(self, start=None):
+    self.phases = []
+    self.last = time.perf_counter() if start is None else start
+    self.operation = None
+    self.env_id = None
+
+  def mark(self, phase):
+    now = time.perf_counter()
+    self.phases.append((phase, now - self.last))
+    self.last = now
+
+  # The phase durations so far in milliseconds.
+  def timing(self):
+    return {phase : 1000.0 * duration for phase, duration in self.phases}
+
+
+"""
+  Histogram of durations with the fixed buckets.
+"""
+class Histogram(object):
+  __slots__ = ("counts", "sum", "count")
+
+  def __init__(self):
+    self.counts = [0] * len(BUCKETS)
+    self.sum = 0.0
+    self.count = 0
+
+  def observe(self, value):
+    self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+    self.sum += value
+    self.count += 1
+
+
+"""
+  The histograms of the phases per environment id and operation.
+"""
+class Stats(object):
+  def __init__(self):
+    self.enabled = False
+    self.histograms = {}
+    self.lock = threading.Lock()
+    # The worker checkout metrics of the Elixir node, None for the standalone
+    # server.
+    self.checkout = None
+
+  # Return a new trace if the timers are enabled, None otherwise.
+  def trace(self):
+    if not self.enabled:
+      return None
+    return Trace()
+
+  # Add the phases of a finished request to the histograms, requests that
+  # don't belong to a timed operation are ignored.
+  def record(self, trace):
+    if trace.operation is None:
+      return
+
+    with self.lock:
+      for phase, duration in trace.phases:
+        key = (trace.env_id or "", trace.operation, phase)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+          histogram = self.histograms[key] = Histogram()
+        histogram.observe(duration)
+
+  def reset(self):
+    with self.lock:
+      self.histograms = {}
+
+  # The histograms as JSON serializable list.
+  def snapshot(self):
+    with self.lock:
+      items = sorted(self.histograms.items())
+      return [{"env" : env_id,
+               "operation" : operation,
+               "phase" : phase,
+               "count" : histogram.count,
+               "sum" : histogram.sum,
+               "buckets" : [[_label(bound), count] for bound, count in zip(
+                   BUCKETS, histogram.counts)]}
+              for (env_id, operation, phase), histogram in items]
+
+  # Set the checkout metrics of the Elixir node: the number of checkouts,
+  # their total wait time in microseconds, the number of rejected checkouts,
+  # the checkouts per wait bucket, the requests waiting for a worker and the
+  # running Python interpreters.
+  def set_checkout(self, checkouts, wait, rejected, histogram, waiting,
+                   interpreters):
+    self.checkout = {"checkouts" : checkouts,
+                     "wait" : wait / 1e6,
+                     "rejected" : rejected,
+                     "buckets" : [[_label(bound), count] for bound, count in
+                         zip(CHECKOUT_BUCKETS, histogram)],
+                     "waiting" : waiting,
+                     "interpreters" : interpreters}
+
+  # The histograms in the Prometheus text exposition format.
+  def prometheus(self):
+    name = "gym_request_phase_seconds"
+    lines = ["# HELP " + name + " Duration of the phases of the requests.",
+             "# TYPE " + name + " histogram"]
+    with self.lock:
+      for (env_id, operation, phase), histogram in sorted(
+          self.histograms.items()):
+        labels = 'env="{}",operation="{}",phase="{}"'.format(
+            _escape(env_id), operation, phase)
+        total = 0
+        for bound, count in zip(BUCKETS, histogram.counts):
+          total += count
+          lines.append('{}_bucket{{{},le="{}"}} {}'.format(
+              name, labels, _label(bound), total))
+        lines.append("{}_sum{{{}}} {}".format(name, labels, histogram.sum))
+        lines.append("{}_count{{{}}} {}".format(
+            name, labels, histogram.count))
+
+    checkout = self.checkout
+    if checkout is not None:
+      name = "gym_checkout_wait_seconds"
+      lines += ["# HELP " + name + " Time the requests waited for a worker.",
+                "# TYPE " + name + " histogram"]
+      total = 0
+      for bound, count in checkout["buckets"]:
+        total += count
+        lines.append('{}_bucket{{le="{}"}} {}'.format(name, bound, total))
+      lines.append("{}_sum {}".format(name, checkout["wait"]))
+      lines.append("{}_count {}".format(name, checkout["checkouts"]))
+      for key, name, kind in (
+          ("rejected", "gym_checkout_rejected_total", "counter"),
+          ("waiting", "gym_checkout_waiting", "gauge"),
+          ("interpreters", "gym_interpreters", "gauge")):
+        lines.append("# TYPE " + name + " " + kind)
+        lines.append("{} {}".format(name, checkout[key]))
+    return "\n".join(lines) + "\n"
+
+
+def _label(bound):
+  return "+Inf" if bound == float("inf") else repr(bound)
+
+
+def _escape(value):
+  return value.replace("\\", "\\\\").replace('"', '\\"')
+
+
+stats = Stats()
@@ -0,0 +1,445 @@
+"""
+  @file benchmark.py
+
+  Load generator and benchmark for the gym TCP API. N simulated agents connect
+  to the server (python/server.py or the Elixir application), create an
+  environment and send a mix of requests. The throughput, the latency
+  percentiles and the bytes per request are reported as JSON, e.g.
+
+    $ python python/benchmark.py --agents 8 --duration 10 \
+          --env CartPole-v1 --compression 0 6 --mix step=0.98,reset=0.02
+
+  With --spawn the benchmark starts python/server.py on the given port and
+  stops it afterwards. With --baseline the results are compared against the
+  results of a previous run and the exit status is 1 if the throughput or the
+  p99 latency regressed by more than --tolerance.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import socket
+import struct
+import subprocess
+import sys
+import threading
+import time
+import zlib
+
+LENGTH = struct.Struct("<I")
+
+# Offset of the flags in the header of a binary frame, bit 0 is the done flag.
+FLAGS_OFFSET = 1
+
+OPERATIONS = ("create", "reset", "step", "actionspace")
+
+
+"""
+  A connection to the server which sends the requests and receives the
+  responses, either terminated JSON or length prefixed frames if the
+  responses are compressed or binary encoded.
+"""
+class Connection(object):
+  def __init__(self, host, port, timeout):
+    self.socket = socket.create_connection((host, port), timeout=timeout)
+    self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    self.buffer = b""
+    self.framed = False
+    self.inflate = None
+    self.sent = 0
+    self.received = 0
+
+  # Set the compression level and the encoding of the connection, the server
+  # resets both when an environment is created.
+  def configure(self, compression, encoding):
+    if compression > 0:
+      self.send({"server" : {"compression" : str(compression)}})
+      self.inflate = zlib.decompressobj()
+    else:
+      self.inflate = None
+    if encoding != "json":
+      self.send({"server" : {"encoding" : encoding}})
+    self.framed = compression > 0 or encoding != "json"
+
+  def send(self, message):
+    data = (json.dumps(message) + "\r\n").encode()
+    self.socket.sendall(data)
+    self.sent += len(data)
+
+  # Receive a response, a compressed response is decompressed. Only the
+  # observations are binary encoded.
+  def receive(self, observation=True):
+    framed = self.framed if observation else self.inflate is not None
+    if not framed:
+      return self._read_until(b"\r\n\r\n")
+
+    size = LENGTH.unpack(self._read(LENGTH.size))[0]
+    data = self._read(size)
+    if self.inflate is not None:
+      data = self.inflate.decompress(data)
+    return data
+
+  def close(self):
+    try:
+      self.send({"env" : {"action" : "close"}})
+    except OSError:
+      pass
+    self.socket.close()
+
+  def _recv(self):
+    data = self.socket.recv(1 << 16)
+    if not data:
+      raise ConnectionError("connection closed by the server")
+    self.received += len(data)
+    self.buffer += data
+
+  def _read(self, size):
+    while len(self.buffer) < size:
+      self._recv()
+    data, self.buffer = self.buffer[:size], self.buffer[size:]
+    return data
+
+  def _read_until(self, terminator):
+    while True:
+      end = self.buffer.find(terminator)
+      if end >= 0:
+        data = self.buffer[:end]
+        self.buffer = self.buffer[end + len(terminator):]
+        return data
+      self._recv()
+
+
+"""
+  Return a function that samples a random action of the given action space.
+"""
+def action_sampler(space, rng):
+  name = space.get("name")
+  if name == "Discrete":
+    return lambda: rng.randrange(space["n"])
+  elif name == "Box":
+    low = [float(x) for x in _flatten(space["low"])]
+    high = [float(x) for x in _flatten(space["high"])]
+    return lambda: [rng.uniform(l, h) for l, h in zip(low, high)]
+  raise ValueError("Unsupported action space '{}'".format(name))
+
+
+def _flatten(values):
+  if isinstance(values, list):
+    return [x for value in values for x in _flatten(value)]
+  return [values]
+
+
+"""
+  Parse a request mix like "step=0.9,reset=0.1" into operations and weights.
+"""
+def parse_mix(mix):
+  operations, weights = [], []
+  for item in mix.split(","):
+    name, _, weight = item.partition("=")
+    name = name.strip()
+    if name not in OPERATIONS:
+      raise ValueError("Unknown operation '{}', expected one of {}".format(
+          name, ", ".join(OPERATIONS)))
+    operations.append(name)
+    weights.append(float(weight) if weight else 1.0)
+  return operations, weights
+
+
+"""
+  A simulated agent, which runs the request mix on its own connection and
+  records the latency and the bytes of every request.
+"""
+class Agent(object):
+  def __init__(self, config, env_id, seed):
+    self.config = config
+    self.env_id = env_id
+    self.rng = random.Random(seed)
+    self.latency = {name : [] for name in OPERATIONS}
+    self.bytes = {name : 0 for name in OPERATIONS}
+    self.errors = 0
+    self.connection = None
+
+  def run(self, start, stop):
+    config = self.config
+    operations, weights = parse_mix(config["mix"])
+    self.connection = Connection(config["host"], config["port"],
+        config["timeout"])
+    try:
+      self.create()
+      self.reset()
+      done = False
+      while True:
+        now = time.time()
+        if now >= stop:
+          break
+
+        record = now >= start
+        operation = self.rng.choices(operations, weights)[0]
+        if done and operation == "step":
+          operation = "reset"
+
+        if operation == "step":
+          done = self.step(record)
+        elif operation == "reset":
+          self.reset(record)
+          done = False
+        elif operation == "create":
+          self.create(record)
+          self.reset()
+          done = False
+        else:
+          self.request(operation, {"env" : {"action" : "actionspace"}},
+              record, observation=False)
+    except (OSError, ValueError) as e:
+      self.errors += 1
+      print("Agent failed: " + str(e), file=sys.stderr)
+    finally:
+      self.connection.close()
+
+  def request(self, operation, message, record=True, observation=True):
+    connection = self.connection
+    received = connection.received
+    begin = time.perf_counter()
+    connection.send(message)
+    response = connection.receive(observation)
+    if record:
+      self.latency[operation].append(time.perf_counter() - begin)
+      self.bytes[operation] += connection.received - received
+    return response
+
+  # The server resets the compression and the encoding of the connection
+  # when an environment is created.
+  def create(self, record=False):
+    self.connection.configure(0, "json")
+    response = self.request("create", {"env" : {"name" : self.env_id}},
+        record, observation=False)
+    if b"instance" not in response:
+      raise ValueError("create failed: " + response.decode(errors="replace"))
+
+    space = json.loads(self.request("actionspace",
+        {"env" : {"action" : "actionspace"}}, False, observation=False))
+    self.sample = action_sampler(space["info"], self.rng)
+    self.connection.configure(self.config["compression"],
+        self.config["encoding"])
+
+  def reset(self, record=False):
+    self.request("reset", {"env" : {"action" : "reset"}}, record)
+
+  # Step the environment and return the done flag.
+  def step(self, record=True):
+    response = self.request("step", {"step" : {"action" : self.sample()}},
+        record)
+    if self.config["encoding"] == "binary":
+      return bool(response[FLAGS_OFFSET] & 1)
+    return json.loads(response)["done"] is True
+
+
+"""
+  Run the given agents in threads of this process and return their latencies,
+  bytes and errors.
+"""
+def run_agents(config, agents, start, stop):
+  agents = [Agent(config, env_id, seed) for env_id, seed in agents]
+  threads = [threading.Thread(target=agent.run, args=(start, stop))
+      for agent in agents]
+  for thread in threads:
+    thread.start()
+  for thread in threads:
+    thread.join()
+
+  latency = {name : [] for name in OPERATIONS}
+  size = {name : 0 for name in OPERATIONS}
+  for agent in agents:
+    for name in OPERATIONS:
+      latency[name].extend(agent.latency[name])
+      size[name] += agent.bytes[name]
+  return latency, size, sum(agent.errors for agent in agents)
+
+
+def percentile(values, q):
+  if not values:
+    return None
+  index = min(int(q * len(values)), len(values) - 1)
+  return values[index]
+
+
+"""
+  Run one benchmark with the given configuration and return the results.
+"""
+def benchmark(config):
+  agents = [(config["env"][i % len(config["env"])], config["seed"] + i)
+      for i in range(config["agents"])]
+
+  # The agents start recording after the warmup, all at the same time.
+  start = time.time() + config["warmup"] + 0.5
+  stop = start + config["duration"]
+
+  processes = max(1, min(config["processes"], len(agents)))
+  if processes == 1:
+    results = [run_agents(config, agents, start, stop)]
+  else:
+    with multiprocessing.Pool(processes) as workers:
+      results = workers.starmap(run_agents, [
+          (config, agents[i::processes], start, stop)
+          for i in range(processes)])
+
+  operations = {}
+  errors = sum(result[2] for result in results)
+  for name in OPERATIONS:
+    latency = sorted(x for result in results for x in result[0][name])
+    size = sum(result[1][name] for result in results)
+    if not latency:
+      continue
+
+    operations[name] = {
+      "count" : len(latency),
+      "throughput" : len(latency) / config["duration"],
+      "mean_ms" : 1000.0 * sum(latency) / len(latency),
+      "p50_ms" : 1000.0 * percentile(latency, 0.5),
+      "p99_ms" : 1000.0 * percentile(latency, 0.99),
+      "p999_ms" : 1000.0 * percentile(latency, 0.999),
+      "max_ms" : 1000.0 * latency[-1],
+      "bytes_per_request" : size / len(latency),
+    }
+
+  return {"config" : {key : config[key] for key in ("env", "agents",
+              "processes", "compression", "encoding", "mix", "duration")},
+          "errors" : errors,
+          "operations" : operations}
+
+
+"""
+  Compare the results with the baseline results and return the regressions
+  of the step throughput and the p99 latency larger than the tolerance.
+"""
+def compare(results, baseline, tolerance):
+  def key(result):
+    config = result["config"]
+    return (tuple(config["env"]), config["compression"], config["encoding"],
+        config["mix"])
+
+  regressions = []
+  baseline = {key(result) : result for result in baseline["results"]}
+  for result in results:
+    previous = baseline.get(key(result))
+    if previous is None:
+      continue
+
+    for name, current in result["operations"].items():
+      before = previous["operations"].get(name)
+      if before is None:
+        continue
+      if current["throughput"] < (1 - tolerance) * before["throughput"]:
+        regressions.append("{} {} throughput {:.1f} < {:.1f}".format(
+            key(result), name, current["throughput"], before["throughput"]))
+      if current["p99_ms"] > (1 + tolerance) * before["p99_ms"]:
+        regressions.append("{} {} p99 {:.3f} ms > {:.3f} ms".format(
+            key(result), name, current["p99_ms"], before["p99_ms"]))
+  return regressions
+
+
+"""
+  Start python/server.py and wait until it accepts connections.
+"""
+def spawn_server(host, port, args):
+  server = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+      "server.py")
+  process = subprocess.Popen(
+      [sys.executable, server, "--host", host, "--port", str(port)] + args,
+      stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+  deadline = time.time() + 60
+  while time.time() < deadline:
+    if process.poll() is not None:
+      raise RuntimeError("server exited with status {}".format(
+          process.returncode))
+    try:
+      socket.create_connection((host, port), timeout=1).close()
+      return process
+    except OSError:
+      time.sleep(0.2)
+
+  process.terminate()
+  raise RuntimeError("server didn't accept connections")
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="gym TCP API benchmark.")
+  parser.add_argument("--host", default="127.0.0.1",
+                      help="Address of the server.")
+  parser.add_argument("--port", type=int, default=4040,
+                      help="Port of the server.")
+  parser.add_argument("--env", nargs="+", default=["CartPole-v1"],
+                      help="Environment ids, assigned to the agents in turn.")
+  parser.add_argument("--agents", type=int, default=4,
+                      help="Number of concurrent agents.")
+  parser.add_argument("--processes", type=int, default=1,
+                      help="Number of processes running the agents.")
+  parser.add_argument("--compression", type=int, nargs="+", default=[0],
+                      help="Compression levels, each level is benchmarked.")
+  parser.add_argument("--encoding", nargs="+", default=["json"],
+                      choices=["json", "binary"],
+                      help="Observation encodings, each one is benchmarked.")
+  parser.add_argument("--mix", default="step=1",
+                      help="Request mix as operation=weight list, operations "
+                      "are " + ", ".join(OPERATIONS) + ".")
+  parser.add_argument("--duration", type=float, default=10,
+                      help="Measured seconds per benchmark.")
+  parser.add_argument("--warmup", type=float, default=2,
+                      help="Seconds before the measurement starts.")
+  parser.add_argument("--timeout", type=float, default=60,
+                      help="Seconds to wait for a response.")
+  parser.add_argument("--seed", type=int, default=0,
+                      help="Seed of the request mix and the actions.")
+  parser.add_argument("--output", default=None,
+                      help="Write the results to this file instead of stdout.")
+  parser.add_argument("--baseline", default=None,
+                      help="Results of a previous run to compare against.")
+  parser.add_argument("--tolerance", type=float, default=0.1,
+                      help="Allowed relative regression against the baseline.")
+  parser.add_argument("--spawn", action="store_true",
+                      help="Start python/server.py for the benchmark.")
+  parser.add_argument("--server-args", default="",
+                      help="Arguments of the spawned server.")
+  args = parser.parse_args()
+
+  try:
+    parse_mix(args.mix)
+  except ValueError as e:
+    parser.error(str(e))
+
+  server = None
+  if args.spawn:
+    server = spawn_server(args.host, args.port, args.server_args.split())
+
+  try:
+    results = []
+    for compression in args.compression:
+      for encoding in args.encoding:
+        config = dict(vars(args), compression=compression, encoding=encoding)
+        results.append(benchmark(config))
+  finally:
+    if server is not None:
+      server.terminate()
+      server.wait()
+
+  report = {"timestamp" : time.time(), "results" : results}
+  output = json.dumps(report, indent=2)
+  if args.output is None:
+    print(output)
+  else:
+    with open(args.output, "w") as f:
+      f.write(output + "\n")
+
+  status = 1 if any(result["errors"] for result in results) else 0
+  if args.baseline is not None:
+    with open(args.baseline) as f:
+      regressions = compare(results, json.load(f), args.tolerance)
+    for regression in regressions:
+      print("Regression: " + regression, file=sys.stderr)
+    if regressions:
+      status = 1
+
+  sys.exit(status)
@@ -1,376 +1,533 @@
-import json
-import uuid
-import numpy as np
 import socket
 import os
+import sys
 from _thread import *
-import glob
-
-import gym
-from gym.wrappers import RecordEpisodeStatistics
-
-try:
-  import zlib
-except ImportError:
-  pass
+import argparse
+import asyncio
+import signal
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from concurrent.futures import ThreadPoolExecutor
+
+# The modules shared with the Elixir worker are located in priv/.
+sys.path.insert(0, os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "priv"))
+from environments import Envs, InvalidUsage, pool, registry
+from protocol import Session, sessions
+from stats import stats
+import serialization
+from logs import setup_logging
+from export import exporter
+from recorder import DIRECTORY, shard_writer
 
 import logging
-logger = logging.getLogger(__name__)
-logger.setLevel(logging.INFO)
+logger = logging.getLogger("gym_tcp_api.server")
 
+# The size of the largest request, including the delimiter.
+REQUEST_LIMIT = 2 ** 24
 
-ServerSocket = socket.socket()
-ServerSocket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-
-host = '127.0.0.1'
-port = 4040
-ThreadCount = 0
-try:
-    ServerSocket.bind((host, port))
-except socket.error as e:
-    print(str(e))
-
-print('Waitiing for a Connection..')
-ServerSocket.listen(5)
-
-
-try:
-    unicode = unicode
-except NameError:
-    # 'unicode' is undefined, must be Python 3
-    str = str
-    unicode = str
-    bytes = bytes
-    basestring = (str,bytes)
-else:
-    # 'unicode' exists, must be Python 2
-    str = str
-    unicode = unicode
-    bytes = str
-    basestring = basestring
 
 """
-  Container and manager for the environments instantiated
-  on this server. The Envs class is based on the gym-http-api project
-  @misc{gymhttpapi2016,
-    title = {OpenAI gym-http-api},
-    year = {2016},
-    publisher = {GitHub},
-    journal = {GitHub repository},
-    howpublished = {https://github.com/openai/gym-http-api}
-  }
+  Buffered reader for the incoming messages of a single connection. The data
+  is received in large chunks into a reusable buffer, complete messages are
+  split out and partial data is kept for the next read. A request larger
+  than the limit raises InvalidUsage.
 """
-class Envs(object):
-  def __init__(self):
-    self.envs = {}
-    self.id_len = 13
+class RecvBuffer(object):
+  def __init__(self, connection, chunk_size=65536, limit=REQUEST_LIMIT):
+    self.connection = connection
+    self.limit = limit
+    self.buffer = bytearray()
+    self.chunk = bytearray(chunk_size)
+    self.view = memoryview(self.chunk)
+    # Offset from which to search for the delimiter, the data before it has
+    # already been scanned.
+    self.offset = 0
+
+  def recv(self):
+    while 1:
+      end = self.buffer.find(b"\r\n", self.offset)
+      if end >= 0:
+        end += 2
+        if end > self.limit:
+          raise self.overrun()
+        # The message is decoded by the JSON parser.
+        message = bytes(self.buffer[:end])
+        del self.buffer[:end]
+        self.offset = 0
+        return message
+
+      if len(self.buffer) >= self.limit:
+        raise self.overrun()
+
+      # The delimiter might be split across two reads.
+      self.offset = max(len(self.buffer) - 1, 0)
+      try:
+        size = self.connection.recv_into(self.view)
+      except:
+        return b""
+
+      if size == 0:
+        return b""
+      self.buffer += self.view[:size]
+
+  # The error of a request larger than the limit.
+  def overrun(self):
+    return InvalidUsage("The request exceeds the limit of {} bytes".format(
+        self.limit), 413)
 
-  def _lookup_env(self, instance_id):
-    try:
-      return self.envs[instance_id]
-    except KeyError:
-      return None
 
-  def _remove_env(self, instance_id):
-    try:
-      del self.envs[instance_id]
-    except KeyError:
-      raise InvalidUsage('Instance_id {} unknown'.format(instance_id))
+def threaded_client(connection):
+    #connection.send(str.encode('Welcome to the Server\n'))
+    session = Session(Envs())
+    connection.settimeout(60 * 20)
+    reader = RecvBuffer(connection)
 
-  def create(self, env_id):
     try:
-      env = gym.make(env_id)
-    except gym.error.Error:
-      raise InvalidUsage(
-          "Attempted to look up malformed environment ID '{}'".format(env_id))
-
-    instance_id = str(uuid.uuid4().hex)[:self.id_len]
-    self.envs[instance_id] = env
-    return instance_id
-
-  def reset(self, instance_id):
-    env = self._lookup_env(instance_id)
-    obs = env.reset()
-    return env.observation_space.to_jsonable(obs)
-
-  def step(self, instance_id, action, render):
-    env = self._lookup_env(instance_id)
-    action_from_json = env.action_space.from_jsonable(action)
-    if (not isinstance(action_from_json, (list))):
-      action_from_json = int(action_from_json)
-
-    if render: env.render()
-    [observation, reward, done, info] = env.step(action_from_json)
-
-    obs_jsonable = env.observation_space.to_jsonable(observation)
-    return [obs_jsonable, reward, done, info]
-
-  def seed(self, s):
-    env = self._lookup_env(instance_id)
-    env.seed(int(s))
-
-  def get_action_space_info(self, instance_id):
-    env = self._lookup_env(instance_id)
-    return self._get_space_properties(env.action_space)
-
-  def get_action_space_sample(self, instance_id):
-    env = self._lookup_env(instance_id)
-    return env.action_space.sample()
-
-  def get_observation_space_info(self, instance_id):
-    env = self._lookup_env(instance_id)
-    return self._get_space_properties(env.observation_space)
-
-  def _get_space_properties(self, space):
-    info = {}
-    info['name'] = space.__class__.__name__
-    if info['name'] == 'Discrete':
-      info['n'] = space.n
-    elif info['name'] == 'Box':
-      info['shape'] = space.shape
-      # It's not JSON compliant to have Infinity, -Infinity, NaN.
-      # Many newer JSON parsers allow it, but many don't. Notably python json
-      # module can read and write such floats. So we only here fix
-      # "export version", also make it flat.
-      info['low'] = [(x if x != -np.inf else -1e100) for x
-          in np.array(space.low ).flatten()]
-      info['high'] = [(x if x != +np.inf else +1e100) for x
-          in np.array(space.high).flatten()]
-    elif info['name'] == 'HighLow':
-      info['num_rows'] = space.num_rows
-      info['matrix'] = [((float(x) if x != -np.inf else -1e100) if x != +np.inf
-          else +1e100) for x in np.array(space.matrix).flatten()]
-    elif info['name'] == 'MultiDiscrete':
-      info['n'] = space.num_discrete_space
-      info['low'] = [(x if x != -np.inf else -1e100) for x
-          in np.array(space.low ).flatten()]
-      info['high'] = [(x if x != +np.inf else +1e100) for x
-          in np.array(space.high).flatten()]
-    return info
-
-  def record_episode_stats(self, instance_id):
-    env = self._lookup_env(instance_id)
-    self.envs[instance_id] = RecordEpisodeStatistics(env)
-
-  def env_close(self, instance_id):
-    env = self._lookup_env(instance_id)
-
-    if env != None:
-      env.close()
-      self._remove_env(instance_id)
-
-  def env_close_all(self):
-    for key in list(self.envs.keys()):
-        self.env_close(key)
+        while True:
+            try:
+                buffer = reader.recv()
+            except InvalidUsage as e:
+                # The rest of the request can't be skipped, the connection
+                # is closed after the error response.
+                connection.sendall(session.error(e))
+                return
+            if len(buffer) == 0:
+                return
+            session.process(buffer, connection.sendall)
+    except:
+        logger.debug("connection failed", exc_info=True)
+    finally:
+        # The instance is closed, or kept if the client can resume the
+        # session, and the socket is closed however the connection ended.
+        try:
+            session.end()
+        except:
+            logger.warning("closing the instances failed", exc_info=True)
+        connection.close()
 
-"""
-  Error handling.
-"""
-class InvalidUsage(Exception):
-  status_code = 400
-  def __init__(self, message, status_code=None, payload=None):
-    Exception.__init__(self)
-    self.message = message
-    if status_code is not None:
-      self.status_code = status_code
-    self.payload = payload
-
-  def to_dict(self):
-    rv = dict(self.payload or ())
-    rv['message'] = self.message
-    return rv
 
 """
-Json does not support float32/int64  serialization
-The following class converts to json defaults.
-So that json.dumps can serialize the dict to json.
+  Create the listening socket. With reuse_port several processes can bind the
+  same port and the kernel distributes the connections between them.
 """
-class NDArrayEncoder(json.JSONEncoder):
-  def default(self, obj):
-    if isinstance(obj, np.ndarray):
-      return obj.tolist()
-    try:
-      return json.JSONEncoder.default(self, obj)
-    except:
-      return obj.tolist()
+def listen_socket(host, port, backlog, reuse_port=False):
+    ServerSocket = socket.socket()
+    ServerSocket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuse_port:
+        ServerSocket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    ServerSocket.bind((host, port))
+    ServerSocket.listen(backlog)
+    return ServerSocket
 
 
 """
-  Parse parameters.
+  Counts the open connections, so that a draining server can wait until the
+  clients are done.
 """
-def get_optional_params(json, param1, param2):
-  if (param1 in json):
-    if param2 in json[param1]:
-      return json[param1][param2]
-    else:
-      return None
-  else:
-      return None
+class Connections(object):
+  def __init__(self):
+    self.count = 0
+    self.condition = threading.Condition()
 
-def get_optional_param(json, param):
-  if (param in json):
-    return json[param]
-  else:
-    return None
+  # Run the function and count the connection while it runs.
+  def run(self, function, *args):
+    with self.condition:
+      self.count += 1
+    try:
+      function(*args)
+    finally:
+      with self.condition:
+        self.count -= 1
+        self.condition.notify_all()
+
+  # Wait until all connections are closed or the timeout expired.
+  def wait(self, timeout):
+    with self.condition:
+      return self.condition.wait_for(lambda: self.count == 0, timeout)
+
+
+def serve_threaded(ServerSocket, drain_timeout):
+    ThreadCount = 0
+    connections = Connections()
+    draining = []
+
+    # SIGTERM stops accepting connections, the open connections are served
+    # until they are closed or the drain timeout expired.
+    def drain(signum, frame):
+        draining.append(signum)
+        ServerSocket.close()
+    signal.signal(signal.SIGTERM, drain)
+
+    logger.info("accepting connections",
+                extra={"address" : ServerSocket.getsockname()})
+
+    while True:
+        try:
+            Client, address = ServerSocket.accept()
+        except OSError:
+            if draining:
+                break
+            raise
+        start_new_thread(connections.run, (threaded_client, Client))
+        ThreadCount += 1
+        logger.debug("connection accepted",
+                     extra={"peer" : address, "connections" : ThreadCount})
 
+    connections.wait(drain_timeout)
 
-def process_data(data, level = 0):
-  if level > 0:
-    return zlib.compress(data.encode(), level) + b"\r\n\r\n"
 
-  return str.encode(data + "\r\n\r\n")
+async def async_client(reader, writer, executor, pipeline):
+    loop = asyncio.get_running_loop()
+    session = Session(Envs())
 
+    # Requests are read while the previous ones are handled, so that clients
+    # can pipeline requests. The queue bounds the number of requests in
+    # flight, the requests of a connection are handled in order.
+    requests = asyncio.Queue(maxsize=pipeline)
 
-def recv_client(connection):
-    data_len = 0
-    buffer = ''
-    while 1:
+    async def read_requests():
         try:
-          data = connection.recv(1).decode("utf-8")
+            while True:
+                buffer = await asyncio.wait_for(
+                    reader.readuntil(b"\r\n"), 60 * 20)
+                await requests.put(buffer)
+        except asyncio.LimitOverrunError:
+            await requests.put(InvalidUsage("The request exceeds the limit "
+                "of {} bytes".format(REQUEST_LIMIT), 413))
+        except (asyncio.IncompleteReadError, asyncio.TimeoutError,
+                ConnectionError):
+            pass
+        finally:
+            await requests.put(None)
+
+    reading = asyncio.ensure_future(read_requests())
+
+    try:
+        while True:
+            buffer = await requests.get()
+            if buffer is None:
+                return
+            if isinstance(buffer, InvalidUsage):
+                # The rest of the request can't be skipped, the connection
+                # is closed after the error response.
+                writer.write(session.error(buffer))
+                await writer.drain()
+                return
+
+            # gym.make, env.step and env.render might block, so the request
+            # is handled by the executor and not on the event loop.
+            data = await loop.run_in_executor(
+                executor, session.process, buffer)
+            if len(data) > 0:
+                writer.write(data)
+                await writer.drain()
+    except:
+        return
+    finally:
+        reading.cancel()
+        try:
+            await loop.run_in_executor(executor, session.end)
         except:
-          return ""
-        buffer += data
-        data_len = data_len + 1
-        if data_len >= 2 and buffer[data_len - 2:data_len] == '\r\n':
-            break
-    return buffer
+            logger.warning("closing the instances failed", exc_info=True)
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except ConnectionError:
+            pass
 
-def threaded_client(connection):
-    #connection.send(str.encode('Welcome to the Server\n'))
-    envs = Envs()
-    enviroment = None
-    instance_id = None
-    close = True
-    compressionLevel = 0
-    connection.settimeout(60 * 20)
 
-    """
-      Handle the incoming reponses.
-    """
-    def process_response(response, connection, envs, enviroment, instance_id, close, compressionLevel):
-      print("process")
+def serve_asyncio(ServerSocket, workers, pipeline, drain_timeout):
+    executor = ThreadPoolExecutor(max_workers=workers)
+    clients = set()
 
-      print(instance_id)
+    async def client(reader, writer):
+        task = asyncio.current_task()
+        clients.add(task)
+        try:
+            await async_client(reader, writer, executor, pipeline)
+        finally:
+            clients.discard(task)
+
+    async def serve():
+        server = await asyncio.start_server(
+            client, sock=ServerSocket, limit=REQUEST_LIMIT)
+
+        # SIGTERM stops accepting connections, the open connections are
+        # served until they are closed or the drain timeout expired.
+        stop = asyncio.Event()
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM,
+                                                      stop.set)
+
+        logger.info("accepting connections",
+                    extra={"address" : ServerSocket.getsockname()})
+        async with server:
+            await stop.wait()
+            server.close()
+            if clients:
+                await asyncio.wait(list(clients), timeout=drain_timeout)
 
-      #response = unicode(response, "utf-8")
-      data = response.strip()
+    try:
+        asyncio.run(serve())
+    finally:
+        executor.shutdown(wait=False)
 
-      if (len(data) == 0):
-        envs.env_close_all()
-        connection.send(str.encode(process_data("error", compressionLevel)))
-        return enviroment, instance_id, close, compressionLevel
 
-      jsonMessage = json.loads(data)
-      print(jsonMessage)
+"""
+  Serves the histograms of the request phases in the Prometheus text format
+  at /metrics.
+"""
+class MetricsHandler(BaseHTTPRequestHandler):
+  def do_GET(self):
+    if self.path != "/metrics":
+      self.send_error(404)
+      return
 
-      enviroment = get_optional_params(jsonMessage, "env", "name")
-      if isinstance(enviroment, basestring):
-        compressionLevel = 0
-        if instance_id != None:
-          envs.env_close(instance_id)
+    body = (stats.prometheus() + registry.prometheus()).encode()
+    self.send_response(200)
+    self.send_header("Content-Type", "text/plain; version=0.0.4")
+    self.send_header("Content-Length", str(len(body)))
+    self.end_headers()
+    self.wfile.write(body)
 
-        instance_id = envs.create(enviroment)
-        data = json.dumps({"instance" : instance_id}, cls = NDArrayEncoder)
-        connection.send(process_data(data, compressionLevel))
-        return enviroment, instance_id, close, compressionLevel
+  def log_message(self, format, *args):
+    pass
 
-      compression = get_optional_params(jsonMessage, "server", "compression")
-      if isinstance(compression, basestring):
-        try:
-          compressionLevel = int(compression)
-        except ValueError:
-          compressionLevel = 0
-          close = True
-
-      actionspace = get_optional_params(jsonMessage, "env", "actionspace")
-      if isinstance(actionspace, basestring):
-        if actionspace == "sample":
-          sample = envs.get_action_space_sample(instance_id)
-
-          data = json.dumps({"sample" : sample}, cls = NDArrayEncoder)
-          connection.send(process_data(data, compressionLevel))
-          return enviroment, instance_id, close, compressionLevel
-
-      envAction = get_optional_params(jsonMessage, "env", "action")
-      if isinstance(envAction, basestring):
-        if envAction == "close":
-          envs.env_close(instance_id)
-          close = False
-          connection.send(str.encode(""))
-          return enviroment, instance_id, close, compressionLevel
-        elif envAction == "reset":
-          observation = envs.reset(instance_id)
-          data = json.dumps({"observation" : observation}, cls = NDArrayEncoder)
-          connection.send(process_data(data, compressionLevel))
-          return enviroment, instance_id, close, compressionLevel
-        elif envAction == "actionspace":
-          info = envs.get_action_space_info(instance_id)
-          data = json.dumps({"info" : info}, cls = NDArrayEncoder)
-          connection.send(process_data(data, compressionLevel))
-          return enviroment, instance_id, close, compressionLevel
-        elif envAction == "observationspace":
-          info = envs.get_observation_space_info(instance_id)
-          data = json.dumps({"info" : info}, cls = NDArrayEncoder)
-          connection.send(process_data(data, compressionLevel))
-          return enviroment, instance_id, close, compressionLevel
-
-      step = get_optional_param(jsonMessage, "step")
-      if step is not None:
-        action = get_optional_param(jsonMessage["step"], "action")
-        render = get_optional_param(jsonMessage["step"], "render")
-
-        render = True if (render is not None and render == 1) else False
-
-        [obs, reward, done, info] = envs.step(
-                instance_id, action, render)
-
-        data = json.dumps({"observation" : obs,
-                           "reward" : reward,
-                           "done" : done,
-                           "info" : info}, cls = NDArrayEncoder)
-        connection.send(process_data(data, compressionLevel))
-        return enviroment, instance_id, close, compressionLevel
-
-      seed = get_optional_params(jsonMessage, "env", "seed")
-      if isinstance(seed, basestring):
-        envs.seed(seed)
-
-      url = get_optional_param(jsonMessage, "url")
-      if url is not None:
-          files = glob.glob("/var/log/gym/" + instance_id + "/*.mp4")
-          if len(files) > 0:
-              print(files)
-              os.system("ffmpeg -y -i " + files[0]  + " -c:v libvpx -crf 10 -b:v 1M -c:a libvorbis /var/log/gym/" + instance_id + "/output.webm")
-
-          data = json.dumps({"url" : "https://gym.kurg.org/" + instance_id + "/output.webm"}, cls = NDArrayEncoder)
-          connection.send(process_data(data, compressionLevel))
-          enviroment, instance_id, close, compressionLevel
-
-      record_episode_stats = get_optional_param(jsonMessage, "record_episode_stats")
-      if record_episode_stats is not None:
-        action = get_optional_param(jsonMessage["record_episode_stats"], "action")
-
-        if action == "start":
-          envs.record_episode_stats(instance_id)
-
-      connection.send(str.encode(""))
-      return enviroment, instance_id, close, compressionLevel
 
-    try:
-        while True:
-            buffer = recv_client(connection)
-            if len(buffer) == 0:
-                return
-            enviroment, instance_id, close, compressionLevel = process_response(buffer, connection, envs, enviroment, instance_id, close, compressionLevel)
-    except:
-        #connection.close()
-        return
-    connection.close()
-
-while True:
-    Client, address = ServerSocket.accept()
-    print('Connected to: ' + address[0] + ':' + str(address[1]))
-    start_new_thread(threaded_client, (Client, ))
-    ThreadCount += 1
-    print('Thread Number: ' + str(ThreadCount))
-ServerSocket.close()
\ No newline at end of file
+class MetricsServer(ThreadingHTTPServer):
+  daemon_threads = True
+
+  def server_bind(self):
+    # The processes started by SIGHUP bind the port while the old ones drain.
+    if hasattr(socket, "SO_REUSEPORT"):
+      self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    ThreadingHTTPServer.server_bind(self)
+
+
+def serve_metrics(host, port):
+    server = MetricsServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+"""
+  Configure the environment pool and the timers and serve the connections
+  accepted on the given socket. The index of the process is added to the
+  port of the metrics endpoint.
+"""
+def serve(args, ServerSocket, index=0):
+    setup_logging(args.log_level, args.log_sample, args.log_format)
+    stats.enabled = args.stats or args.stats_port is not None
+    if args.stats_port is not None:
+        serve_metrics(args.host, args.stats_port + index)
+
+    serialization.use(args.json)
+    exporter.configure(args.video_dir, args.video_url, args.export_workers,
+                       args.export_queue)
+
+    pool.size = args.pool_size
+    pool.ttl = args.pool_ttl
+    for env_id in args.prewarm:
+        pool.prewarm(env_id)
+
+    shard_writer.configure(args.record_dir, args.record_shard_size)
+    registry.configure(args.instance_ttl, args.max_instances,
+                       args.max_rss * 1024 * 1024)
+    Envs.snapshot_limit = args.snapshots
+    # A reconnecting client may reach another process, which doesn't know
+    # the token.
+    sessions.timeout = args.resume_timeout if args.workers == 1 else 0
+
+    if args.asyncio:
+        serve_asyncio(ServerSocket, args.executor_workers, args.pipeline,
+                      args.drain_timeout)
+    else:
+        serve_threaded(ServerSocket, args.drain_timeout)
+
+
+"""
+  Pre-fork the server processes and restart the processes that exit
+  unexpectedly. Each process accepts on its own SO_REUSEPORT socket, or on a
+  socket shared by all processes if SO_REUSEPORT isn't available, and keeps
+  its own environments, so a connection stays on the process that accepted
+  it. SIGTERM and SIGINT drain the processes and stop the server, SIGHUP
+  starts new processes and drains the old ones.
+"""
+class Supervisor(object):
+  def __init__(self, args):
+    self.args = args
+    self.children = {}
+    self.retired = set()
+    self.stopping = False
+
+    self.ServerSocket = None
+    if not hasattr(socket, "SO_REUSEPORT"):
+      self.ServerSocket = listen_socket(args.host, args.port, args.backlog)
+
+  # Fork the server process with the given index.
+  def spawn(self, index):
+    pid = os.fork()
+    if pid == 0:
+      code = 0
+      try:
+        # The supervisor forwards SIGINT as SIGTERM.
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGHUP, signal.SIG_DFL)
+        ServerSocket = self.ServerSocket
+        if ServerSocket is None:
+          ServerSocket = listen_socket(self.args.host, self.args.port,
+              self.args.backlog, reuse_port=True)
+        serve(self.args, ServerSocket, index)
+      except BaseException:
+        logger.exception("server process failed")
+        code = 1
+      finally:
+        os._exit(code)
+
+    self.children[pid] = (time.monotonic(), index)
+
+  # Drain all processes and stop once they exited.
+  def stop(self, signum, frame):
+    self.stopping = True
+    self.signal(list(self.children))
+
+  # Replace the processes with new ones, the old ones are drained.
+  def reload(self, signum, frame):
+    old = [pid for pid in self.children if pid not in self.retired]
+    for pid in old:
+      self.spawn(self.children[pid][1])
+    self.retired.update(old)
+    self.signal(old)
+
+  def signal(self, pids):
+    for pid in pids:
+      try:
+        os.kill(pid, signal.SIGTERM)
+      except ProcessLookupError:
+        pass
+
+  def run(self):
+    setup_logging(self.args.log_level, self.args.log_sample,
+        self.args.log_format)
+    signal.signal(signal.SIGTERM, self.stop)
+    signal.signal(signal.SIGINT, self.stop)
+    signal.signal(signal.SIGHUP, self.reload)
+
+    for index in range(self.args.workers):
+      self.spawn(index)
+
+    while self.children:
+      try:
+        pid, status = os.wait()
+      except ChildProcessError:
+        break
+
+      child = self.children.pop(pid, None)
+      if pid in self.retired:
+        self.retired.discard(pid)
+      elif child is not None and not self.stopping:
+        started, index = child
+        logger.warning("server process exited, restarting",
+                       extra={"pid" : pid, "status" : status})
+        # Don't restart a process that fails on startup in a busy loop.
+        if time.monotonic() - started < 1:
+          time.sleep(1)
+        if not self.stopping:
+          self.spawn(index)
+
+    if self.ServerSocket is not None:
+      self.ServerSocket.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="gym TCP API server.")
+    parser.add_argument("--host", default="127.0.0.1",
+                        help="Address to listen on.")
+    parser.add_argument("--port", type=int, default=4040,
+                        help="Port to listen on.")
+    parser.add_argument("--backlog", type=int, default=128,
+                        help="Size of the accept backlog.")
+    parser.add_argument("--asyncio", action="store_true",
+                        help="Serve all connections on a single asyncio event "
+                        "loop instead of one thread per connection.")
+    parser.add_argument("--executor-workers", type=int, default=8,
+                        help="Number of threads used to run the environments "
+                        "in asyncio mode.")
+    parser.add_argument("--pipeline", type=int, default=64,
+                        help="Maximum number of requests in flight per "
+                        "connection in asyncio mode.")
+    parser.add_argument("--pool-size", type=int, default=2,
+                        help="Number of idle environments per environment id "
+                        "kept for reuse.")
+    parser.add_argument("--pool-ttl", type=float, default=300,
+                        help="Seconds an idle environment is kept for reuse.")
+    parser.add_argument("--prewarm", nargs="*", default=[],
+                        help="Environment ids to construct at startup.")
+    parser.add_argument("--instance-ttl", type=float, default=3600,
+                        help="Seconds after which an unused instance is "
+                        "closed, 0 disables the eviction.")
+    parser.add_argument("--max-instances", type=int, default=0,
+                        help="Maximum number of instances of a process, the "
+                        "least recently used ones are closed first; 0 is "
+                        "unlimited.")
+    parser.add_argument("--max-rss", type=int, default=0,
+                        help="Resident memory in MiB above which the least "
+                        "recently used instances are closed before a create; "
+                        "0 is unlimited.")
+    parser.add_argument("--snapshots", type=int, default=16,
+                        help="Number of snapshots kept per instance.")
+    parser.add_argument("--resume-timeout", type=float, default=60,
+                        help="Seconds the instance of a session with a token "
+                        "is kept after the connection ended, 0 disables the "
+                        "resumption, as does --workers.")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Number of server processes, each process serves "
+                        "its connections on its own core.")
+    parser.add_argument("--drain-timeout", type=float, default=30,
+                        help="Seconds a stopped server process keeps serving "
+                        "its open connections.")
+    parser.add_argument("--stats", action="store_true",
+                        help="Record the duration of the request phases.")
+    parser.add_argument("--stats-port", type=int, default=None,
+                        help="Serve the recorded durations in the Prometheus "
+                        "format on this port, process i of --workers uses "
+                        "the port plus i.")
+    parser.add_argument("--video-dir", default="/var/log/gym",
+                        help="Directory of the recorded videos, one "
+                        "directory per instance.")
+    parser.add_argument("--video-url", default="https://gym.kurg.org/",
+                        help="Url the video directory is served at.")
+    parser.add_argument("--export-workers", type=int, default=1,
+                        help="Number of videos converted at the same time.")
+    parser.add_argument("--export-queue", type=int, default=16,
+                        help="Number of video conversions waiting at most.")
+    parser.add_argument("--record-dir", default=DIRECTORY,
+                        help="Directory of the recorded trajectories, "
+                        "default gym/trajectories in the temporary "
+                        "directory.")
+    parser.add_argument("--record-shard-size", type=int, default=10000,
+                        help="Number of transitions per trajectory shard.")
+    parser.add_argument("--json", default="stdlib",
+                        choices=["stdlib", "orjson", "auto"],
+                        help="JSON backend, auto uses orjson if it is "
+                        "installed. orjson writes no whitespace, exponents "
+                        "like 1e16, NaN and infinity as null and float32 "
+                        "values in the info with float32 digits.")
+    parser.add_argument("--log-level", default="INFO",
+                        help="Level of the logged records, DEBUG logs every "
+                        "request.")
+    parser.add_argument("--log-format", default="json",
+                        choices=["json", "text"],
+                        help="Format of the logged records.")
+    parser.add_argument("--log-sample", default=None,
+                        help="Sampling rates of the logged requests per "
+                        "operation, e.g. step=0.01,reset=0.1.")
+    args = parser.parse_args()
+
+    if args.workers > 1:
+        if not hasattr(os, "fork"):
+            parser.error("--workers requires a platform with fork")
+        Supervisor(args).run()
+    else:
+        serve(args, listen_socket(args.host, args.port, args.backlog))
@@ -1,8 +1,147 @@
 defmodule GymTcpApiTest do
   use ExUnit.Case
-  doctest GymTcpApi
 
-  test "the truth" do
-    assert 1 + 1 == 2
+  alias GymTcpApi.NodeManager
+
+  @state %{latency: 0.0, interpreters: %{}}
+
+  test "a single node selects itself" do
+    for strategy <- [:power_of_two, :least_loaded, :random] do
+      put_config(:node_selection, strategy)
+      assert NodeManager.select_node(nil) == Node.self()
+    end
+  end
+
+  test "the load of the node is published" do
+    assert {:noreply, _} = NodeManager.handle_info(:publish, @state)
+    assert [{_, load, _}] = :ets.lookup(:gym_node_load, {:node, Node.self()})
+    assert load.free + load.busy > 0
+  end
+
+  test "the load isn't published while the pool isn't running" do
+    :ok = Supervisor.terminate_child(GymTcpApi.Supervisor,
+        GymTcpApi.pool_name())
+    on_exit(fn ->
+      Supervisor.restart_child(GymTcpApi.Supervisor, GymTcpApi.pool_name())
+    end)
+    :ets.delete(:gym_node_load, {:node, Node.self()})
+
+    assert NodeManager.handle_info(:publish, @state) == {:noreply, @state}
+    assert :ets.lookup(:gym_node_load, {:node, Node.self()}) == []
+  end
+
+  test "the table outlives a restart of the manager" do
+    :ets.update_counter(:gym_node_load, :interpreters, 1)
+    count = NodeManager.metrics().interpreters
+    Process.exit(Process.whereis(NodeManager), :kill)
+    wait_until(fn ->
+      pid = Process.whereis(NodeManager)
+      pid != nil and Process.alive?(pid)
+    end)
+
+    assert NodeManager.metrics().interpreters == count
+    :ets.update_counter(:gym_node_load, :interpreters, -1)
+  end
+
+  test "checkout rejects the requests over the queue bound" do
+    pool = start_pool()
+    put_config(:queue, 0)
+    rejected = NodeManager.metrics().rejected
+
+    assert NodeManager.checkout(pool) == {:error, :busy}
+    assert NodeManager.metrics().rejected == rejected + 1
+    assert NodeManager.metrics().waiting == 0
+  end
+
+  test "checkout waits at most checkout_timeout for a worker" do
+    pool = start_pool()
+    put_config(:checkout_timeout, 50)
+    %{checkouts: checkouts, rejected: rejected} = NodeManager.metrics()
+
+    assert {:ok, worker} = NodeManager.checkout(pool)
+    assert NodeManager.checkout(pool) == {:error, :busy}
+    assert NodeManager.metrics().rejected == rejected + 1
+
+    # A worker checked in while a request waits is handed to the request.
+    put_config(:checkout_timeout, 5000)
+    parent = self()
+    spawn_link(fn -> send(parent, {:checkout, NodeManager.checkout(pool)}) end)
+    wait_until(fn -> NodeManager.metrics().waiting == 1 end)
+    :poolboy.checkin(pool, worker)
+    assert_receive {:checkout, {:ok, ^worker}}
+
+    assert NodeManager.metrics().checkouts == checkouts + 3
+    assert NodeManager.metrics().waiting == 0
+  end
+
+  test "the interpreters are counted up to the limit" do
+    count = NodeManager.metrics().interpreters
+
+    assert NodeManager.acquire_interpreter(count + 1)
+    refute NodeManager.acquire_interpreter(count + 1)
+    assert NodeManager.metrics().interpreters == count + 1
+
+    # The min number of interpreters keep running.
+    refute NodeManager.release_interpreter(count + 1)
+    assert NodeManager.release_interpreter(count)
+    assert NodeManager.metrics().interpreters == count
+  end
+
+  test "the interpreter of an exited worker is uncounted" do
+    count = NodeManager.metrics().interpreters
+    parent = self()
+    worker = spawn(fn ->
+      send(parent, {:acquired, NodeManager.acquire_interpreter(count + 1)})
+      receive do
+        :exit -> :ok
+      end
+    end)
+
+    assert_receive {:acquired, true}
+    assert NodeManager.metrics().interpreters == count + 1
+    send(worker, :exit)
+    wait_until(fn -> NodeManager.metrics().interpreters == count end)
+  end
+
+  # A pool with a single worker, which doesn't start an interpreter.
+  defp start_pool do
+    {:ok, pool} = :poolboy.start_link([worker_module: GymTcpApiTest.Worker,
+        size: 1, max_overflow: 0])
+    pool
+  end
+
+  defp put_config(key, value) do
+    previous = Application.fetch_env(:gym_tcp_api, key)
+    Application.put_env(:gym_tcp_api, key, value)
+    on_exit(fn ->
+      case previous do
+        {:ok, previous} -> Application.put_env(:gym_tcp_api, key, previous)
+        :error -> Application.delete_env(:gym_tcp_api, key)
+      end
+    end)
+  end
+
+  defp wait_until(condition, tries \\ 100) do
+    cond do
+      condition.() ->
+        :ok
+      tries > 0 ->
+        Process.sleep(10)
+        wait_until(condition, tries - 1)
+      true ->
+        flunk("condition not met")
+    end
+  end
+end
+
+defmodule GymTcpApiTest.Worker do
+  use GenServer
+
+  def start_link(_args) do
+    GenServer.start_link(__MODULE__, nil)
+  end
+
+  def init(state) do
+    {:ok, state}
   end
 end
@@ -0,0 +1,113 @@
+"""
+  @file conftest.py
+
+  The modules of the Python worker are imported from priv/, like
+  python/server.py does, and the server from python/. The helpers send the
+  requests of a client to a Session and decode the responses.
+"""
+
+import json
+import os
+import struct
+import sys
+
+import gym
+import numpy as np
+import pytest
+from gym import spaces
+
+for path in ("priv", "python"):
+  sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+      "..", path))
+
+import serialization
+from encoding import DTYPES, HEADER, LENGTH
+from environments import registry
+from protocol import Session
+
+
+"""
+  An 8x8 image which changes a single pixel per step, so that the delta
+  encoding sends deltas. The episode ends after 20 steps.
+"""
+class PixelEnv(gym.Env):
+  def __init__(self):
+    self.observation_space = spaces.Box(0, 255, (8, 8), np.uint8)
+    self.action_space = spaces.Discrete(2)
+    self.image = np.zeros((8, 8), np.uint8)
+    self.steps = 0
+
+  def reset(self):
+    self.image = np.zeros((8, 8), np.uint8)
+    self.steps = 0
+    return self.image.copy()
+
+  def step(self, action):
+    self.image.reshape(-1)[self.steps] = 1 + action
+    self.steps += 1
+    return self.image.copy(), 1.0, self.steps >= 20, {}
+
+
+gym.envs.registration.register(id="Pixel-v0", entry_point=PixelEnv)
+
+
+@pytest.fixture
+def session():
+  created = []
+
+  def create():
+    created.append(Session())
+    return created[-1]
+
+  yield create
+  for s in created:
+    s.token = None
+    s.end()
+  registry.configure(0, 0, 0)
+  serialization.use("stdlib")
+
+
+def send(session, message):
+  return session.handle(json.dumps(message).encode())
+
+
+def load(data):
+  assert data.endswith(b"\r\n\r\n")
+  return json.loads(data)
+
+
+# The header, the meta data and the observation of a binary frame; a delta
+# frame returns the changed values and their indices as observation.
+def load_frame(data):
+  length, = LENGTH.unpack_from(data)
+  body = data[LENGTH.size:]
+  assert len(body) == length
+
+  code, flags, ndim, reward, meta_length = HEADER.unpack_from(body)
+  offset = HEADER.size
+  shape = struct.unpack_from("<%dI" % ndim, body, offset)
+  offset += 4 * ndim
+  meta = json.loads(body[offset:offset + meta_length])
+  offset += meta_length
+
+  dtype = np.dtype(DTYPES[code])
+  count = int(np.prod(shape))
+  observation = np.frombuffer(body, dtype, count, offset).reshape(shape)
+  if flags & 2:
+    index = np.frombuffer(body, "<u4", count, offset + count * dtype.itemsize)
+    observation = (index, observation)
+  return flags, reward, meta, observation
+
+
+# Apply a delta to the last observation, the indices refer to the element
+# order of the C++ client.
+def apply_delta(observation, index, values):
+  image = np.array(observation.T, order="C")
+  image.reshape(-1)[index] = values
+  return image.T
+
+
+def create(session, name="Pixel-v0"):
+  instance = load(send(session, {"env" : {"name" : name}}))["instance"]
+  assert isinstance(instance, str)
+  return instance
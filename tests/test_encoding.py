@@ -0,0 +1,196 @@
+"""
+  @file test_encoding.py
+
+  Tests of the binary frames, the stream compression and the delta encoding
+  of the observations.
+"""
+
+import json
+import zlib
+
+import gym
+import numpy as np
+import pytest
+
+from conftest import apply_delta, create, load, load_frame, send
+from encoding import (DeltaEncoder, LENGTH, StreamCompressor,
+    encode_observation)
+
+
+@pytest.mark.parametrize("dtype, expected", [
+    (np.uint8, np.uint8),
+    (np.float32, np.float32),
+    (np.int64, np.int64),
+    (np.bool_, np.uint8),
+    (np.float16, np.float64),
+])
+def test_frame_dtypes(dtype, expected):
+  observation = np.arange(6).reshape(2, 3).astype(dtype)
+  flags, reward, meta, decoded = load_frame(encode_observation(observation,
+      0.5, True, '{"info": {}}'))
+  assert flags == 1 and reward == 0.5
+  assert meta == {"info" : {}}
+  assert decoded.dtype == expected and decoded.shape == (2, 3)
+  assert (decoded == observation.astype(expected)).all()
+
+
+def test_frame_non_contiguous():
+  observation = np.arange(12, dtype=np.int32).reshape(3, 4)[:, ::2]
+  decoded = load_frame(encode_observation(observation, 0, False, "{}"))[3]
+  assert (decoded == observation).all()
+
+
+def test_binary_frames(session):
+  s = session()
+  create(s)
+  assert send(s, {"server" : {"encoding" : "binary"}}) == b""
+
+  flags, reward, meta, observation = load_frame(
+      send(s, {"env" : {"action" : "reset"}}))
+  assert flags == 0 and reward == 0.0
+  assert observation.dtype == np.uint8 and observation.shape == (8, 8)
+  assert not observation.any()
+
+  flags, reward, meta, observation = load_frame(send(s, {"step" : {
+      "action" : 0}, "id" : 3}))
+  assert flags == 0 and reward == 1.0
+  assert meta == {"info" : {}, "id" : 3}
+  assert observation[0, 0] == 1
+
+  flags, reward, meta, observation = load_frame(send(s, {"step" : {
+      "action" : 1, "repeat" : 19}}))
+  assert flags & 1
+  assert reward == 19.0
+
+
+def test_binary_float32_observation(session):
+  s = session()
+  create(s, "CartPole-v1")
+  send(s, {"server" : {"encoding" : "binary"}})
+  observation = load_frame(send(s, {"env" : {"action" : "reset"}}))[3]
+  assert observation.dtype == np.float32 and observation.shape == (4,)
+
+
+def test_stream_compressor():
+  compressor = StreamCompressor(6)
+  decompressor = zlib.decompressobj()
+  message = b'{"observation": [0, 0, 0, 0, 0, 0, 0, 0]}'
+  sizes = []
+  for _ in range(3):
+    data = compressor.compress(message)
+    length, = LENGTH.unpack_from(data)
+    assert len(data) == LENGTH.size + length
+    sizes.append(length)
+    # Each message is flushed and decompresses completely.
+    assert decompressor.decompress(data[LENGTH.size:]) == message
+
+  # The following messages refer to the first one.
+  assert sizes[1] < sizes[0] and sizes[2] < sizes[0]
+
+  with pytest.raises(ValueError):
+    StreamCompressor(10)
+
+
+def test_compression(session):
+  s = session()
+  create(s)
+  reference = gym.make("Pixel-v0")
+  assert send(s, {"server" : {"compression" : "6"}}) == b""
+  decompressor = zlib.decompressobj()
+
+  def load_compressed(data):
+    length, = LENGTH.unpack_from(data)
+    assert len(data) == LENGTH.size + length
+    return json.loads(decompressor.decompress(data[LENGTH.size:]))
+
+  response = load_compressed(send(s, {"env" : {"action" : "reset"}}))
+  assert response["observation"] == reference.reset().tolist()
+  for _ in range(3):
+    response = load_compressed(send(s, {"step" : {"action" : 1}}))
+    assert response["observation"] == reference.step(1)[0].tolist()
+
+  # An invalid level disables the compression.
+  send(s, {"server" : {"compression" : "12"}})
+  assert "observation" in load(send(s, {"env" : {"action" : "reset"}}))
+
+
+def test_compressed_binary_frames(session):
+  s = session()
+  create(s)
+  send(s, {"server" : {"encoding" : "binary"}})
+  send(s, {"server" : {"compression" : "3"}})
+  decompressor = zlib.decompressobj()
+
+  data = send(s, {"env" : {"action" : "reset"}})
+  body = decompressor.decompress(data[LENGTH.size:])
+  flags, _, _, observation = load_frame(LENGTH.pack(len(body)) + body)
+  assert observation.shape == (8, 8) and not observation.any()
+
+
+def test_delta_encoder():
+  encoder = DeltaEncoder(interval=2)
+  observation = np.zeros((4, 4), np.uint8)
+  assert encoder.encode(observation) is None
+
+  # The indices refer to the element order of the C++ client.
+  observation[1, 2] = 5
+  index, values = encoder.encode(observation)
+  assert index.tolist() == [2 * 4 + 1] and values.tolist() == [5]
+  assert index.dtype == np.uint32
+
+  observation[0, 0] = 1
+  assert encoder.encode(observation)[0].tolist() == [0]
+  # A keyframe after interval deltas.
+  assert encoder.encode(observation) is None
+  assert encoder.encode(observation)[0].size == 0
+
+  # A keyframe if the delta isn't smaller than the observation, or after
+  # the client lost its copy.
+  assert encoder.encode(observation + 1) is None
+  encoder.clear()
+  assert encoder.encode(observation + 1) is None
+
+
+def test_delta_json(session):
+  s = session()
+  create(s)
+  reference = gym.make("Pixel-v0")
+  send(s, {"server" : {"delta" : 4}})
+
+  response = load(send(s, {"env" : {"action" : "reset"}}))
+  observation = np.array(response["observation"], np.uint8)
+  assert (observation == reference.reset()).all()
+
+  keyframes = 0
+  for step in range(10):
+    response = load(send(s, {"step" : {"action" : step % 2}}))
+    expected = reference.step(step % 2)[0]
+    if "delta" in response:
+      # A single pixel changes per step.
+      delta = response["delta"]
+      assert len(delta["index"]) == 1
+      observation = apply_delta(observation, delta["index"], delta["value"])
+    else:
+      keyframes += 1
+      observation = np.array(response["observation"], np.uint8)
+    assert (observation == expected).all()
+
+  # A keyframe after every 4 deltas.
+  assert keyframes == 2
+
+
+def test_delta_binary(session):
+  s = session()
+  create(s)
+  reference = gym.make("Pixel-v0")
+  send(s, {"server" : {"encoding" : "binary"}})
+  send(s, {"server" : {"delta" : 30}})
+
+  _, _, _, observation = load_frame(send(s, {"env" : {"action" : "reset"}}))
+  reference.reset()
+  for step in range(5):
+    flags, _, _, delta = load_frame(send(s, {"step" : {"action" : 1}}))
+    assert flags & 2
+    index, values = delta
+    observation = apply_delta(observation, index, values)
+    assert (observation == reference.step(1)[0]).all()
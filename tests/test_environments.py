@@ -0,0 +1,178 @@
+"""
+  @file test_environments.py
+
+  Tests of the pool of constructed environments and of the cache of the
+  space descriptions.
+"""
+
+import json
+import time
+
+import gym
+import pytest
+
+import environments
+import serialization
+from conftest import PixelEnv, create, load, send
+from environments import EnvPool, SpaceCache
+
+
+"""
+  Counts the constructed and the closed environments.
+"""
+class CountingEnv(PixelEnv):
+  made = 0
+  closed = 0
+
+  def __init__(self):
+    super(CountingEnv, self).__init__()
+    CountingEnv.made += 1
+
+  def close(self):
+    CountingEnv.closed += 1
+
+
+gym.envs.registration.register(id="Counting-v0", entry_point=CountingEnv)
+
+
+def counts():
+  return CountingEnv.made, CountingEnv.closed
+
+
+def test_pool_reuse():
+  pool = EnvPool(size=1)
+  made, closed = counts()
+  env, memory = pool.acquire("Counting-v0")
+  env.reset()
+  env.step(1)
+  pool.release("Counting-v0", env, 1234)
+
+  # The environment is reused with its memory and reset.
+  reused, memory = pool.acquire("Counting-v0")
+  assert reused is env
+  assert memory == 1234
+  assert reused.unwrapped.steps == 0
+  assert counts() == (made + 1, closed)
+
+
+def test_pool_size():
+  pool = EnvPool(size=1)
+  made, closed = counts()
+  first, _ = pool.acquire("Counting-v0")
+  second, _ = pool.acquire("Counting-v0")
+  pool.release("Counting-v0", first)
+  pool.release("Counting-v0", second)
+  # The pool is full, the second environment is closed.
+  assert counts() == (made + 2, closed + 1)
+  assert pool.acquire("Counting-v0")[0] is first
+
+
+def test_pool_disabled():
+  pool = EnvPool()
+  made, closed = counts()
+  env, _ = pool.acquire("Counting-v0")
+  pool.release("Counting-v0", env)
+  assert counts() == (made + 1, closed + 1)
+
+
+def test_pool_ttl():
+  pool = EnvPool(size=2, ttl=0.01)
+  made, closed = counts()
+  env, _ = pool.acquire("Counting-v0")
+  pool.release("Counting-v0", env)
+  time.sleep(0.02)
+
+  # The idle environment expired, a new one is constructed.
+  assert pool.acquire("Counting-v0")[0] is not env
+  assert counts() == (made + 2, closed + 1)
+
+
+def test_pool_prewarm():
+  pool = EnvPool(size=2)
+  made, closed = counts()
+  pool.prewarm("Counting-v0")
+  pool.prewarm("Counting-v0")
+  assert len(pool.idle["Counting-v0"]) == 2
+  assert counts() == (made + 2, closed)
+
+
+def test_pooled_instance(session, monkeypatch):
+  monkeypatch.setattr(environments.pool, "size", 1)
+  s = session()
+  made, closed = counts()
+  create(s, "Counting-v0")
+  send(s, {"env" : {"action" : "reset"}})
+  send(s, {"step" : {"action" : 1}})
+  send(s, {"env" : {"action" : "close"}})
+
+  # The environment of the closed instance is reused by the next instance,
+  # with the preprocessing of the new instance.
+  response = load(send(s, {"env" : {"name" : "Counting-v0",
+      "preprocess" : [{"name" : "stack", "num" : 2}]}}))
+  assert "instance" in response
+  response = load(send(s, {"env" : {"action" : "reset"}}))
+  assert len(response["observation"][0][0]) == 2
+  assert counts() == (made + 1, closed)
+
+  # The environment is returned to the pool without the wrappers.
+  s.end()
+  assert counts() == (made + 1, closed)
+  assert len(environments.pool.idle.pop("Counting-v0")) == 1
+
+
+def test_space_cache_lru():
+  cache = SpaceCache(size=2)
+  created = []
+
+  def create(key):
+    return lambda: created.append(key) or key.encode()
+
+  assert cache.get(("a",), create("a")) == b"a"
+  assert cache.get(("b",), create("b")) == b"b"
+  assert cache.get(("a",), create("a")) == b"a"
+  # The least recently used entry is dropped.
+  cache.get(("c",), create("c"))
+  cache.get(("a",), create("a"))
+  cache.get(("b",), create("b"))
+  assert created == ["a", "b", "c", "b"]
+
+
+def test_space_response(session):
+  s = session()
+  create(s, "CartPole-v1")
+  data = send(s, {"env" : {"action" : "observationspace"}})
+  info = load(data)["info"]
+  assert info["name"] == "Box" and info["shape"] == [4]
+  assert load(send(s, {"env" : {"action" : "actionspace"}, "id" : 3})) == {
+      "info" : {"name" : "Discrete", "n" : 2}, "id" : 3}
+
+  # Another instance of the environment is served from the cache.
+  t = session()
+  create(t, "CartPole-v1")
+  key = ("CartPole-v1", None, "observation_space", "stdlib")
+  assert environments.space_cache.entries[key] + b"\r\n\r\n" == data
+  assert send(t, {"env" : {"action" : "observationspace"}}) == data
+
+
+def test_space_response_preprocessing(session):
+  s = session()
+  create(s)
+  send(s, {"env" : {"name" : "Pixel-v0", "preprocess" : [
+      {"name" : "stack", "num" : 3}]}})
+  info = load(send(s, {"env" : {"action" : "observationspace"}}))["info"]
+  assert info["shape"] == [8, 8, 3]
+  create(s)
+  info = load(send(s, {"env" : {"action" : "observationspace"}}))["info"]
+  assert info["shape"] == [8, 8]
+
+
+@pytest.mark.skipif("orjson" not in serialization.BACKENDS,
+    reason="orjson is not installed")
+def test_space_response_backends(session):
+  s = session()
+  create(s, "CartPole-v1")
+  stdlib = send(s, {"env" : {"action" : "observationspace"}, "id" : 1})
+  serialization.use("orjson")
+  native = send(s, {"env" : {"action" : "observationspace"}, "id" : 1})
+  assert json.loads(native) == json.loads(stdlib)
+  assert b", " in stdlib and b", " not in native
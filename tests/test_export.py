@@ -0,0 +1,148 @@
+"""
+  @file test_export.py
+
+  Tests of the background export of the recorded videos. The conversion is
+  replaced by a command which writes the output, so that the tests don't
+  require ffmpeg.
+"""
+
+import os
+import subprocess
+import threading
+
+import pytest
+
+import export
+from conftest import create, load, send
+from export import VideoExporter
+
+
+"""
+  Replaces the ffmpeg command; the conversions wait until they are released
+  and fail while failing is set.
+"""
+class Converter(object):
+  def __init__(self):
+    self.commands = []
+    self.release = threading.Event()
+    self.failing = False
+
+  def __call__(self, command, **kwargs):
+    self.commands.append(command)
+    self.release.wait(10)
+    if self.failing:
+      raise subprocess.CalledProcessError(1, command, stderr=b"invalid")
+    with open(command[-1], "wb") as f:
+      f.write(b"webm")
+
+
+@pytest.fixture
+def converter(monkeypatch):
+  converter = Converter()
+  monkeypatch.setattr(export.subprocess, "run", converter)
+  yield converter
+  converter.release.set()
+
+
+def record(directory, instance_id, name="video.mp4", mtime=None):
+  path = os.path.join(str(directory), instance_id)
+  os.makedirs(path, exist_ok=True)
+  source = os.path.join(path, name)
+  with open(source, "wb") as f:
+    f.write(b"mp4")
+  if mtime is not None:
+    os.utime(source, (mtime, mtime))
+  return source
+
+
+# Release the conversions and wait for the export; the single worker runs
+# the jobs in order.
+def finish(converter, exporter):
+  converter.release.set()
+  exporter.executor.submit(lambda: None).result(10)
+
+
+def test_missing(tmp_path, converter):
+  exporter = VideoExporter(str(tmp_path), "http://videos/", 1, 1)
+  assert exporter.request(None) == {"status" : "missing"}
+  assert exporter.request("a") == {"status" : "missing",
+      "url" : "http://videos/a/output.webm"}
+  assert converter.commands == []
+
+
+def test_export(tmp_path, converter):
+  exporter = VideoExporter(str(tmp_path), "http://videos/", 1, 1)
+  source = record(tmp_path, "a")
+  assert exporter.request("a")["status"] == "pending"
+  # A running export isn't started again.
+  assert exporter.request("a")["status"] == "pending"
+
+  finish(converter, exporter)
+  assert len(converter.commands) == 1
+  assert converter.commands[0][converter.commands[0].index("-i") + 1] == source
+  assert exporter.request("a") == {"status" : "ready",
+      "url" : "http://videos/a/output.webm"}
+  assert not os.path.exists(str(tmp_path / "a" / "output.webm.part"))
+  assert exporter.jobs == {} and exporter.pending == 0
+
+
+def test_changed_recording(tmp_path, converter):
+  exporter = VideoExporter(str(tmp_path), "http://videos/", 1, 1)
+  record(tmp_path, "a", mtime=1000)
+  exporter.request("a")
+  finish(converter, exporter)
+  output = str(tmp_path / "a" / "output.webm")
+  os.utime(output, (2000, 2000))
+  assert exporter.request("a")["status"] == "ready"
+
+  # The latest recording is newer than the output and exported again.
+  converter.release.clear()
+  source = record(tmp_path, "a", "later.mp4", mtime=3000)
+  assert exporter.request("a")["status"] == "pending"
+  finish(converter, exporter)
+  assert converter.commands[-1][converter.commands[-1].index("-i") + 1] == (
+      source)
+  assert exporter.request("a")["status"] == "ready"
+
+
+def test_busy(tmp_path, converter):
+  exporter = VideoExporter(str(tmp_path), "http://videos/", 1, 1)
+  record(tmp_path, "a")
+  record(tmp_path, "b")
+  assert exporter.request("a")["status"] == "pending"
+  # The queue is full until the export of a finished.
+  assert exporter.request("b")["status"] == "busy"
+  finish(converter, exporter)
+
+  assert exporter.request("b")["status"] == "pending"
+  finish(converter, exporter)
+  assert exporter.request("b")["status"] == "ready"
+
+
+def test_failed(tmp_path, converter):
+  exporter = VideoExporter(str(tmp_path), "http://videos/", 1, 1)
+  record(tmp_path, "a")
+  converter.failing = True
+  exporter.request("a")
+  finish(converter, exporter)
+
+  # A failed export isn't retried until the recording changes.
+  assert exporter.request("a")["status"] == "failed"
+  assert len(converter.commands) == 1
+  assert exporter.pending == 0
+  assert not os.path.exists(str(tmp_path / "a" / "output.webm"))
+
+
+def test_url_request(session, tmp_path, converter, monkeypatch):
+  exporter = VideoExporter(str(tmp_path), "http://videos/", 1, 1)
+  monkeypatch.setattr(export.exporter, "request", exporter.request)
+  s = session()
+  create(s)
+  response = load(send(s, {"url" : 1, "id" : 4}))
+  assert response == {"status" : "missing",
+      "url" : "http://videos/{}/output.webm".format(s.instance_id), "id" : 4}
+
+  record(tmp_path, s.instance_id)
+  assert load(send(s, {"url" : 1}))["status"] == "pending"
+  finish(converter, exporter)
+  assert load(send(s, {"url" : 1}))["status"] == "ready"
@@ -0,0 +1,116 @@
+"""
+  @file test_logs.py
+
+  Tests of the logging setup: the JSON records, the sampling of the request
+  records per operation and the background writer.
+"""
+
+import io
+import json
+import logging
+
+import pytest
+
+import logs
+from conftest import create, send
+from logs import Sampler, parse_sample, request_operation, setup_logging
+
+
+@pytest.fixture
+def records():
+  root = logging.getLogger()
+  handlers, level = list(root.handlers), root.level
+  stream = io.StringIO()
+
+  # The records written so far; stopping the listener waits until the queue
+  # is written.
+  def written():
+    logs._listener.stop()
+    logs._listener = None
+    lines = stream.getvalue().splitlines()
+    return [json.loads(line) for line in lines]
+
+  def setup(level="DEBUG", sample=None):
+    setup_logging(level, sample, "json", stream)
+    return written
+
+  yield setup
+  if logs._listener is not None:
+    logs._listener.stop()
+    logs._listener = None
+  for handler in list(root.handlers):
+    root.removeHandler(handler)
+  for handler in handlers:
+    root.addHandler(handler)
+  root.setLevel(level)
+
+
+def record(operation=None):
+  extra = {} if operation is None else {"operation" : operation}
+  return logging.makeLogRecord(extra)
+
+
+def test_parse_sample():
+  assert parse_sample("step=0.01, reset=0.1") == {"step" : 0.01,
+      "reset" : 0.1}
+  assert parse_sample(None) == {}
+  with pytest.raises(ValueError):
+    parse_sample("step")
+
+
+def test_request_operation():
+  assert request_operation({"step" : {"action" : 1}}) == "step"
+  assert request_operation({"env" : {"name" : "Pixel-v0"}}) == "create"
+  assert request_operation({"env" : {"action" : "reset"}, "id" : 1}) == "reset"
+  assert request_operation({"id" : 1, "server" : {"delta" : 1}}) == "server"
+  assert request_operation({"id" : 1}) is None
+
+
+def test_sampler():
+  sampler = Sampler({"step" : 0.25, "reset" : 0})
+  kept = [sampler.filter(record("step")) for _ in range(8)]
+  # Every 4th step is kept, starting with the first one.
+  assert kept == [True, False, False, False] * 2
+  assert not sampler.filter(record("reset"))
+  assert sampler.filter(record("create"))
+  assert sampler.filter(record())
+
+
+def test_json_records(records):
+  written = records()
+  logger = logging.getLogger("gym_tcp_api.test")
+  logger.info("accepting connections", extra={"port" : 4040})
+  try:
+    raise RuntimeError("failed")
+  except RuntimeError:
+    logger.exception("server process failed")
+
+  first, second = written()
+  assert first["message"] == "accepting connections"
+  assert first["level"] == "INFO"
+  assert first["logger"] == "gym_tcp_api.test"
+  assert first["port"] == 4040
+  assert "RuntimeError: failed" in second["exception"]
+
+
+def test_sampled_requests(records, session):
+  written = records(sample="step=0.1")
+  s = session()
+  create(s)
+  send(s, {"env" : {"action" : "reset"}})
+  for _ in range(20):
+    send(s, {"step" : {"action" : 1}})
+
+  requests = [entry for entry in written() if entry["message"] == "request"]
+  operations = [entry["operation"] for entry in requests]
+  assert operations == ["create", "reset", "step", "step"]
+  assert requests[-1]["instance"] == s.instance_id
+  assert json.loads(requests[-1]["request"]) == {"step" : {"action" : 1}}
+
+
+def test_level(records, session):
+  written = records(level="INFO")
+  s = session()
+  create(s)
+  # The requests are logged at the debug level only.
+  assert written() == []
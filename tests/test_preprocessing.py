@@ -0,0 +1,131 @@
+"""
+  @file test_preprocessing.py
+
+  Tests of the preprocessing wrappers and of the preprocessing chains of an
+  environment request.
+"""
+
+import gym
+import numpy as np
+import pytest
+from gym import spaces
+
+from conftest import load, send
+from preprocessing import create_preprocessing
+
+
+"""
+  A 6x4 RGB image, the value of each pixel is 40 times its row plus 10 times
+  the number of steps, in the red channel only.
+"""
+class ColorEnv(gym.Env):
+  def __init__(self):
+    self.observation_space = spaces.Box(0, 255, (6, 4, 3), np.uint8)
+    self.action_space = spaces.Discrete(2)
+    self.steps = 0
+
+  def image(self):
+    image = np.zeros((6, 4, 3), np.uint8)
+    image[..., 0] = 40 * np.arange(6)[:, None] + 10 * self.steps
+    return image
+
+  def reset(self):
+    self.steps = 0
+    return self.image()
+
+  def step(self, action):
+    self.steps += 1
+    return self.image(), 1.0, self.steps >= 5, {}
+
+
+gym.envs.registration.register(id="Color-v0", entry_point=ColorEnv)
+
+
+def wrap(steps):
+  return create_preprocessing(steps)(gym.make("Color-v0"))
+
+
+def test_grayscale():
+  env = wrap(["grayscale"])
+  observation = env.reset()
+  assert observation.shape == (6, 4)
+  assert env.observation_space.shape == (6, 4)
+  assert observation.dtype == np.uint8
+  # The rounded luma of the red channel.
+  assert observation[:, 0].tolist() == [0, 12, 24, 36, 48, 60]
+
+
+def test_resize():
+  env = wrap([{"name" : "resize", "shape" : [3, 2]}])
+  observation = env.reset()
+  assert observation.shape == (3, 2, 3)
+  assert env.observation_space.shape == (3, 2, 3)
+  # Nearest neighbour, every second row.
+  assert observation[:, 0, 0].tolist() == [0, 80, 160]
+
+
+def test_cast():
+  env = wrap(["grayscale", {"name" : "cast", "dtype" : "float32"}])
+  observation = env.reset()
+  assert observation.dtype == np.float32
+  assert env.observation_space.dtype == np.float32
+
+
+@pytest.mark.parametrize("steps, shape", [
+    (["grayscale"], (6, 4, 4)),
+    ([], (6, 4, 12)),
+])
+def test_frame_stack(steps, shape):
+  env = wrap(steps + [{"name" : "stack", "num" : 4}])
+  assert env.observation_space.shape == shape
+
+  # The reset fills the stack with the first observation.
+  observation = env.reset()
+  assert observation.shape == shape
+  first = observation[..., :shape[2] // 4]
+  assert (observation == np.concatenate([first] * 4, axis=-1)).all()
+
+  # The newest observation is the last one.
+  observation = env.step(0)[0]
+  assert (observation[..., :-shape[2] // 4] == np.concatenate([first] * 3,
+      axis=-1)).all()
+  assert (observation[..., -shape[2] // 4:] != first).any()
+
+
+@pytest.mark.parametrize("steps", [
+    ["crop"],
+    [{"name" : "resize"}],
+    [{"name" : "resize", "shape" : [3]}],
+    [{"name" : "resize", "shape" : [0, 2]}],
+    [{"name" : "cast", "dtype" : "foo"}],
+    [{"name" : "cast", "dtype" : "str"}],
+    [{"name" : "stack", "num" : 0}],
+    [{"name" : "stack", "num" : "x"}],
+    "grayscale",
+])
+def test_rejected_chain(steps):
+  with pytest.raises(ValueError):
+    create_preprocessing(steps)
+
+
+@pytest.mark.parametrize("name, steps", [
+    ("CartPole-v1", ["grayscale"]),
+    ("CartPole-v1", [{"name" : "resize", "shape" : [2, 2]}]),
+    ("Color-v0", [{"name" : "cast", "dtype" : "foo"}]),
+])
+@pytest.mark.parametrize("num", [None, 2])
+def test_rejected_chain_response(session, name, steps, num):
+  s = session()
+  message = {"env" : {"name" : name, "preprocess" : steps}}
+  if num:
+    message["env"]["num"] = num
+  response = load(send(s, message))
+  assert response["error"] == "invalid"
+  assert s.instance_id is None
+
+  # The session can create another environment.
+  response = load(send(s, {"env" : {"name" : "Color-v0", "preprocess" : [
+      "grayscale"]}}))
+  assert "instance" in response
+  response = load(send(s, {"env" : {"action" : "reset"}}))
+  assert np.array(response["observation"]).shape == (6, 4)
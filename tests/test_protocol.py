@@ -0,0 +1,36 @@
+"""
+  @file test_protocol.py
+
+  Tests of the request handling shared by python/server.py and the Elixir
+  worker, through Session.handle with the bytes a client sends.
+"""
+
+import gym
+
+from conftest import create, load, send
+from environments import registry
+
+
+def test_create_reset_step(session):
+  s = session()
+  create(s)
+  reference = gym.make("Pixel-v0")
+
+  response = load(send(s, {"env" : {"action" : "reset"}}))
+  assert response["observation"] == reference.reset().tolist()
+
+  response = load(send(s, {"step" : {"action" : 1}, "id" : 7}))
+  observation, reward, done, _ = reference.step(1)
+  assert response["observation"] == observation.tolist()
+  assert response["reward"] == reward
+  assert response["done"] == done
+  assert response["info"] == {}
+  assert response["id"] == 7
+
+
+def test_empty_request_ends_session(session):
+  s = session()
+  create(s)
+  instance = s.instance_id
+  assert s.handle(b"") == b"error\r\n\r\n"
+  assert instance not in registry.envs
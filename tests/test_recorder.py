@@ -0,0 +1,134 @@
+"""
+  @file test_recorder.py
+
+  Tests of the trajectory recording on the server: the shards, the episode
+  boundaries and the error responses of a directory which can't be written.
+"""
+
+import os
+
+import numpy as np
+import pytest
+
+import recorder
+from conftest import create, load, send
+from recorder import ShardWriter, TrajectoryRecorder
+
+
+@pytest.fixture
+def directory(tmp_path, monkeypatch):
+  monkeypatch.setattr(recorder.shard_writer, "directory", str(tmp_path))
+  return tmp_path
+
+
+def load_shard(path):
+  return [np.load(os.path.join(path, field + ".npy"))
+      for field in recorder.FIELDS]
+
+
+def test_default_directory():
+  assert ShardWriter().directory == recorder.DIRECTORY
+  assert recorder.DIRECTORY.startswith(recorder.tempfile.gettempdir())
+
+
+def test_shards(tmp_path):
+  writer = ShardWriter(str(tmp_path), 3)
+  trajectory = TrajectoryRecorder("a", writer=writer)
+  for step in range(7):
+    trajectory.append(np.full((2, 2), step, np.uint8), step % 2, 0.5,
+        step == 4)
+  info = trajectory.info(wait=True)
+
+  assert info["directory"] == str(tmp_path / "a" / "0")
+  assert [(shard["start"], shard["steps"]) for shard in info["shards"]] == [
+      (0, 3), (3, 3), (6, 1)]
+  assert info["episodes"] == [[0, 5]]
+  assert info["steps"] == 7 and info["pending"] == 0
+  assert info["failed"] == []
+
+  observations, actions, rewards, dones = load_shard(info["shards"][1]["path"])
+  assert observations.shape == (3, 2, 2) and observations.dtype == np.uint8
+  assert observations[:, 0, 0].tolist() == [3, 4, 5]
+  assert actions.tolist() == [1, 0, 1]
+  assert rewards.tolist() == [0.5] * 3
+  assert dones.tolist() == [False, True, False]
+
+  # Each recording of the instance gets its own directory.
+  assert TrajectoryRecorder("a", writer=writer).directory == str(
+      tmp_path / "a" / "1")
+
+
+def test_record_trajectory(session, directory):
+  s = session()
+  create(s)
+  send(s, {"env" : {"action" : "reset"}})
+  response = load(send(s, {"record_trajectory" : {"action" : "start",
+      "shard_size" : 4}, "id" : 1}))
+  assert response["id"] == 1
+  assert response["trajectory"]["steps"] == 0
+  for _ in range(6):
+    send(s, {"step" : {"action" : 1}})
+  send(s, {"env" : {"action" : "reset"}})
+  send(s, {"step" : {"action" : 0}})
+
+  info = load(send(s, {"record_trajectory" : {"action" : "stop"}}))[
+      "trajectory"]
+  assert info["steps"] == 7
+  assert info["episodes"] == [[0, 6], [6, 7]]
+  assert [shard["steps"] for shard in info["shards"]] == [4, 3]
+  assert info["directory"].startswith(str(directory / s.instance_id))
+
+  # The observation of a transition is the one the action was taken in.
+  observations, actions, _, _ = load_shard(info["shards"][1]["path"])
+  assert not observations[2].any()
+  assert observations[0].reshape(-1)[:4].tolist() == [2] * 4
+  assert actions.tolist() == [1, 1, 0]
+
+  assert load(send(s, {"record_trajectory" : {"action" : "status"}})) == {
+      "trajectory" : None}
+
+
+def test_invalid_shard_size(session, directory):
+  s = session()
+  create(s)
+  for shard_size in (0, "10", 1.5):
+    response = load(send(s, {"record_trajectory" : {"action" : "start",
+        "shard_size" : shard_size}}))
+    assert response["error"] == "invalid"
+  assert os.listdir(str(directory)) == []
+
+
+def test_unwritable_directory(session, tmp_path, monkeypatch):
+  # A directory below a file can't be created, even by root.
+  (tmp_path / "file").write_bytes(b"")
+  monkeypatch.setattr(recorder.shard_writer, "directory",
+      str(tmp_path / "file" / "trajectories"))
+  s = session()
+  create(s)
+  response = load(send(s, {"record_trajectory" : {"action" : "start"},
+      "id" : 2}))
+  assert response["error"] == "invalid"
+  assert response["message"].startswith("Recording failed")
+  assert response["id"] == 2
+
+  # The connection stays usable.
+  assert "observation" in load(send(s, {"env" : {"action" : "reset"}}))
+
+
+def test_failed_shard(session, directory):
+  s = session()
+  create(s)
+  send(s, {"env" : {"action" : "reset"}})
+  info = load(send(s, {"record_trajectory" : {"action" : "start"}}))[
+      "trajectory"]
+  # The temporary directory of the shard can't be replaced.
+  with open(os.path.join(info["directory"], "00000.part"), "wb"):
+    pass
+  send(s, {"step" : {"action" : 1}})
+
+  response = load(send(s, {"record_trajectory" : {"action" : "stop"}}))
+  assert response["error"] == "invalid"
+  assert response["message"].startswith("Recording failed")
+  failed = response["trajectory"]["failed"]
+  assert [(shard["start"], shard["steps"]) for shard in failed] == [(0, 1)]
+  assert response["trajectory"]["shards"] == []
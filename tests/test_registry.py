@@ -0,0 +1,132 @@
+"""
+  @file test_registry.py
+
+  Tests of the instance registry: the idle expiry, the instance and memory
+  limits and the responses of evicted instances.
+"""
+
+import threading
+import time
+
+import gym
+
+import environments
+from conftest import create, load, send
+from environments import EnvPool, Envs, InstanceRegistry, registry
+
+
+"""
+  The instances of a connection, as seen by the registry.
+"""
+class FakeEnvs(object):
+  def __init__(self, instances):
+    self.instances = instances
+    self.lock = threading.RLock()
+    self.evicted = []
+
+  def evict(self, instance_id):
+    self.evicted.append(instance_id)
+    self.instances.remove(instance_id)
+
+
+# A registry with instances of the given memory, from the least to the most
+# recently used one.
+def fake_registry(memory, max_rss=0, max_instances=0):
+  instances = InstanceRegistry(0, max_instances, max_rss)
+  envs = FakeEnvs(instances)
+  for index, size in enumerate(memory):
+    instances.add(str(index), envs, size)
+    instances.last_used[str(index)] = index
+  return instances, envs
+
+
+def test_eviction(session):
+  registry.configure(0, 1, 0)
+  first, second = session(), session()
+  evicted = create(first)
+  create(second)
+  assert evicted not in registry.envs
+
+  response = load(send(first, {"step" : {"action" : 0}, "id" : 1}))
+  assert response["error"] == "evicted"
+  assert response["instance"] == evicted
+  assert response["id"] == 1
+  response = load(send(first, {"env" : {"action" : "reset"}}))
+  assert response["error"] == "evicted"
+
+  # The client creates a new instance.
+  create(first)
+  assert "observation" in load(send(first, {"env" : {"action" : "reset"}}))
+
+
+def test_limit_in_use(session):
+  busy = [session(), session()]
+  second = session()
+  for s in busy + [second]:
+    create(s)
+  registry.configure(0, 2, 0)
+
+  # An instance in use by a request of another thread is never closed.
+  locked, done = threading.Event(), threading.Event()
+
+  def request():
+    with busy[0].envs.lock, busy[1].envs.lock:
+      locked.set()
+      done.wait(10)
+
+  thread = threading.Thread(target=request)
+  thread.start()
+  locked.wait(10)
+  try:
+    response = load(send(second, {"env" : {"name" : "Pixel-v0"}, "id" : 2}))
+    assert response["error"] == "limit"
+    assert "limit of 2 instances" in response["message"]
+    assert response["id"] == 2
+    # The previous instance of the connection was closed.
+    assert second.instance_id is None
+  finally:
+    done.set()
+    thread.join()
+
+
+def test_idle_expiry():
+  instances, envs = fake_registry([0, 0, 0])
+  instances.ttl = 10
+  now = time.monotonic()
+  instances.last_used.update({"0" : now - 20, "1" : now - 11, "2" : now})
+  instances.expire()
+  assert envs.evicted == ["0", "1"]
+  assert list(instances.envs) == ["2"]
+
+
+def test_memory_limit_single_pass(monkeypatch):
+  # Closed instances don't return their memory, the RSS stays the same.
+  monkeypatch.setattr(environments, "process_rss", lambda: 1500)
+  instances, envs = fake_registry([0, 300, 300, 300], max_rss=1000)
+  instances.reserve()
+  # The instance without estimated memory is kept, the estimate of two
+  # instances covers the excess.
+  assert envs.evicted == ["1", "2"]
+
+
+def test_memory_limit_recomputed_rss(monkeypatch):
+  rss = iter([1500, 900])
+  monkeypatch.setattr(environments, "process_rss", lambda: next(rss))
+  instances, envs = fake_registry([100, 100, 100], max_rss=1000)
+  instances.reserve()
+  # The RSS is below the limit after the first instance.
+  assert envs.evicted == ["0"]
+
+
+def test_pooled_memory(session):
+  env_pool = EnvPool(size=1)
+  env_pool.release("Pixel-v0", gym.make("Pixel-v0"), 12345)
+  envs = Envs(env_pool)
+  instance_id = envs.create("Pixel-v0")
+  try:
+    # The reused environment is charged the memory of its construction.
+    assert registry.memory[instance_id] >= 12345
+    envs.env_close(instance_id)
+    assert env_pool.idle["Pixel-v0"][0][2] == 12345
+  finally:
+    envs.env_close_all()
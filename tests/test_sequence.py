@@ -0,0 +1,50 @@
+"""
+  @file test_sequence.py
+
+  Tests of the step requests with a sequence of actions or a repeated
+  action, which are stepped on the server.
+"""
+
+import gym
+
+from conftest import create, load, send
+
+
+def test_step_sequence(session):
+  s = session()
+  create(s)
+  reference = gym.make("Pixel-v0")
+  send(s, {"env" : {"action" : "reset"}})
+  reference.reset()
+
+  response = load(send(s, {"step" : {"actions" : [0, 1, 1],
+      "transitions" : 1}}))
+  assert response["reward"] == 3.0
+  assert len(response["transitions"]) == 3
+  for transition, action in zip(response["transitions"], [0, 1, 1]):
+    assert transition["observation"] == reference.step(action)[0].tolist()
+    assert transition["reward"] == 1.0
+  assert response["observation"] == response["transitions"][-1]["observation"]
+
+  # The sequence stops at the end of the episode.
+  response = load(send(s, {"step" : {"action" : 0, "repeat" : 30}}))
+  assert response["done"]
+  assert response["reward"] == 17.0
+
+
+def test_step_repeat(session):
+  s = session()
+  create(s)
+  reference = gym.make("Pixel-v0")
+  send(s, {"env" : {"action" : "reset"}})
+  reference.reset()
+
+  # Frame skip, only the last observation is sent.
+  response = load(send(s, {"step" : {"action" : 1, "repeat" : 4}, "id" : 5}))
+  for _ in range(4):
+    observation = reference.step(1)[0]
+  assert response["observation"] == observation.tolist()
+  assert response["reward"] == 4.0
+  assert not response["done"]
+  assert "transitions" not in response
+  assert response["id"] == 5
@@ -0,0 +1,137 @@
+"""
+  @file test_serialization.py
+
+  Tests of the JSON backends: the responses of both backends decode to the
+  same values, apart from the differences listed in serialization.py.
+"""
+
+import json
+
+import gym
+import numpy as np
+import pytest
+
+import serialization
+from conftest import create, load, load_frame, send
+
+
+# The numbers of the float32 observations, which are written with the digits
+# of the float64 value by both backends.
+def assert_float32_values(values):
+  values = np.asarray(values, np.float64)
+  assert (values.astype(np.float32).astype(np.float64) == values).all()
+
+
+requires_orjson = pytest.mark.skipif("orjson" not in serialization.BACKENDS,
+    reason="orjson is not installed")
+
+backends = [pytest.param("orjson", marks=requires_orjson), "stdlib"]
+
+
+# The responses of a session to the messages with the given backend.
+def responses(session, backend, name, messages):
+  serialization.use(backend)
+  s = session()
+  create(s, name)
+  return [send(s, message) for message in messages]
+
+
+@requires_orjson
+@pytest.mark.parametrize("name", ["CartPole-v1", "Pixel-v0"])
+@pytest.mark.parametrize("settings", [{}, {"delta" : 3}])
+def test_backends_decode_to_same_values(session, name, settings):
+  messages = [{"server" : settings}, {"env" : {"seed" : "1"}},
+      {"env" : {"action" : "reset"}},
+      {"env" : {"action" : "observationspace"}, "id" : 1},
+      {"env" : {"action" : "actionspace"}}]
+  messages += [{"step" : {"action" : step % 2}, "id" : step}
+      for step in range(6)]
+  messages.append({"step" : {"actions" : [0, 1], "transitions" : 1}})
+
+  stdlib = responses(session, "stdlib", name, messages)
+  native = responses(session, "orjson", name, messages)
+  for expected, data in zip(stdlib, native):
+    if not expected:
+      assert not data
+      continue
+    assert load(data) == load(expected)
+    assert b", " not in data
+
+
+@requires_orjson
+def test_binary_meta_decodes_to_same_values(session):
+  messages = [{"server" : {"encoding" : "binary"}},
+      {"env" : {"seed" : "1"}}, {"env" : {"action" : "reset"}},
+      {"step" : {"actions" : [0, 1], "transitions" : 1}, "id" : 2}]
+  stdlib = responses(session, "stdlib", "CartPole-v1", messages)[2:]
+  native = responses(session, "orjson", "CartPole-v1", messages)[2:]
+  for expected, data in zip(stdlib, native):
+    expected, data = load_frame(expected), load_frame(data)
+    assert data[:3] == expected[:3]
+    assert (data[3] == expected[3]).all()
+
+
+@requires_orjson
+def test_backend_differences():
+  value = {"exponent" : [1e16, 1.5e-7], "nan" : float("nan"),
+      "inf" : float("inf"), "info" : np.float32(0.1)}
+
+  serialization.use("stdlib")
+  assert serialization.dumps(value) == ('{"exponent": [1e+16, 1.5e-07], '
+      '"nan": NaN, "inf": Infinity, "info": 0.10000000149011612}')
+  serialization.use("orjson")
+  assert serialization.dumps(value) == ('{"exponent":[1e16,1.5e-7],'
+      '"nan":null,"inf":null,"info":0.1}')
+  serialization.use("stdlib")
+
+
+@pytest.mark.parametrize("backend", backends)
+def test_float32_observation_digits(backend):
+  serialization.use(backend)
+  observation = serialization.array(np.array([0.1, 1e20], np.float32))
+  values = json.loads(serialization.dumps({"observation" : observation}))
+  assert values["observation"] == np.array([0.1, 1e20], np.float32).tolist()
+  serialization.use("stdlib")
+
+
+@pytest.mark.parametrize("backend", backends)
+def test_float32_delta_keyframes(session, backend):
+  serialization.use(backend)
+  s = session()
+  create(s, "CartPole-v1")
+  send(s, {"server" : {"delta" : 30}})
+  send(s, {"env" : {"seed" : "1"}})
+
+  reference = gym.make("CartPole-v1")
+  reference.seed(1)
+  observation = reference.reset()
+  response = load(send(s, {"env" : {"action" : "reset"}}))
+  assert_float32_values(response["observation"])
+  assert response["observation"] == observation.tolist()
+
+  # Every value of CartPole changes, each step is a keyframe.
+  response = load(send(s, {"step" : {"action" : 1}}))
+  assert_float32_values(response["observation"])
+  assert response["observation"] == reference.step(1)[0].tolist()
+
+
+@pytest.mark.parametrize("backend", backends)
+@pytest.mark.parametrize("mode", ["binary", "delta"])
+def test_float32_transitions(session, backend, mode):
+  serialization.use(backend)
+  s = session()
+  create(s, "CartPole-v1")
+  if mode == "binary":
+    send(s, {"server" : {"encoding" : "binary"}})
+  else:
+    send(s, {"server" : {"delta" : 30}})
+  send(s, {"env" : {"action" : "reset"}})
+
+  data = send(s, {"step" : {"actions" : [0, 1], "transitions" : 1}})
+  if mode == "binary":
+    transitions = load_frame(data)[2]["transitions"]
+  else:
+    transitions = load(data)["transitions"]
+  assert len(transitions) == 2
+  for transition in transitions:
+    assert_float32_values(transition["observation"])
@@ -0,0 +1,276 @@
+"""
+  @file test_server.py
+
+  Tests of the connection handling of python/server.py, over a socket pair
+  or a local asyncio server, and of the supervisor of the server processes.
+"""
+
+import asyncio
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import server
+from environments import InvalidUsage, registry
+
+
+# A socket that returns the given chunks, one per recv_into.
+class ChunkedSocket(object):
+  def __init__(self, chunks):
+    self.chunks = list(chunks)
+
+  def recv_into(self, view):
+    if not self.chunks:
+      return 0
+    chunk = self.chunks.pop(0)
+    view[:len(chunk)] = chunk
+    return len(chunk)
+
+
+def test_recv_buffer_framing():
+  reader = server.RecvBuffer(ChunkedSocket([b'{"a" : 1}\r\n{"b"',
+      b' : 2}\r', b'\n{"c" : 3}\r\n\r\n', b'{"d"']))
+  assert reader.recv() == b'{"a" : 1}\r\n'
+  # The delimiter is split across two reads.
+  assert reader.recv() == b'{"b" : 2}\r\n'
+  assert reader.recv() == b'{"c" : 3}\r\n'
+  assert reader.recv() == b'\r\n'
+  # The connection is closed with a partial message.
+  assert reader.recv() == b""
+
+
+def test_recv_buffer_small_chunks():
+  message = b'{"step" : {"action" : 1}}\r\n'
+  connection, peer = socket.socketpair()
+  with connection, peer:
+    reader = server.RecvBuffer(connection, chunk_size=3)
+    peer.sendall(message * 2)
+    assert reader.recv() == message
+    assert reader.recv() == message
+    peer.close()
+    assert reader.recv() == b""
+
+
+def test_recv_buffer_limit():
+  reader = server.RecvBuffer(ChunkedSocket([b"x" * 6, b"x" * 6 + b"\r\n"]),
+      limit=10)
+  with pytest.raises(InvalidUsage) as error:
+    reader.recv()
+  assert error.value.status_code == 413
+
+
+def test_request_limit_closes_connection():
+  connection, peer = socket.socketpair()
+  client = threading.Thread(target=server.threaded_client, args=(connection,))
+  client.start()
+  with peer:
+    peer.sendall(b"x" * server.REQUEST_LIMIT)
+    client.join(10)
+    assert not client.is_alive()
+
+    data = b""
+    while True:
+      chunk = peer.recv(65536)
+      if not chunk:
+        break
+      data += chunk
+  assert data.endswith(b"\r\n\r\n")
+  assert json.loads(data)["error"] == "invalid"
+
+
+def test_threaded_client(session):
+  connection, peer = socket.socketpair()
+  client = threading.Thread(target=server.threaded_client, args=(connection,))
+  client.start()
+  with peer:
+    reader = server.RecvBuffer(peer)
+    peer.sendall(b'{"env" : {"name" : "Pixel-v0"}}\r\n'
+        b'{"env" : {"action" : "reset"}, "id" : 1}\r\n')
+    assert "instance" in json.loads(reader.recv())
+    reader.recv()
+    response = json.loads(reader.recv())
+    assert response["id"] == 1
+    assert len(response["observation"]) == 8
+  client.join(10)
+  assert not client.is_alive()
+
+
+# Send the data to async_client on an asyncio server with the given stream
+# limit and return the responses until the connection is closed.
+def asyncio_responses(data, limit=server.REQUEST_LIMIT, pipeline=4):
+  async def run():
+    executor = ThreadPoolExecutor(max_workers=2)
+    listener = await asyncio.start_server(
+        lambda reader, writer: server.async_client(reader, writer, executor,
+            pipeline), "127.0.0.1", 0, limit=limit)
+    port = listener.sockets[0].getsockname()[1]
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(data)
+    await writer.drain()
+    writer.write_eof()
+
+    responses = []
+    while True:
+      try:
+        responses.append(json.loads(await reader.readuntil(b"\r\n\r\n")))
+      except asyncio.IncompleteReadError:
+        break
+    writer.close()
+    listener.close()
+    await listener.wait_closed()
+    executor.shutdown()
+    return responses
+
+  return asyncio.run(asyncio.wait_for(run(), 10))
+
+
+def test_asyncio_pipelined_requests():
+  instances = set(registry.envs)
+  messages = [{"env" : {"name" : "Pixel-v0"}, "id" : 0},
+      {"env" : {"action" : "reset"}, "id" : 1}]
+  messages += [{"step" : {"action" : 1}, "id" : 2 + step} for step in range(5)]
+  responses = asyncio_responses(b"".join(json.dumps(message).encode() +
+      b"\r\n" for message in messages))
+
+  # The responses of the pipelined requests are sent in order.
+  assert [response["id"] for response in responses] == list(range(7))
+  assert responses[-1]["observation"][0][:5] == [2] * 5
+  # The instance is closed with the connection.
+  assert set(registry.envs) == instances
+
+
+def test_asyncio_request_limit():
+  responses = asyncio_responses(b'{"env" : {"name" : "Pixel-v0"}}\r\n' +
+      b"x" * 100 + b"\r\n" + b'{"env" : {"action" : "reset"}}\r\n',
+      limit=64)
+  assert "instance" in responses[0]
+  assert responses[1]["error"] == "invalid"
+  # The connection is closed after the error response.
+  assert len(responses) == 2
+
+
+SERVER = os.path.join(os.path.dirname(os.path.abspath(server.__file__)),
+    "server.py")
+
+
+def wait_until(condition, timeout=30):
+  deadline = time.monotonic() + timeout
+  while not condition():
+    assert time.monotonic() < deadline
+    time.sleep(0.05)
+
+
+# The pids of the server processes of the supervisor.
+def children(pid):
+  with open("/proc/{0}/task/{0}/children".format(pid)) as f:
+    return set(int(child) for child in f.read().split())
+
+
+"""
+  A client connection of the tests, the requests are sent one at a time.
+"""
+class Client(object):
+  def __init__(self, port):
+    self.connection = socket.create_connection(("127.0.0.1", port), 10)
+    self.reader = server.RecvBuffer(self.connection)
+
+  def request(self, message):
+    self.connection.sendall(json.dumps(message).encode() + b"\r\n")
+    response = self.reader.recv()
+    assert self.reader.recv() == b"\r\n"
+    return json.loads(response)
+
+  def close(self):
+    self.connection.close()
+
+
+def connect(port):
+  def ready():
+    try:
+      Client(port).close()
+      return True
+    except OSError:
+      return False
+
+  wait_until(ready)
+  return Client(port)
+
+
+@pytest.fixture
+def supervisor():
+  with socket.socket() as s:
+    s.bind(("127.0.0.1", 0))
+    port = s.getsockname()[1]
+
+  process = subprocess.Popen([sys.executable, SERVER, "--port", str(port),
+      "--workers", "2", "--drain-timeout", "10", "--log-level", "WARNING"],
+      stderr=subprocess.DEVNULL)
+  wait_until(lambda: len(children(process.pid)) == 2)
+  yield process, port
+  if process.poll() is None:
+    # The server processes drain and exit with the supervisor.
+    process.terminate()
+    try:
+      process.wait(15)
+    except subprocess.TimeoutExpired:
+      for pid in children(process.pid):
+        os.kill(pid, signal.SIGKILL)
+      process.kill()
+      process.wait()
+
+
+@pytest.mark.skipif(not hasattr(os, "fork") or
+    not hasattr(socket, "SO_REUSEPORT"), reason="requires fork and SO_REUSEPORT")
+def test_supervisor_restarts_processes(supervisor):
+  process, port = supervisor
+  client = connect(port)
+  assert "instance" in client.request({"env" : {"name" : "CartPole-v1"}})
+  client.close()
+
+  # A crashed process is replaced.
+  pids = children(process.pid)
+  crashed = pids.pop()
+  os.kill(crashed, signal.SIGKILL)
+  wait_until(lambda: len(children(process.pid) - pids - {crashed}) == 1)
+  assert crashed not in children(process.pid)
+
+  client = connect(port)
+  assert "instance" in client.request({"env" : {"name" : "CartPole-v1"}})
+  client.close()
+
+
+@pytest.mark.skipif(not hasattr(os, "fork") or
+    not hasattr(socket, "SO_REUSEPORT"), reason="requires fork and SO_REUSEPORT")
+def test_supervisor_reload_and_stop(supervisor):
+  process, port = supervisor
+  old = connect(port)
+  old.request({"env" : {"name" : "CartPole-v1"}})
+  old.request({"env" : {"action" : "reset"}})
+  pids = children(process.pid)
+
+  # SIGHUP starts new processes, the old ones serve their open connections.
+  process.send_signal(signal.SIGHUP)
+  wait_until(lambda: len(children(process.pid) - pids) == 2)
+  assert "observation" in old.request({"step" : {"action" : 1}})
+
+  client = connect(port)
+  assert "instance" in client.request({"env" : {"name" : "CartPole-v1"}})
+
+  # The old processes exit once their connections are closed.
+  old.close()
+  wait_until(lambda: not children(process.pid) & pids)
+  assert len(children(process.pid)) == 2
+
+  # SIGTERM drains the processes and stops the supervisor.
+  process.send_signal(signal.SIGTERM)
+  assert "observation" in client.request({"env" : {"action" : "reset"}})
+  client.close()
+  assert process.wait(30) == 0
@@ -0,0 +1,93 @@
+"""
+  @file test_shm.py
+
+  Tests of the shared memory transport: the layout of the slots and the
+  slot indices of the step responses.
+"""
+
+import gym
+import numpy as np
+import pytest
+
+import shm
+from conftest import create, load, send
+
+pytestmark = pytest.mark.skipif(shm.shared_memory is None,
+    reason="The shm transport requires Python >= 3.8")
+
+
+# The slots of the named shared memory block as the C++ client maps them, one
+# column-major rows x cols matrix per slot.
+def client_slots(name, slots, rows, cols):
+  memory = shm.shared_memory.SharedMemory(name=name)
+  values = np.ndarray((slots, cols, rows), np.float64, memory.buf).copy()
+  memory.close()
+  return values.transpose(0, 2, 1)
+
+
+def test_ring_layout():
+  ring = shm.SharedMemoryRing((3, 4, 2), slots=2)
+  try:
+    assert (ring.rows, ring.cols) == (12, 2)
+    observation = np.arange(24).reshape(3, 4, 2)
+    assert ring.write(observation) == 0
+
+    # Each channel is a column-major image in a column of the matrix.
+    matrix = client_slots(ring.name, 2, 12, 2)[0]
+    for channel in range(2):
+      assert (matrix[:, channel] ==
+          observation[:, :, channel].reshape(-1, order="F")).all()
+  finally:
+    ring.close()
+
+
+def test_ring_batch_layout():
+  ring = shm.SharedMemoryRing((3, 2, 2), batch=True, slots=1)
+  try:
+    assert (ring.rows, ring.cols) == (4, 3)
+    observation = np.arange(12).reshape(3, 2, 2)
+    ring.write(observation)
+
+    # One flattened observation per column.
+    matrix = client_slots(ring.name, 1, 4, 3)[0]
+    for env in range(3):
+      assert (matrix[:, env] == observation[env].reshape(-1)).all()
+  finally:
+    ring.close()
+
+
+def test_ring_slots():
+  ring = shm.SharedMemoryRing((2,), slots=3)
+  try:
+    assert [ring.write(np.full(2, i)) for i in range(5)] == [0, 1, 2, 0, 1]
+    slots = client_slots(ring.name, 3, 2, 1)
+    assert slots[:, 0, 0].tolist() == [3, 4, 2]
+  finally:
+    ring.close()
+
+
+def test_shm_transport(session):
+  s = session()
+  create(s)
+  reference = gym.make("Pixel-v0")
+  reference.reset()
+  response = load(send(s, {"server" : {"transport" : "shm", "slots" : 2},
+      "id" : 1}))
+  assert response["slots"] == 2
+  assert (response["rows"], response["cols"]) == (8, 8)
+  assert response["id"] == 1
+  name = response["shm"]
+
+  assert load(send(s, {"env" : {"action" : "reset"}}))["slot"] == 0
+  for step in range(3):
+    response = load(send(s, {"step" : {"action" : 1}}))
+    assert response["slot"] == (step + 1) % 2
+    assert response["reward"] == 1.0 and not response["done"]
+    # A 2-D observation is the matrix.
+    observation = client_slots(name, 2, 8, 8)[response["slot"]]
+    assert (observation == reference.step(1)[0]).all()
+
+  # The block is removed with the tcp transport.
+  assert send(s, {"server" : {"transport" : "tcp"}}) == b""
+  with pytest.raises(FileNotFoundError):
+    shm.shared_memory.SharedMemory(name=name)
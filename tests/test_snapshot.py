@@ -0,0 +1,133 @@
+"""
+  @file test_snapshot.py
+
+  Tests of the snapshot and restore requests and of the resumption of a
+  session.
+"""
+
+import time
+
+from conftest import create, load, send
+from environments import Envs, registry
+from protocol import sessions
+
+
+def test_snapshot_restore(session):
+  s = session()
+  create(s, "CartPole-v1")
+  send(s, {"env" : {"seed" : "3"}})
+  send(s, {"env" : {"action" : "reset"}})
+  send(s, {"step" : {"actions" : [0, 1, 0]}})
+
+  snapshot = load(send(s, {"env" : {"action" : "snapshot"}}))["snapshot"]
+  before = load(send(s, {"step" : {"actions" : [1, 1, 0, 1]}}))
+
+  restored = load(send(s, {"env" : {"restore" : snapshot}}))
+  after = load(send(s, {"step" : {"actions" : [1, 1, 0, 1]}}))
+  assert after == before
+  assert restored["observation"] != after["observation"]
+
+  # A snapshot can be restored several times.
+  assert load(send(s, {"env" : {"restore" : snapshot}})) == restored
+
+
+def test_restore_unknown_snapshot(session):
+  s = session()
+  create(s)
+  send(s, {"env" : {"action" : "reset"}})
+
+  response = load(send(s, {"env" : {"restore" : 99}, "id" : 4}))
+  assert response == {"error" : "unknown_snapshot", "snapshot" : 99,
+                      "message" : "Snapshot 99 unknown", "id" : 4}
+
+  # The connection is still usable.
+  assert load(send(s, {"step" : {"action" : 1}}))["reward"] == 1.0
+
+
+def test_restore_dropped_snapshot(session, monkeypatch):
+  monkeypatch.setattr(Envs, "snapshot_limit", 2)
+  s = session()
+  create(s)
+  send(s, {"env" : {"action" : "reset"}})
+
+  snapshots = []
+  for _ in range(3):
+    send(s, {"step" : {"action" : 1}})
+    snapshots.append(load(send(s, {"env" : {"action" : "snapshot"}}))[
+        "snapshot"])
+
+  # The least recently used snapshot is dropped.
+  response = load(send(s, {"env" : {"restore" : snapshots[0]}}))
+  assert response["error"] == "unknown_snapshot"
+  for snapshot in snapshots[1:]:
+    assert "observation" in load(send(s, {"env" : {"restore" : snapshot}}))
+
+
+def test_snapshot_unpicklable_state(session):
+  s = session()
+  create(s, "CartPole-v1")
+  send(s, {"env" : {"action" : "reset"}})
+  # E.g. the world of a Box2D simulation, restoring the rest of the state
+  # would desync the environment.
+  s.envs.envs[s.instance_id].unwrapped.world = lambda: None
+  response = load(send(s, {"env" : {"action" : "snapshot"}}))
+  assert response["error"] == "invalid"
+  assert "'world'" in response["message"]
+
+  # Attributes of a renderer are left out.
+  del s.envs.envs[s.instance_id].unwrapped.world
+  s.envs.envs[s.instance_id].unwrapped.viewer = lambda: None
+  assert isinstance(load(send(s, {"env" : {"action" : "snapshot"}}))[
+      "snapshot"], int)
+
+
+def test_snapshot_batched_instance(session):
+  s = session()
+  load(send(s, {"env" : {"name" : "CartPole-v1", "num" : 2}}))
+  response = load(send(s, {"env" : {"action" : "snapshot"}}))
+  assert response["error"] == "invalid"
+
+
+def test_resume(session):
+  s = session()
+  create(s)
+  send(s, {"env" : {"action" : "reset"}})
+  send(s, {"step" : {"action" : 1, "repeat" : 2}})
+  token = load(send(s, {"session" : {"action" : "token"}}))["token"]
+  instance = s.instance_id
+  s.handle(b"")
+  assert instance in registry.envs
+
+  other = session()
+  response = load(send(other, {"session" : {"resume" : token}}))
+  assert response["instance"] == instance
+  response = load(send(other, {"step" : {"action" : 1}}))
+  assert response["observation"][0][:3] == [2, 2, 2]
+
+  # A token can be resumed only once.
+  response = load(send(session(), {"session" : {"resume" : token}}))
+  assert response["instance"] is None
+
+
+def test_resume_timeout(session, monkeypatch):
+  monkeypatch.setattr(sessions, "timeout", 0.01)
+  s = session()
+  create(s)
+  token = load(send(s, {"session" : {"action" : "token"}}))["token"]
+  instance = s.instance_id
+  s.handle(b"")
+  time.sleep(0.05)
+
+  response = load(send(session(), {"session" : {"resume" : token}}))
+  assert response["instance"] is None
+  assert instance not in registry.envs
+
+
+def test_resume_unsupported(session, monkeypatch):
+  # E.g. the Elixir workers, a reconnecting client may reach another worker.
+  monkeypatch.setattr(sessions, "timeout", 0)
+  s = session()
+  create(s)
+  for request in ({"action" : "token"}, {"resume" : "0" * 32}):
+    response = load(send(s, {"session" : request}))
+    assert response["error"] == "unsupported"
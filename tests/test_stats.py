@@ -0,0 +1,143 @@
+"""
+  @file test_stats.py
+
+  Tests of the request phase timers, the stats request and the Prometheus
+  endpoint.
+"""
+
+import urllib.error
+import urllib.request
+
+import pytest
+
+import server
+from conftest import create, load, send
+from stats import BUCKETS, Histogram, Stats, stats
+
+
+@pytest.fixture
+def timers():
+  stats.reset()
+  stats.enabled = True
+  yield stats
+  stats.enabled = False
+  stats.checkout = None
+  stats.reset()
+
+
+def test_histogram_buckets():
+  histogram = Histogram()
+  for value in (0.00001, 0.001, 0.0011, 10.0):
+    histogram.observe(value)
+
+  # The upper bounds are inclusive.
+  counts = dict(zip(BUCKETS, histogram.counts))
+  assert counts[0.00005] == 1
+  assert counts[0.001] == 1
+  assert counts[0.0025] == 1
+  assert counts[float("inf")] == 1
+  assert histogram.count == 4
+  assert histogram.sum == pytest.approx(10.00211)
+
+
+def test_disabled_timers(session):
+  assert Stats().trace() is None
+  s = session()
+  create(s)
+  s.process(b'{"env" : {"action" : "reset"}}')
+  assert stats.snapshot() == []
+
+
+def test_request_phases(session, timers):
+  s = session()
+  create(s)
+  s.process(b'{"env" : {"action" : "reset"}}')
+  sent = []
+  for _ in range(3):
+    s.process(b'{"step" : {"action" : 1}}', sent.append)
+  assert len(sent) == 3
+
+  phases = dict((entry["phase"], entry) for entry in timers.snapshot()
+      if entry["operation"] == "step")
+  assert set(phases) == {"parse", "env", "jsonable", "encode", "send"}
+  for entry in phases.values():
+    assert entry["env"] == "Pixel-v0"
+    assert entry["count"] == 3
+    assert sum(count for _, count in entry["buckets"]) == 3
+    assert entry["buckets"][-1][0] == "+Inf"
+
+
+def test_inline_timing(session):
+  s = session()
+  create(s)
+  send(s, {"env" : {"action" : "reset"}})
+  response = load(send(s, {"step" : {"action" : 1}, "trace" : 1}))
+  assert set(response["timing"]) == {"parse", "env", "jsonable"}
+  assert all(value >= 0 for value in response["timing"].values())
+  # The timing of a single request isn't recorded.
+  assert stats.snapshot() == []
+
+
+def test_stats_request(session, timers):
+  s = session()
+  create(s)
+  send(s, {"env" : {"action" : "reset"}})
+  s.process(b'{"step" : {"action" : 1}}')
+
+  response = load(send(s, {"server" : {"stats" : "json"}, "id" : 2}))
+  assert response["id"] == 2
+  assert any(entry["operation"] == "step" for entry in response["stats"])
+  assert response["instances"]["instances"] >= 1
+  assert "checkout" not in response
+
+
+def test_prometheus(session, timers):
+  s = session()
+  create(s)
+  s.process(b'{"env" : {"action" : "reset"}}')
+  s.process(b'{"step" : {"action" : 1}}')
+  s.process(b'{"step" : {"action" : 1}}')
+  timers.set_checkout(4, 3000, 1, [2, 2, 0, 0, 0, 0], 1, 2)
+
+  text = load(send(s, {"server" : {"stats" : "prometheus"}}))["prometheus"]
+  lines = text.splitlines()
+  labels = 'env="Pixel-v0",operation="step",phase="env"'
+  # The buckets are cumulative.
+  assert ('gym_request_phase_seconds_bucket{%s,le="+Inf"} 2' % labels
+      in lines)
+  assert 'gym_request_phase_seconds_count{%s} 2' % labels in lines
+  assert 'gym_checkout_wait_seconds_bucket{le="0.01"} 4' in lines
+  assert "gym_checkout_wait_seconds_sum 0.003" in lines
+  assert "gym_checkout_rejected_total 1" in lines
+  assert "gym_interpreters 2" in lines
+
+  stats_response = load(send(s, {"server" : {"stats" : "json"}}))
+  assert stats_response["checkout"]["wait"] == 0.003
+
+
+def test_prometheus_label_escaping(timers):
+  trace = timers.trace()
+  trace.operation = "step"
+  trace.env_id = 'a"b\\c'
+  trace.mark("env")
+  timers.record(trace)
+  assert 'env="a\\"b\\\\c"' in timers.prometheus()
+
+
+def test_metrics_endpoint(session, timers):
+  s = session()
+  create(s)
+  s.process(b'{"env" : {"action" : "reset"}}')
+
+  metrics = server.serve_metrics("127.0.0.1", 0)
+  try:
+    url = "http://127.0.0.1:{}".format(metrics.server_address[1])
+    with urllib.request.urlopen(url + "/metrics", timeout=10) as response:
+      assert response.headers["Content-Type"].startswith("text/plain")
+      text = response.read().decode()
+    assert 'operation="reset"' in text
+    with pytest.raises(urllib.error.HTTPError):
+      urllib.request.urlopen(url + "/other", timeout=10)
+  finally:
+    metrics.shutdown()
+    metrics.server_close()
@@ -0,0 +1,84 @@
+"""
+  @file test_vector.py
+
+  Tests of the batched instances, which step a batch of copies of an
+  environment with one action per copy.
+"""
+
+import numpy as np
+
+from conftest import load, load_frame, send
+
+
+def create_batch(session, num=3):
+  s = session()
+  assert "instance" in load(send(s, {"env" : {"name" : "Pixel-v0",
+      "num" : num}}))
+  return s
+
+
+def test_batch_step(session):
+  s = create_batch(session)
+  response = load(send(s, {"env" : {"action" : "reset"}}))
+  assert np.array(response["observation"]).shape == (3, 8, 8)
+
+  response = load(send(s, {"step" : {"action" : [0, 1, 0]}, "id" : 2}))
+  observation = np.array(response["observation"])
+  assert observation.shape == (3, 8, 8)
+  assert observation[:, 0, 0].tolist() == [1, 2, 1]
+  assert response["reward"] == [1.0] * 3
+  assert response["done"] == [False] * 3
+  assert response["info"] == [{}] * 3
+  assert response["id"] == 2
+
+
+def test_batch_autoreset(session):
+  s = create_batch(session)
+  send(s, {"env" : {"action" : "reset"}})
+  for _ in range(19):
+    send(s, {"step" : {"action" : [1, 1, 1]}})
+
+  # The copies are reset at the end of the episode, the info holds the
+  # last observation.
+  response = load(send(s, {"step" : {"action" : [1, 1, 1]}}))
+  assert response["done"] == [True] * 3
+  assert not np.array(response["observation"]).any()
+  terminal = np.array(response["info"][0]["terminal_observation"])
+  assert (terminal.reshape(-1)[:20] == 2).all()
+
+
+def test_batch_binary(session):
+  s = create_batch(session)
+  send(s, {"server" : {"encoding" : "binary"}})
+  send(s, {"env" : {"action" : "reset"}})
+
+  # The rewards and done flags are sent as meta data.
+  flags, reward, meta, observation = load_frame(send(s, {"step" : {
+      "action" : [0, 1, 1]}}))
+  assert flags == 0 and reward == 0.0
+  assert meta == {"info" : [{}] * 3, "reward" : [1.0] * 3,
+      "done" : [False] * 3}
+  assert observation.shape == (3, 8, 8)
+  assert observation[:, 0, 0].tolist() == [1, 2, 2]
+
+
+def test_batch_delta(session):
+  s = create_batch(session)
+  send(s, {"server" : {"delta" : 30}})
+  response = load(send(s, {"env" : {"action" : "reset"}}))
+  observation = np.array(response["observation"], np.uint8)
+
+  # The indices of a batch refer to one flattened observation per column of
+  # the client, the element order of the C order batch.
+  for step in range(3):
+    response = load(send(s, {"step" : {"action" : [0, 1, 0]}}))
+    delta = response["delta"]
+    observation.reshape(-1)[delta["index"]] = delta["value"]
+  assert observation[:, 0, :3].tolist() == [[1] * 3, [2] * 3, [1] * 3]
+
+
+def test_batch_action_sequence(session):
+  s = create_batch(session)
+  send(s, {"env" : {"action" : "reset"}})
+  response = load(send(s, {"step" : {"actions" : [[0, 1, 0], [1, 1, 1]]}}))
+  assert response["error"] == "invalid"